@@ -21,13 +21,19 @@ from .. import mlog
 import json
 import subprocess
 from ..mesonlib import MachineChoice, MesonException, OrderedSet
-from ..mesonlib import classify_unity_sources
+from ..mesonlib import classify_unity_sources, split_unity_sources
 from ..mesonlib import File
 from ..compilers import CompilerArgs, VisualStudioCCompiler
 from collections import OrderedDict
 import shlex
 from functools import lru_cache
 
+# The templates that can be used in the arguments of generator().
+# @EXTRA_ARGS@ is only replaced if it is a whole argument.
+generator_template_regex = re.compile(r'(@(?:INPUT|OUTPUT)[0-9]*@|@PLAINNAME@|@BASENAME@|@DEPFILE@|'
+                                      r'@SOURCE_DIR@|@BUILD_DIR@|@CURRENT_SOURCE_DIR@|'
+                                      r'@SOURCE_ROOT@|@BUILD_ROOT@|^@EXTRA_ARGS@\Z)')
+
 
 class CleanTrees:
     '''
@@ -84,7 +90,7 @@ class ExecutableSerialisation:
 
 class TestSerialisation:
     def __init__(self, name, project, suite, fname, is_cross_built, exe_wrapper, is_parallel,
-                 cmd_args, env, should_fail, timeout, workdir, extra_paths):
+                 cmd_args, env, should_fail, timeout, workdir, extra_paths, depends=None):
         self.name = name
         self.project_name = project
         self.suite = suite
@@ -100,6 +106,8 @@ class TestSerialisation:
         self.timeout = timeout
         self.workdir = workdir
         self.extra_paths = extra_paths
+        # Absolute paths of the built files the test uses, for the result cache
+        self.depends = depends if depends is not None else []
 
 class OptionProxy:
     def __init__(self, name, value):
@@ -257,19 +265,34 @@ class Backend:
         # target that the GeneratedList is used in
         return os.path.join(self.get_target_private_dir(target), src)
 
-    def get_unity_source_file(self, target, suffix):
+    def get_unity_source_file(self, target, suffix, batch=None):
         # There is a potential conflict here, but it is unlikely that
         # anyone both enables unity builds and has a file called foo-unity.cpp.
-        osrc = target.name + '-unity.' + suffix
+        if batch is None:
+            osrc = target.name + '-unity.' + suffix
+        else:
+            osrc = '{}-unity-{}.{}'.format(target.name, batch, suffix)
         return mesonlib.File.from_built_file(self.get_target_private_dir(target), osrc)
 
+    def get_unity_batches(self, target, srcs):
+        '''
+        Returns the (batch name, sources) pairs for the unity files of one
+        language of target, the batch name is None if all sources go into
+        a single unity file. srcs must be absolute paths as generated by
+        the backend, the batches depend on them.
+        '''
+        batch_size = self.get_option_for_target('unity_size', target)
+        if batch_size == 0:
+            return [(None, srcs)]
+        return split_unity_sources(srcs, batch_size)
+
     def generate_unity_files(self, target, unity_src):
         abs_files = []
         result = []
         compsrcs = classify_unity_sources(target.compilers.values(), unity_src)
 
-        def init_language_file(suffix):
-            unity_src = self.get_unity_source_file(target, suffix)
+        def init_language_file(suffix, batch):
+            unity_src = self.get_unity_source_file(target, suffix, batch)
             outfileabs = unity_src.absolute_path(self.environment.get_source_dir(),
                                                  self.environment.get_build_dir())
             outfileabs_tmp = outfileabs + '.tmp'
@@ -282,9 +305,10 @@ class Backend:
 
         # For each language, generate a unity source file and return the list
         for comp, srcs in compsrcs.items():
-            with init_language_file(comp.get_default_suffix()) as ofile:
-                for src in srcs:
-                    ofile.write('#include<%s>\n' % src)
+            for batch, batch_srcs in self.get_unity_batches(target, srcs):
+                with init_language_file(comp.get_default_suffix(), batch) as ofile:
+                    for src in batch_srcs:
+                        ofile.write('#include<%s>\n' % src)
         [mesonlib.replace_if_different(x, x + '.tmp') for x in abs_files]
         return result
 
@@ -366,13 +390,51 @@ class Backend:
             pickle.dump(es, f)
         return exe_data
 
+    def can_capture_directly(self, exe, cmd):
+        '''
+        Returns False if @exe needs an exe wrapper, mono, java or extra
+        paths which only meson_exe adds, so its output can't be captured
+        with the capture script
+        '''
+        if isinstance(exe, build.BuildTarget):
+            if exe.is_cross and self.environment.is_cross_build() and \
+                    self.environment.need_exe_wrapper():
+                return False
+            if mesonlib.is_windows() or mesonlib.is_cygwin():
+                if self.determine_windows_extra_paths(exe, []):
+                    return False
+        if cmd[0].endswith('.jar'):
+            return False
+        if cmd[0].endswith('.exe') and not (mesonlib.is_windows() or mesonlib.is_cygwin()):
+            return False
+        return True
+
+    def as_capture_cmdline(self, exe, cmd, capture):
+        '''
+        Returns a command line that runs @cmd and writes its stdout to
+        @capture without serializing the executable, or None if
+        can_capture_directly() is False
+        '''
+        if not self.can_capture_directly(exe, cmd):
+            return None
+        return self.environment.get_build_command() + \
+            ['--internal', 'capture', capture, '--'] + cmd
+
     def serialize_tests(self):
-        test_data = os.path.join(self.environment.get_scratch_dir(), 'meson_test_setup.dat')
+        scratch_dir = self.environment.get_scratch_dir()
+        test_data = os.path.join(scratch_dir, 'meson_test_setup.dat')
         with open(test_data, 'wb') as datafile:
-            self.write_test_file(datafile)
-        benchmark_data = os.path.join(self.environment.get_scratch_dir(), 'meson_benchmark_setup.dat')
+            index = self.write_test_file(datafile)
+        with open(os.path.join(scratch_dir, 'meson_test_index.json'), 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        benchmark_data = os.path.join(scratch_dir, 'meson_benchmark_setup.dat')
         with open(benchmark_data, 'wb') as datafile:
-            self.write_benchmark_file(datafile)
+            index = self.write_benchmark_file(datafile)
+        with open(os.path.join(scratch_dir, 'meson_benchmark_index.json'), 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        # meson test only needs the test setups, not all of build.dat
+        with open(os.path.join(scratch_dir, 'meson_test_setups.dat'), 'wb') as f:
+            pickle.dump((self.build.test_setups, self.build.test_setup_default_name), f)
         return test_data, benchmark_data
 
     def determine_linker_and_stdlib_args(self, target):
@@ -488,16 +550,20 @@ class Backend:
 
         targetdir = self.get_target_private_dir(extobj.target)
 
-        # With unity builds, there's just one object that contains all the
-        # sources, and we only support extracting all the objects in this mode,
-        # so just return that.
+        # With unity builds, there's just one object per unity file that
+        # contains all its sources, and we only support extracting all the
+        # objects in this mode, so just return those.
         if self.is_unity(extobj.target):
             compsrcs = classify_unity_sources(extobj.target.compilers.values(), sources)
             sources = []
-            for comp in compsrcs.keys():
-                osrc = self.get_unity_source_file(extobj.target,
-                                                  comp.get_default_suffix())
-                sources.append(osrc)
+            for comp, srcs in compsrcs.items():
+                # The same paths the unity sources were generated from
+                abs_srcs = [os.path.join(self.environment.get_build_dir(),
+                                         s.rel_to_builddir(self.build_to_src)) for s in srcs]
+                for batch, _ in self.get_unity_batches(extobj.target, abs_srcs):
+                    osrc = self.get_unity_source_file(extobj.target,
+                                                      comp.get_default_suffix(), batch)
+                    sources.append(osrc)
 
         for osrc in sources:
             objname = self.object_filename_from_source(extobj.target, osrc)
@@ -689,10 +755,10 @@ class Backend:
         return list(result)
 
     def write_benchmark_file(self, datafile):
-        self.write_test_serialisation(self.build.get_benchmarks(), datafile)
+        return self.write_test_serialisation(self.build.get_benchmarks(), datafile)
 
     def write_test_file(self, datafile):
-        self.write_test_serialisation(self.build.get_tests(), datafile)
+        return self.write_test_serialisation(self.build.get_tests(), datafile)
 
     def create_test_serialisation(self, tests):
         arr = []
@@ -723,6 +789,8 @@ class Backend:
             else:
                 extra_paths = []
             cmd_args = []
+            dep_targets = [exe] + list(t.depends)
+            dep_files = []
             for a in t.cmd_args:
                 if hasattr(a, 'held_object'):
                     a = a.held_object
@@ -731,20 +799,58 @@ class Backend:
                 if isinstance(a, mesonlib.File):
                     a = os.path.join(self.environment.get_build_dir(), a.rel_to_builddir(self.build_to_src))
                     cmd_args.append(a)
+                    dep_files.append(a)
                 elif isinstance(a, str):
                     cmd_args.append(a)
                 elif isinstance(a, build.Target):
                     cmd_args.append(self.construct_target_rel_path(a, t.workdir))
+                    dep_targets.append(a)
                 else:
                     raise MesonException('Bad object in test command.')
+            depends = self.get_test_depends(dep_targets) + dep_files
             ts = TestSerialisation(t.get_name(), t.project_name, t.suite, cmd, is_cross,
                                    exe_wrapper, t.is_parallel, cmd_args, t.env,
-                                   t.should_fail, t.timeout, t.workdir, extra_paths)
+                                   t.should_fail, t.timeout, t.workdir, extra_paths,
+                                   depends)
             arr.append(ts)
         return arr
 
+    def get_test_depends(self, targets):
+        '''
+        Returns the absolute paths of the outputs of @targets and of all the
+        libraries they link to, recursively. If none of these change, the
+        test can be assumed to give the same result.
+        '''
+        result = []
+        seen = set()
+        todo = list(targets)
+        while todo:
+            t = todo.pop()
+            if not isinstance(t, build.Target) or t in seen:
+                continue
+            seen.add(t)
+            if isinstance(t, build.BuildTarget):
+                todo += t.get_all_link_deps()
+            elif isinstance(t, build.CustomTarget):
+                todo += t.get_transitive_build_target_deps()
+            dirname = os.path.join(self.environment.get_build_dir(), self.get_target_dir(t))
+            result += [os.path.join(dirname, o) for o in t.get_outputs()]
+        return sorted(set(result))
+
     def write_test_serialisation(self, tests, datafile):
-        pickle.dump(self.create_test_serialisation(tests), datafile)
+        '''
+        Pickles each test separately into @datafile and returns an index of
+        their names, projects, suites and offsets in the file, so meson test
+        can select tests and only unpickle the ones it runs.
+        '''
+        index = []
+        for t in self.create_test_serialisation(tests):
+            index.append({'name': t.name,
+                          'project': t.project_name,
+                          'suite': t.suite,
+                          'offset': datafile.tell()})
+            pickle.dump(t, datafile)
+        return index
 
     def construct_target_rel_path(self, a, workdir):
         if workdir is None:
@@ -805,6 +911,41 @@ class Backend:
                 final_args.append(a)
         return final_args
 
+    def get_generator_template(self, generator):
+        '''Returns the arguments of @generator parsed once for all its inputs.'''
+        return mesonlib.CommandTemplate([a.replace('\\', '/') for a in generator.arglist],
+                                        generator_template_regex)
+
+    def get_generator_values(self, genlist, target):
+        '''
+        Returns the values of the generator templates that are the same for
+        all inputs of @genlist, the rest is added by
+        update_generator_values().
+        '''
+        if genlist.subdir:
+            source_target_dir = os.path.join(self.build_to_src, genlist.subdir)
+        else:
+            source_target_dir = self.get_target_source_dir(target)
+        values = {'@SOURCE_DIR@': self.build_to_src,
+                  '@BUILD_DIR@': self.get_target_private_dir(target),
+                  '@CURRENT_SOURCE_DIR@': source_target_dir,
+                  '@SOURCE_ROOT@': self.build_to_src,
+                  '@BUILD_ROOT@': '.'}
+        values = {k: v.replace('\\', '/') for k, v in values.items()}
+        values['@EXTRA_ARGS@'] = genlist.get_extra_args()
+        return values
+
+    def update_generator_values(self, values, infilename, sole_output, outfiles, depfile):
+        plainname = os.path.basename(infilename)
+        values['@INPUT@'] = infilename.replace('\\', '/')
+        values['@OUTPUT@'] = sole_output.replace('\\', '/')
+        values['@PLAINNAME@'] = plainname.replace('\\', '/')
+        values['@BASENAME@'] = os.path.splitext(plainname)[0].replace('\\', '/')
+        for i, o in enumerate(outfiles):
+            values['@OUTPUT{}@'.format(i)] = o.replace('\\', '/')
+        if depfile is not None:
+            values['@DEPFILE@'] = depfile.replace('\\', '/')
+
     def replace_outputs(self, args, private_dir, output_list):
         newargs = []
         regex = re.compile(r'@OUTPUT(\d+)@')
@@ -935,17 +1076,10 @@ class Backend:
             elif not isinstance(i, str):
                 err_msg = 'Argument {0} is of unknown type {1}'
                 raise RuntimeError(err_msg.format(str(i), str(type(i))))
-            elif '@SOURCE_ROOT@' in i:
-                i = i.replace('@SOURCE_ROOT@', source_root)
-            elif '@BUILD_ROOT@' in i:
-                i = i.replace('@BUILD_ROOT@', build_root)
-            elif '@DEPFILE@' in i:
-                if target.depfile is None:
-                    msg = 'Custom target {!r} has @DEPFILE@ but no depfile ' \
-                          'keyword argument.'.format(target.name)
-                    raise MesonException(msg)
-                dfilename = os.path.join(outdir, target.depfile)
-                i = i.replace('@DEPFILE@', dfilename)
+            elif '@DEPFILE@' in i and target.depfile is None:
+                msg = 'Custom target {!r} has @DEPFILE@ but no depfile ' \
+                      'keyword argument.'.format(target.name)
+                raise MesonException(msg)
             elif '@PRIVATE_OUTDIR_' in i:
                 match = re.search(r'@PRIVATE_OUTDIR_(ABS_)?([^/\s*]*)@', i)
                 if not match:
@@ -959,8 +1093,12 @@ class Backend:
                     lead_dir = self.environment.get_build_dir()
                 i = i.replace(source, os.path.join(lead_dir, outdir))
             cmd.append(i)
-        # Substitute the rest of the template strings
+        # Substitute all the template strings in one pass
         values = mesonlib.get_filenames_templates_dict(inputs, outputs)
+        values['@SOURCE_ROOT@'] = source_root
+        values['@BUILD_ROOT@'] = build_root
+        if target.depfile is not None:
+            values['@DEPFILE@'] = os.path.join(outdir, target.depfile)
         cmd = mesonlib.substitute_values(cmd, values)
         # This should not be necessary but removing it breaks
         # building GStreamer on Windows. The underlying issue
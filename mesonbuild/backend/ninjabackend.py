@@ -14,8 +14,10 @@
 from typing import List
 import os
 import re
+import json
 import shlex
 import pickle
+import fnmatch
 import subprocess
 from collections import OrderedDict
 import itertools
@@ -26,7 +28,7 @@ from . import backends
 from .. import modules
 from .. import environment, mesonlib
 from .. import build
-from .. import mlog
+from .. import mlog, mtrace
 from .. import dependencies
 from .. import compilers
 from ..compilers import CompilerArgs, CCompiler, VisualStudioCCompiler, FortranCompiler
@@ -115,7 +117,7 @@ class NinjaBuildElement:
         outfile.write(line)
 
         # All the entries that should remain unquoted
-        raw_names = {'DEPFILE', 'DESC', 'pool', 'description'}
+        raw_names = {'DEPFILE', 'DESC', 'pool', 'description', 'dyndep'}
 
         for e in self.elems:
             (name, elems) = e
@@ -142,6 +144,77 @@ class NinjaBuildElement:
                 raise MesonException('Multiple producers for Ninja target "%s". Please rename your targets.' % n)
             self.all_outputs[n] = True
 
+class CompilationDatabase:
+    '''Writes compile_commands.json from the compile statements the backend
+    generates, instead of running `ninja -t compdb` on the finished
+    build.ninja. Entries are streamed into a temporary file and the real
+    database is only replaced if its content changed.
+
+    http://clang.llvm.org/docs/JSONCompilationDatabase.html'''
+
+    varname_regex = re.compile(r'\$(\w+)')
+
+    def __init__(self, builddir):
+        self.builddir = builddir
+        self.rules = {}
+        self.outfiles = OrderedDict()
+
+    def add_rule(self, rulename, command):
+        '''Register a rule whose build statements end up in the database.
+        @command is the command line of the rule as a list, with Ninja
+        variables like $ARGS, $in or $out unexpanded.'''
+        self.rules[rulename] = command
+
+    def _get_outfile(self, dirname):
+        fname = os.path.join(self.builddir, dirname, 'compile_commands.json')
+        if fname not in self.outfiles:
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+            f = open(fname + '~', 'w', encoding='utf-8')
+            f.write('[')
+            self.outfiles[fname] = [f, True]
+        return self.outfiles[fname]
+
+    def _expand(self, command, variables):
+        result = []
+        for arg in command:
+            m = self.varname_regex.fullmatch(arg)
+            if m and m.group(1) in variables:
+                result += variables[m.group(1)]
+            else:
+                result.append(self.varname_regex.sub(
+                    lambda m: ' '.join(variables.get(m.group(1), [m.group(0)])), arg))
+        return result
+
+    def add_build(self, elem, subdirs=('',)):
+        '''Add the build statement @elem to the database in the build dir and,
+        for subproject targets, to the one in each of @subdirs.'''
+        if elem.rule not in self.rules or not elem.infilenames:
+            return
+        infiles = [i.replace('\\', '/') for i in elem.infilenames]
+        outfiles = [i.replace('\\', '/') for i in elem.outfilenames]
+        variables = {'in': infiles, 'out': outfiles}
+        for name, elems in elem.elems:
+            variables[name] = [str(i) for i in elems]
+        command = self._expand(self.rules[elem.rule], variables)
+        entry = json.dumps(OrderedDict([
+            ('directory', self.builddir),
+            ('command', ' '.join([quote_func(i) for i in command])),
+            ('file', infiles[0]),
+            ('output', outfiles[0]),
+        ]))
+        for subdir in subdirs:
+            outfile = self._get_outfile(subdir)
+            outfile[0].write('\n  ' + entry if outfile[1] else ',\n  ' + entry)
+            outfile[1] = False
+
+    def close(self):
+        self._get_outfile('')
+        for fname, (f, _) in self.outfiles.items():
+            f.write('\n]\n')
+            f.close()
+            mesonlib.replace_if_different(fname, fname + '~')
+        self.outfiles = OrderedDict()
+
 class NinjaBackend(backends.Backend):
 
     def __init__(self, build):
@@ -149,8 +222,11 @@ class NinjaBackend(backends.Backend):
         self.name = 'ninja'
         self.ninja_filename = 'build.ninja'
         self.fortran_deps = {}
+        self.fortran_scan_sources = {}
+        self.use_dyndep = False
         self.all_outputs = {}
         self.introspection_data = {}
+        self.compdb = None
 
     def create_target_alias(self, to_target, outfile):
         # We need to use aliases for targets that might be used as directory
@@ -210,20 +286,35 @@ int dummy;
         self.ninja_command = environment.detect_ninja(log=True)
         if self.ninja_command is None:
             raise MesonException('Could not detect Ninja v1.5 or newer')
+        # Ninja 1.10 can load the dependencies between Fortran sources from a
+        # file written at build time, which avoids reading every Fortran
+        # source here and also works for generated sources.
+        if self.has_fortran():
+            dyndep_ninja = environment.detect_ninja('1.10')
+            if dyndep_ninja is not None:
+                self.ninja_command = dyndep_ninja
+                self.use_dyndep = True
         outfilename = os.path.join(self.environment.get_build_dir(), self.ninja_filename)
         tempfilename = outfilename + '~'
+        self.compdb = CompilationDatabase(self.environment.get_build_dir())
+        self.compile_pools, self.compile_pool_globs = self.get_compile_pools()
+        self.warned_compile_pools = set()
         with open(tempfilename, 'w', encoding='utf-8') as outfile:
             outfile.write('# This is the build file for project "%s"\n' %
                           self.build.get_project())
             outfile.write('# It is autogenerated by the Meson build system.\n')
             outfile.write('# Do not edit by hand.\n\n')
-            outfile.write('ninja_required_version = 1.5.1\n\n')
+            if self.use_dyndep:
+                outfile.write('ninja_required_version = 1.10\n\n')
+            else:
+                outfile.write('ninja_required_version = 1.5.1\n\n')
         with self.detect_vs_dep_prefix(tempfilename) as outfile:
             self.generate_rules(outfile)
             self.generate_phony(outfile)
             outfile.write('# Build rules for targets\n\n')
             for t in self.build.get_targets().values():
-                self.generate_target(t, outfile)
+                with mtrace.span(t.get_id(), 'target'):
+                    self.generate_target(t, outfile)
             outfile.write('# Test rules\n\n')
             self.generate_tests(outfile)
             outfile.write('# Install rules\n\n')
@@ -239,21 +330,14 @@ int dummy;
         # Only overwrite the old build file after the new one has been
         # fully created.
         os.replace(tempfilename, outfilename)
-        self.generate_compdb()
-
-    # http://clang.llvm.org/docs/JSONCompilationDatabase.html
-    def generate_compdb(self):
-        pch_compilers = ['%s_PCH' % i for i in self.build.compilers]
-        native_compilers = ['%s_COMPILER' % i for i in self.build.compilers]
-        cross_compilers = ['%s_CROSS_COMPILER' % i for i in self.build.cross_compilers]
-        ninja_compdb = [self.ninja_command, '-t', 'compdb'] + pch_compilers + native_compilers + cross_compilers
-        builddir = self.environment.get_build_dir()
-        try:
-            jsondb = subprocess.check_output(ninja_compdb, cwd=builddir)
-            with open(os.path.join(builddir, 'compile_commands.json'), 'wb') as f:
-                f.write(jsondb)
-        except Exception:
-            mlog.warning('Could not create compilation database.')
+        self.compdb.close()
+
+    def add_compdb_entry(self, elem, target):
+        subdirs = ['']
+        if target.subproject != '' and \
+                self.environment.coredata.backend_options['backend_subproject_compdb'].value:
+            subdirs.append(os.path.join(self.build.subproject_dir, target.subproject))
+        self.compdb.add_build(elem, subdirs)
 
     # Get all generated headers. Any source file might need them so
     # we need to add an order dependency to them.
@@ -322,7 +406,7 @@ int dummy;
                 return False
         return True
 
-    def create_target_source_introspection(self, target: build.Target, comp: compilers.Compiler, parameters, sources, generated_sources):
+    def create_target_source_introspection(self, target: build.Target, comp: compilers.Compiler, parameters, sources, generated_sources, pool=None):
         '''
         Adds the source file introspection information for a language of a target
 
@@ -335,6 +419,7 @@ int dummy;
                     'parameters': ['UNIQUE', 'parameter', 'list'],
                     'sources': [],
                     'generated_sources': [],
+                    'pool': 'Ninja pool name' or None,
                 }
             }
         }
@@ -343,7 +428,7 @@ int dummy;
         lang = comp.get_language()
         tgt = self.introspection_data[id]
         # Find an existing entry or create a new one
-        id_hash = (lang, tuple(parameters))
+        id_hash = (lang, tuple(parameters), pool)
         src_block = tgt.get(id_hash, None)
         if src_block is None:
             # Convert parameters
@@ -357,6 +442,7 @@ int dummy;
                 'parameters': parameters,
                 'sources': [],
                 'generated_sources': [],
+                'pool': pool,
             }
             tgt[id_hash] = src_block
         # Make source files absolute
@@ -416,7 +502,8 @@ int dummy;
             target_sources = self.get_target_sources(target)
             generated_sources = self.get_target_generated_sources(target)
             vala_generated_sources = []
-        self.scan_fortran_module_outputs(target)
+        if not self.use_dyndep:
+            self.scan_fortran_module_outputs(target)
         # Generate rules for GeneratedLists
         self.generate_generator_list_rules(target, outfile)
 
@@ -525,6 +612,8 @@ int dummy;
         if is_unity:
             for src in self.generate_unity_files(target, unity_src):
                 obj_list.append(self.generate_single_compile(target, outfile, src, True, unity_deps + header_deps))
+        if self.use_dyndep:
+            self.generate_fortran_depscan(target, outfile)
         linker, stdlib_args = self.determine_linker_and_stdlib_args(target)
         elem = self.generate_link(target, outfile, outname, obj_list, linker, pch_objects, stdlib_args=stdlib_args)
         self.generate_shlib_aliases(target, self.get_target_dir(target))
@@ -573,12 +662,9 @@ int dummy;
                 elem.add_dep(os.path.join(self.get_target_dir(d), output))
         serialize = False
         extra_paths = []
-        # If the target requires capturing stdout, then use the serialized
-        # executable wrapper to capture that output and save it to a file.
-        if target.capture:
-            serialize = True
-        # If the command line requires a newline, also use the wrapper, as
-        # ninja does not support them in its build rule syntax.
+        # If the command line requires a newline, use the serialized
+        # executable wrapper, as ninja does not support them in its build
+        # rule syntax.
         if any('\n' in c for c in cmd):
             serialize = True
         # Windows doesn't have -rpath, so for EXEs that need DLLs built within
@@ -594,7 +680,16 @@ int dummy;
                                                              extra_bdeps, is_cross)
             if extra_paths:
                 serialize = True
-        if serialize:
+        # If the target requires capturing stdout, write it to the output
+        # with the capture script. Only use the serialized executable wrapper
+        # for that if it is needed anyway.
+        capture_cmd = None
+        if target.capture and not serialize:
+            capture_cmd = self.as_capture_cmdline(target.command[0], cmd, ofilenames[0])
+        if capture_cmd is not None:
+            cmd = capture_cmd
+            cmd_type = 'captured custom'
+        elif serialize or target.capture:
             exe_data = self.serialize_executable(target.name, target.command[0], cmd[1:],
                                                  # All targets are built from the build dir
                                                  self.environment.get_build_dir(),
@@ -771,6 +866,8 @@ int dummy;
   depth = %d
 
 ''' % num_pools)
+        for name, depth in self.compile_pools.items():
+            outfile.write('pool %s\n  depth = %d\n\n' % (name, depth))
         if self.environment.is_cross_build():
             self.generate_static_link_rules(True, outfile)
         self.generate_static_link_rules(False, outfile)
@@ -926,6 +1023,7 @@ int dummy;
         elem.add_dep(deps)
         elem.add_item('ARGS', commands)
         elem.write(outfile)
+        self.add_compdb_entry(elem, target)
 
         self.generate_generator_list_rules(target, outfile)
         self.create_target_source_introspection(target, compiler, commands, rel_srcs, generated_rel_srcs)
@@ -960,6 +1058,7 @@ int dummy;
         element.add_dep(deps)
         element.add_item('ARGS', args)
         element.write(outfile)
+        self.add_compdb_entry(element, target)
         return plain_class_path
 
     def generate_java_link(self, outfile):
@@ -1161,6 +1260,7 @@ int dummy;
         element.add_item('ARGS', args)
         element.add_dep(extra_dep_files)
         element.write(outfile)
+        self.add_compdb_entry(element, target)
         self.create_target_source_introspection(target, valac, args, all_files, [])
         return other_src[0], other_src[1], vala_c_src
 
@@ -1251,6 +1351,7 @@ int dummy;
         element.add_item('targetdep', depfile)
         element.add_item('cratetype', cratetype)
         element.write(outfile)
+        self.add_compdb_entry(element, target)
         if isinstance(target, build.SharedLibrary):
             self.generate_shsym(outfile, target)
         self.create_target_source_introspection(target, rustc, args, [main_rust_file], [])
@@ -1373,6 +1474,7 @@ int dummy;
         elem.add_item('ARGS', compile_args + header_imports + abs_generated + module_includes)
         elem.add_item('RUNDIR', rundir)
         elem.write(outfile)
+        self.add_compdb_entry(elem, target)
         elem = NinjaBuildElement(self.all_outputs, out_module_name,
                                  'swift_COMPILER',
                                  abssrc)
@@ -1380,6 +1482,7 @@ int dummy;
         elem.add_item('ARGS', compile_args + abs_generated + module_includes + swiftc.get_mod_gen_args())
         elem.add_item('RUNDIR', rundir)
         elem.write(outfile)
+        self.add_compdb_entry(elem, target)
         if isinstance(target, build.StaticLibrary):
             elem = self.generate_link(target, outfile, self.get_target_filename(target),
                                       rel_objects, self.build.static_linker)
@@ -1494,9 +1597,11 @@ int dummy;
         outfile.write('\n')
 
     def generate_java_compile_rule(self, compiler, outfile):
-        rule = 'rule %s_COMPILER\n' % compiler.get_language()
+        rulename = '%s_COMPILER' % compiler.get_language()
+        rule = 'rule %s\n' % rulename
         invoc = ' '.join([ninja_quote(i) for i in compiler.get_exelist()])
         command = ' command = %s $ARGS $in\n' % invoc
+        self.compdb.add_rule(rulename, compiler.get_exelist() + ['$ARGS', '$in'])
         description = ' description = Compiling Java object $in.\n'
         outfile.write(rule)
         outfile.write(command)
@@ -1504,7 +1609,8 @@ int dummy;
         outfile.write('\n')
 
     def generate_cs_compile_rule(self, compiler, outfile):
-        rule = 'rule %s_COMPILER\n' % compiler.get_language()
+        rulename = '%s_COMPILER' % compiler.get_language()
+        rule = 'rule %s\n' % rulename
         invoc = ' '.join([ninja_quote(i) for i in compiler.get_exelist()])
 
         if mesonlib.is_windows():
@@ -1514,6 +1620,7 @@ int dummy;
 '''.format(executable=invoc)
         else:
             command = ' command = %s $ARGS $in\n' % invoc
+        self.compdb.add_rule(rulename, compiler.get_exelist() + ['$ARGS', '$in'])
 
         description = ' description = Compiling C Sharp target $out.\n'
         outfile.write(rule)
@@ -1522,9 +1629,11 @@ int dummy;
         outfile.write('\n')
 
     def generate_vala_compile_rules(self, compiler, outfile):
-        rule = 'rule %s_COMPILER\n' % compiler.get_language()
+        rulename = '%s_COMPILER' % compiler.get_language()
+        rule = 'rule %s\n' % rulename
         invoc = ' '.join([ninja_quote(i) for i in compiler.get_exelist()])
         command = ' command = %s $ARGS $in\n' % invoc
+        self.compdb.add_rule(rulename, compiler.get_exelist() + ['$ARGS', '$in'])
         description = ' description = Compiling Vala source $in.\n'
         restat = ' restat = 1\n' # ValaC does this always to take advantage of it.
         outfile.write(rule)
@@ -1537,9 +1646,11 @@ int dummy;
         crstr = ''
         if is_cross:
             crstr = '_CROSS'
-        rule = 'rule %s%s_COMPILER\n' % (compiler.get_language(), crstr)
+        rulename = '%s%s_COMPILER' % (compiler.get_language(), crstr)
+        rule = 'rule %s\n' % rulename
         invoc = ' '.join([ninja_quote(i) for i in compiler.get_exelist()])
         command = ' command = %s $ARGS $in\n' % invoc
+        self.compdb.add_rule(rulename, compiler.get_exelist() + ['$ARGS', '$in'])
         description = ' description = Compiling Rust source $in.\n'
         depfile = ' depfile = $targetdep\n'
 
@@ -1552,7 +1663,8 @@ int dummy;
         outfile.write('\n')
 
     def generate_swift_compile_rules(self, compiler, outfile):
-        rule = 'rule %s_COMPILER\n' % compiler.get_language()
+        rulename = '%s_COMPILER' % compiler.get_language()
+        rule = 'rule %s\n' % rulename
         full_exe = [ninja_quote(x) for x in self.environment.get_build_command()] + [
             '--internal',
             'dirchanger',
@@ -1561,6 +1673,9 @@ int dummy;
         invoc = (' '.join(full_exe) + ' ' +
                  ' '.join(ninja_quote(i) for i in compiler.get_exelist()))
         command = ' command = %s $ARGS $in\n' % invoc
+        self.compdb.add_rule(rulename, self.environment.get_build_command() +
+                             ['--internal', 'dirchanger', '$RUNDIR'] +
+                             compiler.get_exelist() + ['$ARGS', '$in'])
         description = ' description = Compiling Swift source $in.\n'
         outfile.write(rule)
         outfile.write(command)
@@ -1583,6 +1698,19 @@ rule FORTRAN_DEP_HACK%s
 '''
         outfile.write(template % (crstr, cmd))
 
+    def generate_fortran_depscan_rule(self, outfile):
+        if getattr(self, 'created_depscan_rule', False):
+            return
+        cmd = self.environment.get_build_command() + ['--internal', 'depscan']
+        template = '''rule depscan
+ command = {} $in $out
+ description = Scanning Fortran module dependencies $out
+ restat = 1
+
+'''
+        outfile.write(template.format(' '.join([ninja_quote(quote_func(i)) for i in cmd])))
+        self.created_depscan_rule = True
+
     def generate_llvm_ir_compile_rule(self, compiler, is_cross, outfile):
         if getattr(self, 'created_llvm_ir_rule', False):
             return
@@ -1630,8 +1758,12 @@ rule FORTRAN_DEP_HACK%s
         else:
             crstr = ''
         if langname == 'fortran':
-            self.generate_fortran_dep_hack(outfile, crstr)
-        rule = 'rule %s%s_COMPILER\n' % (langname, crstr)
+            if self.use_dyndep:
+                self.generate_fortran_depscan_rule(outfile)
+            else:
+                self.generate_fortran_dep_hack(outfile, crstr)
+        rulename = '%s%s_COMPILER' % (langname, crstr)
+        rule = 'rule %s\n' % rulename
         depargs = compiler.get_dependency_gen_args('$out', '$DEPFILE')
         quoted_depargs = []
         for d in depargs:
@@ -1652,6 +1784,9 @@ rule FORTRAN_DEP_HACK%s
             output_args=' '.join(compiler.get_output_args('$out')),
             compile_only_args=' '.join(compiler.get_compile_only_args())
         )
+        self.compdb.add_rule(rulename, compiler.get_exelist() + ['$ARGS'] + depargs +
+                             compiler.get_output_args('$out') +
+                             compiler.get_compile_only_args() + ['$in'])
         description = ' description = Compiling %s object $out.\n' % compiler.get_display_language()
         if isinstance(compiler, VisualStudioCCompiler):
             deps = ' deps = msvc\n'
@@ -1671,7 +1806,8 @@ rule FORTRAN_DEP_HACK%s
             crstr = '_CROSS'
         else:
             crstr = ''
-        rule = 'rule %s%s_PCH\n' % (langname, crstr)
+        rulename = '%s%s_PCH' % (langname, crstr)
+        rule = 'rule %s\n' % rulename
         depargs = compiler.get_dependency_gen_args('$out', '$DEPFILE')
 
         quoted_depargs = []
@@ -1680,15 +1816,17 @@ rule FORTRAN_DEP_HACK%s
                 d = quote_func(d)
             quoted_depargs.append(d)
         if isinstance(compiler, VisualStudioCCompiler):
-            output = ''
+            output = []
         else:
-            output = ' '.join(compiler.get_output_args('$out'))
+            output = compiler.get_output_args('$out')
         command = " command = {executable} $ARGS {dep_args} {output_args} {compile_only_args} $in\n".format(
             executable=' '.join(compiler.get_exelist()),
             dep_args=' '.join(quoted_depargs),
-            output_args=output,
+            output_args=' '.join(output),
             compile_only_args=' '.join(compiler.get_compile_only_args())
         )
+        self.compdb.add_rule(rulename, compiler.get_exelist() + ['$ARGS'] + depargs + output +
+                             compiler.get_compile_only_args() + ['$in'])
         description = ' description = Precompiling header %s.\n' % '$in'
         if isinstance(compiler, VisualStudioCCompiler):
             deps = ' deps = msvc\n'
@@ -1741,51 +1879,62 @@ rule FORTRAN_DEP_HACK%s
 
     def generate_genlist_for_target(self, genlist, target, outfile):
         generator = genlist.get_generator()
-        subdir = genlist.subdir
         exe = generator.get_exe()
         exe_arr = self.exe_object_to_cmd_array(exe)
         infilelist = genlist.get_inputs()
         outfilelist = genlist.get_outputs()
         extra_dependencies = [os.path.join(self.build_to_src, i) for i in genlist.extra_depends]
+        private_dir = self.get_target_private_dir(target)
+        # Everything that does not depend on the input is computed once,
+        # generators can have many thousands of inputs.
+        template = self.get_generator_template(generator)
+        values = self.get_generator_values(genlist, target)
+        if generator.depfile is None:
+            rulename = 'CUSTOM_COMMAND'
+        else:
+            rulename = 'CUSTOM_COMMAND_DEP'
+        exe_deps = []
+        if isinstance(exe, build.BuildTarget):
+            exe_deps.append(self.get_target_filename(exe))
+        capture_prefix = None
+        exe_data = None
+        if generator.capture:
+            if self.can_capture_directly(exe, exe_arr):
+                capture_prefix = self.environment.get_build_command() + ['--internal', 'capture']
+            else:
+                # All inputs share one serialized executable, the arguments
+                # and the output file are given on the command line.
+                exe_data = self.serialize_executable(
+                    'generator ' + exe_arr[0],
+                    exe_arr[0],
+                    exe_arr[1:],
+                    self.environment.get_build_dir()
+                )
+                capture_prefix = self.environment.get_build_command() + ['--internal', 'exe', '--capture']
+                abs_pdir = os.path.join(self.environment.get_build_dir(), self.get_target_dir(target))
+                os.makedirs(abs_pdir, exist_ok=True)
         for i in range(len(infilelist)):
             curfile = infilelist[i]
             if len(generator.outputs) == 1:
-                sole_output = os.path.join(self.get_target_private_dir(target), outfilelist[i])
+                sole_output = os.path.join(private_dir, outfilelist[i])
             else:
                 sole_output = '{}'.format(curfile)
             infilename = curfile.rel_to_builddir(self.build_to_src)
-            base_args = generator.get_arglist(infilename)
             outfiles = genlist.get_outputs_for(curfile)
-            outfiles = [os.path.join(self.get_target_private_dir(target), of) for of in outfiles]
+            outfiles = [os.path.join(private_dir, of) for of in outfiles]
             if generator.depfile is None:
-                rulename = 'CUSTOM_COMMAND'
-                args = base_args
+                depfile = None
             else:
-                rulename = 'CUSTOM_COMMAND_DEP'
                 depfilename = generator.get_dep_outname(infilename)
-                depfile = os.path.join(self.get_target_private_dir(target), depfilename)
-                args = [x.replace('@DEPFILE@', depfile) for x in base_args]
-            args = [x.replace("@INPUT@", infilename).replace('@OUTPUT@', sole_output)
-                    for x in args]
-            args = self.replace_outputs(args, self.get_target_private_dir(target), outfilelist)
-            # We have consumed output files, so drop them from the list of remaining outputs.
-            if len(generator.outputs) > 1:
-                outfilelist = outfilelist[len(generator.outputs):]
-            args = self.replace_paths(target, args, override_subdir=subdir)
-            cmdlist = exe_arr + self.replace_extra_args(args, genlist)
-            if generator.capture:
-                exe_data = self.serialize_executable(
-                    'generator ' + cmdlist[0],
-                    cmdlist[0],
-                    cmdlist[1:],
-                    self.environment.get_build_dir(),
-                    capture=outfiles[0]
-                )
-                cmd = self.environment.get_build_command() + ['--internal', 'exe', exe_data]
-                abs_pdir = os.path.join(self.environment.get_build_dir(), self.get_target_dir(target))
-                os.makedirs(abs_pdir, exist_ok=True)
+                depfile = os.path.join(private_dir, depfilename)
+            self.update_generator_values(values, infilename, sole_output, outfiles, depfile)
+            args = template.expand(values)
+            if capture_prefix is None:
+                cmd = exe_arr + args
+            elif exe_data is None:
+                cmd = capture_prefix + [outfiles[0], '--'] + exe_arr + args
             else:
-                cmd = cmdlist
+                cmd = capture_prefix + [outfiles[0], exe_data, '--'] + args
 
             elem = NinjaBuildElement(self.all_outputs, outfiles, rulename, infilename)
             if generator.depfile is not None:
@@ -1797,11 +1946,14 @@ rule FORTRAN_DEP_HACK%s
             else:
                 # since there are multiple outputs, we log the source that caused the rebuild
                 elem.add_item('DESC', 'Generating source from {!r}.'.format(sole_output))
-            if isinstance(exe, build.BuildTarget):
-                elem.add_dep(self.get_target_filename(exe))
+            if exe_deps:
+                elem.add_dep(exe_deps)
             elem.add_item('COMMAND', cmd)
             elem.write(outfile)
 
+    def has_fortran(self):
+        return 'fortran' in self.build.compilers or 'fortran' in self.build.cross_compilers
+
     def scan_fortran_module_outputs(self, target):
         compiler = None
         for lang, c in self.build.compilers.items():
@@ -1847,6 +1999,30 @@ rule FORTRAN_DEP_HACK%s
 
         self.fortran_deps[target.get_basename()] = module_files
 
+    def get_fortran_dyndep_file(self, target):
+        return os.path.join(self.get_target_private_dir(target), 'depscan.dd')
+
+    def generate_fortran_depscan(self, target, outfile):
+        '''Writes the list of Fortran sources of the target and the build
+        statement that scans them for modules at build time. There is one
+        scan per target rather than per source because starting Python
+        costs more than scanning the sources.'''
+        sources = self.fortran_scan_sources.pop(target.get_id(), None)
+        if not sources:
+            return
+        private_dir = self.get_target_private_dir(target)
+        scan_file = os.path.join(private_dir, 'depscan.json')
+        scaninfo = {'module_dir': private_dir.replace('\\', '/'),
+                    'sources': sources}
+        abs_scan_file = os.path.join(self.environment.get_build_dir(), scan_file)
+        os.makedirs(os.path.dirname(abs_scan_file), exist_ok=True)
+        with open(abs_scan_file + '~', 'w', encoding='utf-8') as f:
+            json.dump(scaninfo, f, indent=2)
+        mesonlib.replace_if_different(abs_scan_file, abs_scan_file + '~')
+        elem = NinjaBuildElement(self.all_outputs, self.get_fortran_dyndep_file(target), 'depscan', scan_file)
+        elem.add_dep([src for src, _ in sources])
+        elem.write(outfile)
+
     def get_fortran_deps(self, compiler: FortranCompiler, src: str, target) -> List[str]:
         mod_files = []
         usere = re.compile(r"\s*use,?\s*(?:non_intrinsic)?\s*(?:::)?\s*(\w+)", re.IGNORECASE)
@@ -2128,12 +2304,6 @@ rule FORTRAN_DEP_HACK%s
         commands = self._generate_single_compile(target, compiler, is_generated)
         commands = CompilerArgs(commands.compiler, commands)
 
-        # Create introspection information
-        if is_generated is False:
-            self.create_target_source_introspection(target, compiler, commands, [src], [])
-        else:
-            self.create_target_source_introspection(target, compiler, commands, [], [src])
-
         build_dir = self.environment.get_build_dir()
         if isinstance(src, File):
             rel_src = src.rel_to_builddir(self.build_to_src)
@@ -2147,6 +2317,14 @@ rule FORTRAN_DEP_HACK%s
             raise AssertionError('BUG: broken generated source file handling for {!r}'.format(src))
         else:
             raise InvalidArguments('Invalid source type: {!r}'.format(src))
+        pool = self.get_compile_pool(target, src)
+
+        # Create introspection information
+        if is_generated is False:
+            self.create_target_source_introspection(target, compiler, commands, [src], [], pool)
+        else:
+            self.create_target_source_introspection(target, compiler, commands, [], [src], pool)
+
         obj_basename = self.object_filename_from_source(target, src)
         rel_obj = os.path.join(self.get_target_private_dir(target), obj_basename)
         dep_file = compiler.depfile_for_object(rel_obj)
@@ -2175,7 +2353,15 @@ rule FORTRAN_DEP_HACK%s
             crstr = '_CROSS'
         compiler_name = '%s%s_COMPILER' % (compiler.get_language(), crstr)
         extra_deps = []
-        if compiler.get_language() == 'fortran':
+        dyndep = None
+        if compiler.get_language() == 'fortran' and self.use_dyndep:
+            # The module dependencies are found at build time, see
+            # generate_fortran_depscan()
+            dyndep = self.get_fortran_dyndep_file(target)
+            sources = self.fortran_scan_sources.setdefault(target.get_id(), [])
+            sources.append([rel_src.replace('\\', '/'), rel_obj.replace('\\', '/')])
+            commands += compiler.get_module_outdir_args(self.get_target_private_dir(target))
+        elif compiler.get_language() == 'fortran':
             # Can't read source file to scan for deps if it's generated later
             # at build-time. Skip scanning for deps, and just set the module
             # outdir argument instead.
@@ -2209,11 +2395,68 @@ rule FORTRAN_DEP_HACK%s
         commands = commands.to_native()
         for i in self.get_fortran_orderdeps(target, compiler):
             element.add_orderdep(i)
+        if dyndep is not None:
+            element.add_orderdep(dyndep)
+            element.add_item('dyndep', dyndep)
         element.add_item('DEPFILE', dep_file)
         element.add_item('ARGS', commands)
+        if pool is not None:
+            element.add_item('pool', pool)
         element.write(outfile)
+        self.add_compdb_entry(element, target)
         return rel_obj
 
+    def get_compile_pools(self):
+        '''
+        Returns the depth of every compile pool by name and the list of
+        (pool, glob) pairs that assign sources to pools, as configured with
+        the backend_max_compile_jobs, backend_compile_pools and
+        backend_compile_pool_globs options.
+        '''
+        options = self.environment.coredata.backend_options
+        pools = OrderedDict()
+        if options['backend_max_compile_jobs'].value > 0:
+            pools['compile_pool'] = options['backend_max_compile_jobs'].value
+        for entry in options['backend_compile_pools'].value:
+            name, _, depth = entry.partition(':')
+            if not re.fullmatch(r'[A-Za-z0-9_]+', name) or not depth.isdigit() or int(depth) < 1:
+                raise MesonException('Invalid compile pool {!r}, must be NAME:DEPTH '
+                                     'with a positive DEPTH.'.format(entry))
+            if name in ('console', 'link_pool', 'compile_pool'):
+                raise MesonException('Compile pool name {!r} is reserved.'.format(name))
+            pools[name] = int(depth)
+        globs = []
+        for entry in options['backend_compile_pool_globs'].value:
+            name, _, pattern = entry.partition(':')
+            if name not in pools or not pattern:
+                raise MesonException('Invalid compile pool glob {!r}, must be POOL:GLOB '
+                                     'with POOL a defined compile pool.'.format(entry))
+            globs.append((name, pattern))
+        return pools, globs
+
+    def get_compile_pool(self, target, src):
+        '''
+        Returns the Ninja pool to compile @src of @target in, or None. Globs
+        take precedence over the compile_pool: keyword argument of the target,
+        which takes precedence over the pool of backend_max_compile_jobs.
+        '''
+        if self.compile_pool_globs:
+            # Relative to the source root, or the build root for built files
+            path = src.relative_name().replace('\\', '/')
+            for name, pattern in self.compile_pool_globs:
+                if fnmatch.fnmatchcase(path, pattern):
+                    return name
+        pool = target.compile_pool
+        if pool is not None:
+            if pool in self.compile_pools:
+                return pool
+            if pool not in self.warned_compile_pools:
+                self.warned_compile_pools.add(pool)
+                mlog.warning('Compile pool {!r} of target {!r} is not defined, add it to '
+                             'the backend_compile_pools option to limit its '
+                             'jobs.'.format(pool, target.name))
+        return 'compile_pool' if 'compile_pool' in self.compile_pools else None
+
     def add_header_deps(self, target, ninja_element, header_deps):
         for d in header_deps:
             if isinstance(d, File):
@@ -2303,6 +2546,7 @@ rule FORTRAN_DEP_HACK%s
             elem.add_item('ARGS', commands)
             elem.add_item('DEPFILE', dep)
             elem.write(outfile)
+            self.add_compdb_entry(elem, target)
         return pch_objects
 
     def generate_shsym(self, outfile, target):
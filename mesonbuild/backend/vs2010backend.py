@@ -13,7 +13,7 @@
 # limitations under the License.
 
 import os
-import pickle
+import json
 import xml.dom.minidom
 import xml.etree.ElementTree as ET
 import uuid
@@ -74,12 +74,6 @@ def split_o_flags_args(args):
 def generate_guid_from_path(path, path_type):
     return str(uuid.uuid5(uuid.NAMESPACE_URL, 'meson-vs-' + path_type + ':' + str(path))).upper()
 
-class RegenInfo:
-    def __init__(self, source_dir, build_dir, depfiles):
-        self.source_dir = source_dir
-        self.build_dir = build_dir
-        self.depfiles = depfiles
-
 class Vs2010Backend(backends.Backend):
     def __init__(self, build):
         super().__init__(build)
@@ -186,14 +180,21 @@ class Vs2010Backend(backends.Backend):
             pass
 
     def generate_regen_info(self):
-        deps = self.get_regen_filelist()
-        regeninfo = RegenInfo(self.environment.get_source_dir(),
-                              self.environment.get_build_dir(),
-                              deps)
+        # This is read by the regencheck script on every build, so it only
+        # contains what is needed for the check and is stored as JSON
+        # to not have to load coredata or any Meson classes.
+        regeninfo = {
+            'source_dir': self.environment.get_source_dir(),
+            'build_dir': self.environment.get_build_dir(),
+            'depfiles': self.get_regen_filelist(),
+            'meson_command': self.environment.coredata.meson_command,
+            'backend': self.environment.coredata.get_builtin_option('backend'),
+            'stamp_file': Vs2010Backend.get_regen_stampfile(self.environment.get_build_dir()),
+        }
         filename = os.path.join(self.environment.get_scratch_dir(),
-                                'regeninfo.dump')
-        with open(filename, 'wb') as f:
-            pickle.dump(regeninfo, f)
+                                'regeninfo.json')
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(regeninfo, f)
 
     def get_vcvars_command(self):
         has_arch_values = 'VSCMD_ARG_TGT_ARCH' in os.environ and 'VSCMD_ARG_HOST_ARCH' in os.environ
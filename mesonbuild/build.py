@@ -17,6 +17,7 @@ from collections import OrderedDict
 import itertools, pathlib
 import hashlib
 import pickle
+import weakref
 from functools import lru_cache
 
 from . import environment
@@ -26,7 +27,8 @@ from .mesonlib import (
     File, MesonException, listify, extract_as_list, OrderedSet,
     typeslistify, stringlistify, classify_unity_sources,
     get_filenames_templates_dict, substitute_values,
-    for_windows, for_darwin, for_cygwin, for_android, has_path_sep
+    for_windows, for_darwin, for_cygwin, for_android, has_path_sep,
+    dump_sectioned_file, load_sectioned_file
 )
 from .compilers import is_object, clink_langs, sort_clink, lang_suffixes, get_macos_dylib_install_name
 from .interpreterbase import FeatureNew
@@ -58,6 +60,7 @@ cs_kwargs = set(['resources', 'cs_args'])
 buildtarget_kwargs = set([
     'build_by_default',
     'build_rpath',
+    'compile_pool',
     'dependencies',
     'extra_files',
     'gui_app',
@@ -101,6 +104,66 @@ def get_target_macos_dylib_install_name(ld):
 class InvalidArguments(MesonException):
     pass
 
+class TargetGraph:
+    '''
+    Memoized transitive closures over the graph formed by the link_with:
+    and link_whole: arguments of build targets.
+
+    The closure of a target is built from the closures of the targets it
+    links to, which are computed first by walking the graph iteratively in
+    topological order. Every target is thus only expanded once no matter
+    how many paths lead to it, and deep graphs don't hit the recursion
+    limit. Closures are built as ordered sets and stored as tuples.
+    '''
+
+    # kind: (children of a target, include a child, expand a child)
+    kinds = {
+        # All libraries a target links to, for the link command line
+        'internal': (lambda t: itertools.chain(t.link_targets, t.link_whole_targets),
+                     lambda t: True,
+                     lambda t: isinstance(t, StaticLibrary)),
+        # The same without link_whole:, for pkg-config files
+        'link': (lambda t: t.link_targets,
+                 lambda t: True,
+                 lambda t: isinstance(t, StaticLibrary)),
+        # Shared libraries needed at runtime
+        'transitive': (lambda t: t.link_targets,
+                       lambda t: isinstance(t, SharedLibrary),
+                       lambda t: isinstance(t, BuildTarget)),
+    }
+
+    def __init__(self):
+        # Keyed weakly so closures go away together with their targets
+        self.closures = {kind: weakref.WeakKeyDictionary() for kind in self.kinds}
+
+    def get_closure(self, target, kind):
+        closures = self.closures[kind]
+        if target in closures:
+            return closures[target]
+        children, include, expand = self.kinds[kind]
+        stack = [(target, False)]
+        while stack:
+            t, ready = stack.pop()
+            if t in closures:
+                continue
+            if not ready:
+                # Compute the closures of everything t links to first
+                stack.append((t, True))
+                for c in children(t):
+                    if expand(c) and c not in closures:
+                        stack.append((c, False))
+                continue
+            result = OrderedSet()
+            for c in children(t):
+                if include(c):
+                    result.add(c)
+                if expand(c):
+                    result.update(closures[c])
+            closures[t] = tuple(result)
+        return closures[target]
+
+target_graph = TargetGraph()
+
 class Build:
     """A class that holds the status of one build including
     all dependencies and so on.
@@ -741,12 +804,8 @@ class BuildTarget(Target):
     def get_all_link_deps(self):
         return self.get_transitive_link_deps()
 
-    @lru_cache(maxsize=None)
     def get_transitive_link_deps(self):
-        result = []
-        for i in self.link_targets:
-            result += i.get_all_link_deps()
-        return result
+        return list(target_graph.get_closure(self, 'transitive'))
 
     def get_link_deps_mapping(self, prefix, environment):
         return self.get_transitive_link_deps_mapping(prefix, environment)
@@ -939,6 +998,9 @@ This will become a hard error in a future Meson release.''')
             if self.gnu_symbol_visibility not in permitted:
                 raise InvalidArguments('GNU symbol visibility arg %s not one of: %s',
                                        self.symbol_visibility, ', '.join(permitted))
+        self.compile_pool = kwargs.get('compile_pool', None)
+        if self.compile_pool is not None and not isinstance(self.compile_pool, str):
+            raise InvalidArguments('Compile pool must be a string.')
 
     def _extract_pic_pie(self, kwargs, arg):
         # Check if we have -fPIC, -fpic, -fPIE, or -fpie in cflags
@@ -961,23 +1023,10 @@ This will become a hard error in a future Meson release.''')
     def get_extra_args(self, language):
         return self.extra_args.get(language, [])
 
-    def get_dependencies(self, exclude=None, internal=True):
-        transitive_deps = []
-        if exclude is None:
-            exclude = []
-        if internal:
-            link_targets = itertools.chain(self.link_targets, self.link_whole_targets)
-        else:
-            # We don't want the 'internal' libraries when generating the
-            # `Libs:` and `Libs.private:` lists in pkg-config files.
-            link_targets = self.link_targets
-        for t in link_targets:
-            if t in transitive_deps or t in exclude:
-                continue
-            transitive_deps.append(t)
-            if isinstance(t, StaticLibrary):
-                transitive_deps += t.get_dependencies(transitive_deps + exclude, internal)
-        return transitive_deps
+    def get_dependencies(self, internal=True):
+        # We don't want the 'internal' libraries when generating the
+        # `Libs:` and `Libs.private:` lists in pkg-config files.
+        return list(target_graph.get_closure(self, 'internal' if internal else 'link'))
 
     def get_source_subdir(self):
         return self.subdir
@@ -2311,6 +2360,26 @@ def load(build_dir):
         raise MesonException(load_fail_msg)
     return obj
 
+def load_project_info(build_dir):
+    '''Returns the name, version, dist scripts and source directory of the
+    main project without loading the whole build data.'''
+    filename = os.path.join(build_dir, 'meson-private', 'build.dat')
+    try:
+        return load_sectioned_file(filename, 'project')
+    except KeyError:
+        obj = load(build_dir)
+        return get_project_info(obj)
+
+def get_project_info(obj):
+    return {'project_name': obj.project_name,
+            'project_version': obj.project_version,
+            'dist_scripts': obj.dist_scripts,
+            'source_dir': obj.environment.get_source_dir(),
+            }
+
 def save(obj, filename):
     with open(filename, 'wb') as f:
-        pickle.dump(obj, f)
+        dump_sectioned_file(f, OrderedDict([
+            ('build', obj),
+            ('project', get_project_info(obj)),
+        ]))
@@ -476,10 +476,10 @@ class CCompiler(Compiler):
                 mlog.debug('Could not run: %s (error: %s)\n' % (cmdlist, e))
                 return RunResult(False)
 
-        mlog.debug('Program stdout:\n')
-        mlog.debug(so)
-        mlog.debug('Program stderr:\n')
-        mlog.debug(se)
+        mlog.verbose('Program stdout:\n')
+        mlog.verbose(so)
+        mlog.verbose('Program stderr:\n')
+        mlog.verbose(se)
         return RunResult(True, pe.returncode, so, se)
 
     def _compile_int(self, expression, prefix, env, extra_args, dependencies):
@@ -19,6 +19,7 @@ from typing import List, Tuple
 from ..linkers import StaticLinker
 from .. import coredata
 from .. import mlog
+from .. import mtrace
 from .. import mesonlib
 from ..mesonlib import (
     EnvironmentException, MesonException, OrderedSet,
@@ -1107,11 +1108,12 @@ class Compiler:
         if not want_output:
             if key in self.compiler_check_cache:
                 p = self.compiler_check_cache[key]
-                mlog.debug('Using cached compile:')
-                mlog.debug('Cached command line: ', ' '.join(p.commands), '\n')
-                mlog.debug('Code:\n', code)
-                mlog.debug('Cached compiler stdout:\n', p.stdo)
-                mlog.debug('Cached compiler stderr:\n', p.stde)
+                with mtrace.span(' '.join(p.commands), 'compiler run', mode=mode, cache='hit'):
+                    mlog.debug('Using cached compile:')
+                    mlog.verbose('Cached command line: ', mlog.CommandLine(p.commands), '\n')
+                    mlog.verbose('Code:\n', code)
+                    mlog.verbose('Cached compiler stdout:\n', p.stdo)
+                    mlog.verbose('Cached compiler stderr:\n', p.stde)
                 yield p
                 return
         try:
@@ -1143,14 +1145,16 @@ class Compiler:
                 # Generate full command-line with the exelist
                 commands = self.get_exelist() + commands.to_native()
                 mlog.debug('Running compile:')
-                mlog.debug('Working directory: ', tmpdirname)
-                mlog.debug('Command line: ', ' '.join(commands), '\n')
-                mlog.debug('Code:\n', code)
+                mlog.verbose('Working directory: ', tmpdirname)
+                mlog.verbose('Command line: ', mlog.CommandLine(commands), '\n')
+                mlog.verbose('Code:\n', code)
                 os_env = os.environ.copy()
                 os_env['LC_ALL'] = 'C'
-                p, p.stdo, p.stde = Popen_safe(commands, cwd=tmpdirname, env=os_env)
-                mlog.debug('Compiler stdout:\n', p.stdo)
-                mlog.debug('Compiler stderr:\n', p.stde)
+                with mtrace.span(' '.join(commands), 'compiler run', mode=mode,
+                                 cache='miss' if not want_output else 'none'):
+                    p, p.stdo, p.stde = Popen_safe(commands, cwd=tmpdirname, env=os_env)
+                mlog.verbose('Compiler stdout:\n', p.stdo)
+                mlog.verbose('Compiler stderr:\n', p.stde)
                 p.commands = commands
                 p.input_name = srcname
                 if want_output:
@@ -388,6 +388,27 @@ class CoreData:
                     'Maximum number of linker processes to run or 0 for no '
                     'limit',
                     0, None, 0)
+            self.backend_options['backend_max_compile_jobs'] = \
+                UserIntegerOption(
+                    'backend_max_compile_jobs',
+                    'Maximum number of compiler processes to run or 0 for no '
+                    'limit',
+                    0, None, 0)
+            self.backend_options['backend_compile_pools'] = \
+                UserArrayOption(
+                    'backend_compile_pools',
+                    'Additional compile pools, as NAME:DEPTH',
+                    [])
+            self.backend_options['backend_compile_pool_globs'] = \
+                UserArrayOption(
+                    'backend_compile_pool_globs',
+                    'Compile sources matching a glob in a pool, as POOL:GLOB',
+                    [])
+            self.backend_options['backend_subproject_compdb'] = \
+                UserBooleanOption(
+                    'backend_subproject_compdb',
+                    'Also write a compilation database for each subproject',
+                    False)
         elif backend_name.startswith('vs'):
             self.backend_options['backend_startup_project'] = \
                 UserStringOption(
@@ -820,6 +841,7 @@ builtin_options = {
     'buildtype':  [UserComboOption, 'Build type to use', ['plain', 'debug', 'debugoptimized', 'release', 'minsize', 'custom'], 'debug'],
     'strip':      [UserBooleanOption, 'Strip targets on install', False],
     'unity':      [UserComboOption, 'Unity build', ['on', 'off', 'subprojects'], 'off'],
+    'unity_size': [UserIntegerOption, 'Approximate number of sources per unity file or 0 for one file per language', 0, None, 0],
     'prefix':     [UserStringOption, 'Installation prefix', default_prefix()],
     'libdir':     [UserStringOption, 'Library directory', default_libdir()],
     'libexecdir': [UserStringOption, 'Library executable directory', default_libexecdir()],
@@ -848,6 +870,7 @@ builtin_options = {
                                                        'nofallback',
                                                        'nodownload',
                                                        'forcefallback'], 'default'],
+    'log_level':       [UserComboOption, 'Amount of detail written to meson-logs/meson-log.txt', list(mlog.log_levels), 'verbose'],
 }
 
 # Special prefix-dependent defaults for installation directories that reside in
@@ -31,6 +31,7 @@ from enum import Enum
 from pathlib import Path, PurePath
 
 from .. import mlog
+from .. import mtrace
 from .. import mesonlib
 from ..compilers import clib_langs
 from ..environment import BinaryTable, Environment
@@ -597,8 +598,8 @@ class PkgConfigDependency(ExternalDependency):
         cmd = self.pkgbin.get_command() + args
         p, out = Popen_safe(cmd, env=env)[0:2]
         rc, out = p.returncode, out.strip()
-        call = ' '.join(cmd)
-        mlog.debug("Called `{}` -> {}\n{}".format(call, rc, out))
+        mlog.debug('Called', mlog.CommandLine(cmd), '->', rc)
+        mlog.verbose(out)
         return rc, out
 
     def _call_pkgbin(self, args, env=None):
@@ -1470,8 +1471,7 @@ set(CMAKE_SIZEOF_VOID_P "{}")
         cmd = self.cmakebin.get_command() + args
         p, out, err = Popen_safe(cmd, env=env, cwd=build_dir)
         rc = p.returncode
-        call = ' '.join(cmd)
-        mlog.debug("Called `{}` in {} -> {}".format(call, build_dir, rc))
+        mlog.debug('Called', mlog.CommandLine(cmd), 'in', build_dir, '->', rc)
 
         return rc, out, err
 
@@ -2144,8 +2144,10 @@ def find_external_dependency(name, env, kwargs):
     for c in candidates:
         # try this dependency method
         try:
-            d = c()
-            d._check_version()
+            with mtrace.span('{} ({})'.format(name, c.func.__name__), 'dependency') as trace_args:
+                d = c()
+                d._check_version()
+                trace_args['found'] = d.found()
             pkgdep.append(d)
         except DependencyException as e:
             pkg_exc.append(e)
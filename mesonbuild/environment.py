@@ -126,6 +126,20 @@ def detect_gcovr(version='3.1', log=False):
         return gcovr_exe, mesonlib.version_compare(found, '>=' + version)
     return None, None
 
+def detect_gcov(log=False):
+    '''Returns the gcov command if it can write its JSON intermediate format
+    to stdout, which GCC 9 and newer can.'''
+    gcov_exe = os.environ.get('GCOV', 'gcov')
+    try:
+        p, found = Popen_safe([gcov_exe, '--help'])[0:2]
+    except (FileNotFoundError, PermissionError):
+        return None
+    if p.returncode != 0 or '--json-format' not in found or '--stdout' not in found:
+        return None
+    if log:
+        mlog.log('Found gcov at {}'.format(shlex.quote(shutil.which(gcov_exe) or gcov_exe)))
+    return gcov_exe
+
 def find_coverage_tools():
     gcovr_exe, gcovr_new_rootdir = detect_gcovr()
 
@@ -16,6 +16,7 @@ from . import environment
 from . import coredata
 from . import dependencies
 from . import mlog
+from . import mtrace
 from . import build
 from . import optinterpreter
 from . import compilers
@@ -171,18 +172,21 @@ class RunProcess(InterpreterObject):
         child_env.update(menv)
         child_env = env.get_env(child_env)
         stdout = subprocess.PIPE if self.capture else subprocess.DEVNULL
-        mlog.debug('Running command:', ' '.join(command_array))
+        mlog.debug('Running command:', mlog.CommandLine(command_array))
+        # The command may take a long time or hang, make sure the log
+        # shows what was being run.
+        mlog.flush()
         try:
             p, o, e = Popen_safe(command_array, stdout=stdout, env=child_env, cwd=cwd)
             if self.capture:
-                mlog.debug('--- stdout ---')
-                mlog.debug(o)
+                mlog.verbose('--- stdout ---')
+                mlog.verbose(o)
             else:
                 o = ''
-                mlog.debug('--- stdout disabled ---')
-            mlog.debug('--- stderr ---')
-            mlog.debug(e)
-            mlog.debug('')
+                mlog.verbose('--- stdout disabled ---')
+            mlog.verbose('--- stderr ---')
+            mlog.verbose(e)
+            mlog.verbose('')
 
             if check and p.returncode != 0:
                 raise InterpreterException('Command "{}" failed with status {}.'.format(' '.join(command_array), p.returncode))
@@ -959,6 +963,17 @@ class CompilerHolder(InterpreterObject):
                              'get_argument_syntax': self.get_argument_syntax_method,
                              })
 
+    def method_call(self, method_name, args, kwargs):
+        if not mtrace.is_enabled():
+            return super().method_call(method_name, args, kwargs)
+        what = ''
+        if args and isinstance(args[0], str):
+            # Code snippets are abbreviated to their first line
+            what = args[0].strip().split('\n', 1)[0]
+        name = '{}.{}({})'.format(self.compiler.get_language(), method_name, what)
+        with mtrace.span(name, 'compiler check'):
+            return super().method_call(method_name, args, kwargs)
+
     def _dep_msg(self, deps, endl):
         msg_single = 'with dependency {}'
         msg_many = 'with dependencies {}'
@@ -2419,7 +2434,7 @@ external dependencies (including libraries) must go to "dependencies".''')
         with mlog.nested():
             mlog.log('Executing subproject', mlog.bold(dirname), '\n')
         try:
-            with mlog.nested():
+            with mlog.nested(), mtrace.span(dirname, 'subproject'):
                 new_build = self.build.copy()
                 subi = Interpreter(new_build, self.backend, dirname, subdir, self.subproject_dir,
                                    self.modules, default_options)
@@ -3346,7 +3361,8 @@ This will become a hard error in the future.''' % kwargs['input'], location=self
             me.file = buildfilename
             raise me
         try:
-            self.evaluate_codeblock(codeblock)
+            with mtrace.span(subdir, 'subdir'):
+                self.evaluate_codeblock(codeblock)
         except SubdirDoneRequest:
             pass
         self.subdir = prev_subdir
@@ -3950,6 +3966,7 @@ Try setting b_lundef to false instead.'''.format(self.coredata.base_options['b_s
         @FeatureNewKwargs('build target', '0.41.0', ['rust_args'])
         @FeatureNewKwargs('build target', '0.40.0', ['build_by_default'])
         @FeatureNewKwargs('build target', '0.48.0', ['gnu_symbol_visibility'])
+        @FeatureNewKwargs('build target', '0.50.0', ['compile_pool'])
         def build_target_decorator_caller(self, node, args, kwargs):
             return True
 
@@ -0,0 +1,32 @@
+# Copyright 2019 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+from . import build, mesonlib
+from .scripts import dist
+
+def add_arguments(parser):
+    parser.add_argument('-C', default='.', dest='wd',
+                        help='directory to cd into before running')
+    dist.add_arguments(parser)
+
+def run(options):
+    bld_root = os.path.abspath(options.wd)
+    if not os.path.isfile(os.path.join(bld_root, 'meson-private', 'coredata.dat')):
+        print('Directory {!r} does not seem to be a Meson build directory.'.format(options.wd))
+        return 1
+    src_root = build.load_project_info(bld_root)['source_dir']
+    return dist.run_dist(src_root, bld_root, mesonlib.meson_command,
+                         options.formats, options.jobs)
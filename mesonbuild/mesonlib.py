@@ -19,6 +19,9 @@ import functools
 import sys
 import stat
 import time
+import pickle
+import struct
+import hashlib
 import platform, subprocess, operator, os, shutil, re
 import collections
 from enum import Enum
@@ -286,6 +289,25 @@ def classify_unity_sources(compilers, sources):
             compsrclist[comp].append(src)
     return compsrclist
 
+def split_unity_sources(sources, batch_size):
+    '''
+    Splits the sources of one language into batches of about batch_size
+    files and returns them as (name, sources) pairs.
+
+    The sources are sorted and a new batch starts at every source whose path
+    hashes to a multiple of batch_size, so adding or removing a source only
+    changes the batch it ends up in instead of shifting all following ones.
+    Batches are capped at twice batch_size sources. A batch is named after
+    the hash of its first source, so the names are stable too.
+    '''
+    batches = []
+    for src in sorted(sources):
+        digest = hashlib.sha1(src.encode('utf-8')).hexdigest()
+        if not batches or int(digest, 16) % batch_size == 0 or len(batches[-1][1]) >= 2 * batch_size:
+            batches.append((digest[:8], []))
+        batches[-1][1].append(src)
+    return batches
+
 class OrderedEnum(Enum):
     """
     An Enum which additionally offers homogeneous ordered comparison.
@@ -759,48 +781,151 @@ def do_mesondefine(line, confdata):
         raise MesonException('#mesondefine argument "%s" is of unknown type.' % varname)
 
 
-def do_conf_file(src, dst, confdata, format, encoding='utf-8'):
-    try:
-        with open(src, encoding=encoding, newline='') as f:
-            data = f.readlines()
-    except Exception as e:
-        raise MesonException('Could not read input file %s: %s' % (src, str(e)))
+def get_conf_regex(format):
     # Only allow (a-z, A-Z, 0-9, _, -) as valid characters for a define
     # Also allow escaping '@' with '\@'
     if format in ['meson', 'cmake@']:
-        regex = re.compile(r'(?:\\\\)+(?=\\?@)|\\@|@([-a-zA-Z0-9_]+)@')
+        return re.compile(r'(?:\\\\)+(?=\\?@)|\\@|@([-a-zA-Z0-9_]+)@')
     elif format == 'cmake':
-        regex = re.compile(r'(?:\\\\)+(?=\\?\$)|\\\${|\${([-a-zA-Z0-9_]+)}')
-    else:
-        raise MesonException('Format "{}" not handled'.format(format))
+        return re.compile(r'(?:\\\\)+(?=\\?\$)|\\\${|\${([-a-zA-Z0-9_]+)}')
+    raise MesonException('Format "{}" not handled'.format(format))
+
+class ConfTemplate:
+    '''
+    The input of a configure_file() split into literal text, variables to
+    replace and #mesondefine lines, so substituting is a join. Templates
+    are cached on the hash of their content, see get_conf_template().
+    '''
+    VARIABLE = 0
+    DEFINE = 1
+
+    def __init__(self, lines, format):
+        regex = get_conf_regex(format)
+        start_tag = '@'
+        backslash_tag = '\\@'
+        search_token = '#mesondefine'
+        if format == 'cmake':
+            start_tag = '${'
+            backslash_tag = '\\${'
+        if format != 'meson':
+            search_token = '#cmakedefine'
+        # Literal strings and (kind, name, line) tuples
+        self.segments = []
+        self.names = OrderedSet()
+        self.has_defines = False
+        literal = []
+        for line in lines:
+            if line.startswith(search_token):
+                arr = line.split()
+                if len(arr) != 2:
+                    raise MesonException('#mesondefine does not contain exactly two tokens: %s' % line.strip())
+                self.has_defines = True
+                self.names.add(arr[1])
+                self.segments.append(''.join(literal))
+                self.segments.append((self.DEFINE, arr[1], line))
+                literal = []
+                continue
+            last = 0
+            for match in regex.finditer(line):
+                literal.append(line[last:match.start()])
+                last = match.end()
+                # Pairs of escape characters before '@' or '\@'
+                if match.group(0).endswith('\\'):
+                    literal.append('\\' * ((match.end() - match.start()) // 2))
+                # Single escape character and '@'
+                elif match.group(0) == backslash_tag:
+                    literal.append(start_tag)
+                # Template variable to be replaced
+                else:
+                    self.names.add(match.group(1))
+                    self.segments.append(''.join(literal))
+                    self.segments.append((self.VARIABLE, match.group(1), None))
+                    literal = []
+            literal.append(line[last:])
+        self.segments.append(''.join(literal))
+        # The values used by the last substitution and its result
+        self.last_values = None
+        self.last_result = None
+
+    def get_values(self, confdata):
+        # The type is part of the value because True == 1 but they are
+        # substituted differently.
+        values = []
+        for n in self.names:
+            if n in confdata:
+                v = confdata.get(n)[0]
+                values.append((type(v), v))
+            else:
+                values.append(None)
+        return values
+
+    def substitute(self, confdata):
+        '''Returns the substituted text and the missing variables.'''
+        values = self.get_values(confdata)
+        if values == self.last_values:
+            return self.last_result[0], set(self.last_result[1])
+        result = []
+        missing_variables = set()
+        for segment in self.segments:
+            if isinstance(segment, str):
+                result.append(segment)
+                continue
+            kind, varname, line = segment
+            if kind == self.DEFINE:
+                result.append(do_mesondefine(line, confdata))
+            elif varname in confdata:
+                var = confdata.get(varname)[0]
+                if isinstance(var, str):
+                    pass
+                elif isinstance(var, int):
+                    var = str(var)
+                else:
+                    msg = 'Tried to replace variable {!r} value with ' \
+                          'something other than a string or int: {!r}'
+                    raise MesonException(msg.format(varname, var))
+                result.append(var)
+            else:
+                missing_variables.add(varname)
+        text = ''.join(result)
+        self.last_values = values
+        self.last_result = (text, set(missing_variables))
+        return text, missing_variables
 
-    search_token = '#mesondefine'
-    if format != 'meson':
-        search_token = '#cmakedefine'
+_conf_templates = {}
 
-    result = []
-    missing_variables = set()
+def get_conf_template(lines, format):
+    key = (hashlib.sha1(''.join(lines).encode('utf-8')).hexdigest(), format)
+    if key not in _conf_templates:
+        _conf_templates[key] = ConfTemplate(lines, format)
+    return _conf_templates[key]
+
+def do_conf_file(src, dst, confdata, format, encoding='utf-8'):
+    try:
+        with open(src, encoding=encoding, newline='') as f:
+            data = f.readlines()
+    except Exception as e:
+        raise MesonException('Could not read input file %s: %s' % (src, str(e)))
+    template = get_conf_template(data, format)
+    result, missing_variables = template.substitute(confdata)
     # Detect when the configuration data is empty and no tokens were found
     # during substitution so we can warn the user to use the `copy:` kwarg.
-    confdata_useless = not confdata.keys()
-    for line in data:
-        if line.startswith(search_token):
-            confdata_useless = False
-            line = do_mesondefine(line, confdata)
-        else:
-            line, missing = do_replacement(regex, line, format, confdata)
-            missing_variables.update(missing)
-            if missing:
-                confdata_useless = False
-        result.append(line)
+    confdata_useless = not confdata.keys() and not template.has_defines and not missing_variables
+    # If contents are identical, don't touch the file to prevent
+    # unnecessary rebuilds.
+    try:
+        with open(dst, encoding=encoding, newline='') as f:
+            if f.read() == result:
+                return missing_variables, confdata_useless
+    except (OSError, UnicodeDecodeError):
+        pass
     dst_tmp = dst + '~'
     try:
         with open(dst_tmp, 'w', encoding=encoding, newline='') as f:
-            f.writelines(result)
+            f.write(result)
     except Exception as e:
         raise MesonException('Could not write output file %s: %s' % (dst, str(e)))
     shutil.copymode(src, dst_tmp)
-    replace_if_different(dst, dst_tmp)
+    os.replace(dst_tmp, dst)
     return missing_variables, confdata_useless
 
 CONF_C_PRELUDE = '''/*
@@ -862,6 +987,51 @@ def replace_if_different(dst, dst_tmp):
     else:
         os.unlink(dst_tmp)
 
+SECTIONED_FILE_MAGIC = b'MESONTOC'
+SECTIONED_FILE_VERSION = 1
+_sectioned_file_footer = struct.Struct('<Q8s')
+
+def dump_sectioned_file(f, sections):
+    '''
+    Pickles every value of the ordered mapping @sections separately into the
+    binary file object @f, followed by a table of contents. This makes it
+    possible to load a single small section with load_sectioned_file()
+    without unpickling the rest. The first section is written at the current
+    position of @f, so a plain pickle.load() from there keeps returning it.
+    All offsets are absolute file positions.
+    '''
+    toc = collections.OrderedDict()
+    for name, obj in sections.items():
+        start = f.tell()
+        pickle.dump(obj, f)
+        toc[name] = (start, f.tell() - start)
+    toc_start = f.tell()
+    pickle.dump({'version': SECTIONED_FILE_VERSION, 'sections': toc}, f)
+    f.write(_sectioned_file_footer.pack(toc_start, SECTIONED_FILE_MAGIC))
+
+def load_sectioned_file(filename, name):
+    '''
+    Loads only the section @name of a file written with
+    dump_sectioned_file(). Raises KeyError if the file has no table of
+    contents or no such section, so callers can fall back to loading the
+    full object.
+    '''
+    with open(filename, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() < _sectioned_file_footer.size:
+            raise KeyError(name)
+        f.seek(-_sectioned_file_footer.size, os.SEEK_END)
+        toc_start, magic = _sectioned_file_footer.unpack(f.read(_sectioned_file_footer.size))
+        if magic != SECTIONED_FILE_MAGIC:
+            raise KeyError(name)
+        f.seek(toc_start)
+        toc = pickle.load(f)
+        if toc['version'] != SECTIONED_FILE_VERSION:
+            raise KeyError(name)
+        start, length = toc['sections'][name]
+        f.seek(start)
+        return pickle.loads(f.read(length))
+
 def listify(item, flatten=True, unholder=False):
     '''
     Returns a list with all args embedded in a list if they are not a list.
@@ -966,61 +1136,111 @@ def Popen_safe_legacy(args, write=None, stdout=subprocess.PIPE, stderr=subproces
             e = e.decode(errors='replace').replace('\r\n', '\n')
     return p, o, e
 
-def iter_regexin_iter(regexiter, initer):
+# The templates substituted by substitute_values(). @SOURCE_ROOT@,
+# @BUILD_ROOT@ and @DEPFILE@ are only given values for custom targets.
+FILENAME_TEMPLATE_REGEX = re.compile(r'(@(?:INPUT|OUTPUT)[0-9]*@|@PLAINNAME@|@BASENAME@|'
+                                     r'@OUTDIR@|@SOURCE_ROOT@|@BUILD_ROOT@|@DEPFILE@)')
+
+class CommandTemplate:
     '''
-    Takes each regular expression in @regexiter and tries to search for it in
-    every item in @initer. If there is a match, returns that match.
-    Else returns False.
+    A list of command arguments split once into literal text and the
+    template strings matched by @regex, which must have one capture group
+    around the whole template. It can then be expanded for many different
+    values in one pass over the arguments.
     '''
-    for regex in regexiter:
-        for ii in initer:
-            if not isinstance(ii, str):
-                continue
-            match = re.search(regex, ii)
-            if match:
-                return match.group()
-    return False
+    def __init__(self, command, regex=FILENAME_TEMPLATE_REGEX):
+        self.command = command
+        # (parts, arg) pairs, parts alternate between literal text and
+        # templates and is None for arguments without templates.
+        self.args = []
+        # All templates in the order they appear
+        self.templates = []
+        seen = set()
+        for a in command:
+            parts = None
+            if isinstance(a, str):
+                split = regex.split(a)
+                if len(split) > 1:
+                    parts = split
+                    for t in split[1::2]:
+                        if t not in seen:
+                            seen.add(t)
+                            self.templates.append(t)
+            self.args.append((parts, a))
+
+    def expand(self, values):
+        '''
+        Returns the command with the templates replaced with their value in
+        @values. Templates without a value are kept as is. A template whose
+        value is a list is replaced with all of its items if it is a whole
+        argument, otherwise the list must have exactly one item.
+        '''
+        result = []
+        for parts, a in self.args:
+            if parts is None:
+                result.append(a)
+            elif len(parts) == 3 and not parts[0] and not parts[2]:
+                # Values that are exactly a template, no need to join
+                value = values.get(parts[1], parts[1])
+                if isinstance(value, list):
+                    result += value
+                else:
+                    result.append(value)
+            else:
+                expanded = []
+                for i, p in enumerate(parts):
+                    if i % 2:
+                        p = values.get(p, p)
+                        if isinstance(p, list):
+                            if len(p) != 1:
+                                raise MesonException(
+                                    'Command has {!r} as part of a string and more than one {}'
+                                    ''.format(parts[i], template_list_names.get(parts[i], 'value')))
+                            p = p[0]
+                    expanded.append(p)
+                result.append(''.join(expanded))
+        return result
+
+template_list_names = {'@INPUT@': 'input file',
+                       '@OUTPUT@': 'output file'}
 
-def _substitute_values_check_errors(command, values):
+_input_template_regex = re.compile('@INPUT([0-9]+)?@')
+_output_template_regex = re.compile('@OUTPUT([0-9]+)?@')
+
+def _substitute_values_check_errors(template, values):
+    templates = template.templates
+    inputs = [t for t in templates if _input_template_regex.fullmatch(t)]
+    outputs = [t for t in templates if _output_template_regex.fullmatch(t)]
+    plain = [t for t in templates if t in ('@PLAINNAME@', '@BASENAME@')]
     # Error checking
-    inregex = ('@INPUT([0-9]+)?@', '@PLAINNAME@', '@BASENAME@')
-    outregex = ('@OUTPUT([0-9]+)?@', '@OUTDIR@')
     if '@INPUT@' not in values:
         # Error out if any input-derived templates are present in the command
-        match = iter_regexin_iter(inregex, command)
+        match = (inputs + plain)[:1]
         if match:
             m = 'Command cannot have {!r}, since no input files were specified'
-            raise MesonException(m.format(match))
+            raise MesonException(m.format(match[0]))
     else:
-        if len(values['@INPUT@']) > 1:
+        if len(values['@INPUT@']) > 1 and plain:
             # Error out if @PLAINNAME@ or @BASENAME@ is present in the command
-            match = iter_regexin_iter(inregex[1:], command)
-            if match:
-                raise MesonException('Command cannot have {!r} when there is '
-                                     'more than one input file'.format(match))
+            raise MesonException('Command cannot have {!r} when there is '
+                                 'more than one input file'.format(plain[0]))
         # Error out if an invalid @INPUTnn@ template was specified
-        for each in command:
-            if not isinstance(each, str):
-                continue
-            match = re.search(inregex[0], each)
-            if match and match.group() not in values:
+        for each in inputs:
+            if each not in values:
                 m = 'Command cannot have {!r} since there are only {!r} inputs'
-                raise MesonException(m.format(match.group(), len(values['@INPUT@'])))
+                raise MesonException(m.format(each, len(values['@INPUT@'])))
     if '@OUTPUT@' not in values:
         # Error out if any output-derived templates are present in the command
-        match = iter_regexin_iter(outregex, command)
+        match = [t for t in templates if t in outputs or t == '@OUTDIR@'][:1]
         if match:
             m = 'Command cannot have {!r} since there are no outputs'
-            raise MesonException(m.format(match))
+            raise MesonException(m.format(match[0]))
     else:
         # Error out if an invalid @OUTPUTnn@ template was specified
-        for each in command:
-            if not isinstance(each, str):
-                continue
-            match = re.search(outregex[0], each)
-            if match and match.group() not in values:
+        for each in outputs:
+            if each not in values:
                 m = 'Command cannot have {!r} since there are only {!r} outputs'
-                raise MesonException(m.format(match.group(), len(values['@OUTPUT@'])))
+                raise MesonException(m.format(each, len(values['@OUTPUT@'])))
 
 def substitute_values(command, values):
     '''
@@ -1032,43 +1252,9 @@ def substitute_values(command, values):
     substitute @INPUT@ and @OUTPUT@ only if they are the entire string, not
     just a part of it, and in that case we substitute *all* of them.
     '''
-    # Error checking
-    _substitute_values_check_errors(command, values)
-    # Substitution
-    outcmd = []
-    rx_keys = [re.escape(key) for key in values if key not in ('@INPUT@', '@OUTPUT@')]
-    value_rx = re.compile('|'.join(rx_keys)) if rx_keys else None
-    for vv in command:
-        if not isinstance(vv, str):
-            outcmd.append(vv)
-        elif '@INPUT@' in vv:
-            inputs = values['@INPUT@']
-            if vv == '@INPUT@':
-                outcmd += inputs
-            elif len(inputs) == 1:
-                outcmd.append(vv.replace('@INPUT@', inputs[0]))
-            else:
-                raise MesonException("Command has '@INPUT@' as part of a "
-                                     "string and more than one input file")
-        elif '@OUTPUT@' in vv:
-            outputs = values['@OUTPUT@']
-            if vv == '@OUTPUT@':
-                outcmd += outputs
-            elif len(outputs) == 1:
-                outcmd.append(vv.replace('@OUTPUT@', outputs[0]))
-            else:
-                raise MesonException("Command has '@OUTPUT@' as part of a "
-                                     "string and more than one output file")
-        # Append values that are exactly a template string.
-        # This is faster than a string replace.
-        elif vv in values:
-            outcmd.append(values[vv])
-        # Substitute everything else with replacement
-        elif value_rx:
-            outcmd.append(value_rx.sub(lambda m: values[m.group(0)], vv))
-        else:
-            outcmd.append(vv)
-    return outcmd
+    template = CommandTemplate(command)
+    _substitute_values_check_errors(template, values)
+    return template.expand(values)
 
 def get_filenames_templates_dict(inputs, outputs):
     '''
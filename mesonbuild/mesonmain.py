@@ -19,49 +19,56 @@ import traceback
 import argparse
 import codecs
 
+# Only import what the --internal scripts need here, the modules of the
+# other commands are imported when the command is run.
 from . import mesonlib
 from . import mlog
-from . import mconf, minit, minstall, mintro, msetup, mtest, rewriter, msubprojects, munstable_coredata
 from .mesonlib import MesonException
-from .environment import detect_msys2_arch
-from .wrap import wraptool
 
 
 class CommandLineParser:
     def __init__(self):
         self.commands = {}
         self.hidden_commands = []
+        self.unloaded_commands = {}
         self.parser = argparse.ArgumentParser(prog='meson')
         self.subparsers = self.parser.add_subparsers(title='Commands',
                                                      description='If no command is specified it defaults to setup command.')
-        self.add_command('setup', msetup.add_arguments, msetup.run,
+        self.add_command('setup', '.msetup',
                          help='Configure the project')
-        self.add_command('configure', mconf.add_arguments, mconf.run,
+        self.add_command('configure', '.mconf',
                          help='Change project options',)
-        self.add_command('install', minstall.add_arguments, minstall.run,
+        self.add_command('install', '.minstall',
                          help='Install the project')
-        self.add_command('introspect', mintro.add_arguments, mintro.run,
+        self.add_command('introspect', '.mintro',
                          help='Introspect project')
-        self.add_command('init', minit.add_arguments, minit.run,
+        self.add_command('init', '.minit',
                          help='Create a new project')
-        self.add_command('test', mtest.add_arguments, mtest.run,
+        self.add_command('test', '.mtest',
                          help='Run tests')
-        self.add_command('wrap', wraptool.add_arguments, wraptool.run,
+        self.add_command('wrap', '.wrap.wraptool',
                          help='Wrap tools')
-        self.add_command('subprojects', msubprojects.add_arguments, msubprojects.run,
+        self.add_command('subprojects', '.msubprojects',
                          help='Manage subprojects')
-        self.add_command('help', self.add_help_arguments, self.run_help_command,
+        self.add_command('dist', '.mdist',
+                         help='Generate release archives')
+        self.add_command('help', (self.add_help_arguments, self.run_help_command),
                          help='Print help of a subcommand')
 
         # Hidden commands
-        self.add_command('rewrite', rewriter.add_arguments, rewriter.run,
+        self.add_command('rewrite', '.rewriter',
                          help=argparse.SUPPRESS)
-        self.add_command('runpython', self.add_runpython_arguments, self.run_runpython_command,
+        self.add_command('runpython', (self.add_runpython_arguments, self.run_runpython_command),
                          help=argparse.SUPPRESS)
-        self.add_command('unstable-coredata', munstable_coredata.add_arguments, munstable_coredata.run,
+        self.add_command('unstable-coredata', '.munstable_coredata',
                          help=argparse.SUPPRESS)
 
-    def add_command(self, name, add_arguments_func, run_func, help):
+    def add_command(self, name, module, help):
+        '''
+        @module is the name of the module with the add_arguments() and run()
+        functions of the command, relative to this package, or a tuple of
+        the two functions. It is only imported when the command is used.
+        '''
         # FIXME: Cannot have hidden subparser:
         # https://bugs.python.org/issue22848
         if help == argparse.SUPPRESS:
@@ -69,9 +76,21 @@ class CommandLineParser:
             self.hidden_commands.append(name)
         else:
             p = self.subparsers.add_parser(name, help=help)
+        self.commands[name] = p
+        self.unloaded_commands[name] = module
+
+    def load_command(self, name):
+        module = self.unloaded_commands.pop(name, None)
+        if module is None:
+            return
+        if isinstance(module, tuple):
+            add_arguments_func, run_func = module
+        else:
+            module = importlib.import_module(module, __package__)
+            add_arguments_func, run_func = module.add_arguments, module.run
+        p = self.commands[name]
         add_arguments_func(p)
         p.set_defaults(run_func=run_func)
-        self.commands[name] = p
 
     def add_runpython_arguments(self, parser):
         parser.add_argument('script_file')
@@ -89,6 +108,7 @@ class CommandLineParser:
 
     def run_help_command(self, options):
         if options.command:
+            self.load_command(options.command)
             self.commands[options.command].print_help()
         else:
             self.parser.print_help()
@@ -100,6 +120,8 @@ class CommandLineParser:
         known_commands = list(self.commands.keys()) + ['-h', '--help']
         if len(args) == 0 or args[0] not in known_commands:
             args = ['setup'] + args
+        if args[0] in self.commands:
+            self.load_command(args[0])
 
         # Hidden commands have their own parser instead of using the global one
         if args[0] in self.hidden_commands:
@@ -178,6 +200,7 @@ def run(original_args, mainfile):
     # https://github.com/mesonbuild/meson/issues/3653
     if sys.platform.lower() == 'msys':
         mlog.error('This python3 seems to be msys/python on MSYS2 Windows, which is known to have path semantics incompatible with Meson')
+        from .environment import detect_msys2_arch
         msys2_arch = detect_msys2_arch()
         if msys2_arch:
             mlog.error('Please install and use mingw-w64-i686-python3 and/or mingw-w64-x86_64-python3 with Pacman')
@@ -20,6 +20,7 @@ Currently only works for the Ninja backend. Others use generated
 project files and don't need this info."""
 
 import json
+import hashlib
 from . import build, coredata as cdata
 from . import mesonlib
 from .ast import IntrospectionInterpreter
@@ -27,6 +28,11 @@ from . import mlog
 from .backend import backends
 import sys, os
 import pathlib
+import concurrent.futures as conc
+import socket
+import stat
+import socketserver
+import threading
 
 def get_meson_info_file(info_dir: str):
     return os.path.join(info_dir, 'meson-info.json')
@@ -89,6 +95,10 @@ def add_arguments(parser):
 
     parser.add_argument('--target-files', action='store', dest='target_files', default=None,
                         help='List source files for a given target.')
+    parser.add_argument('--target-id', action='append', dest='target_ids', default=[],
+                        help='Only list the target with this ID with --targets (can be repeated).')
+    parser.add_argument('--target-subdir', action='append', dest='target_subdirs', default=[],
+                        help='Only list targets defined in this subdir with --targets (can be repeated).')
     parser.add_argument('--backend', choices=cdata.backendlist, dest='backend', default='ninja',
                         help='The backend to use for the --buildoptions introspection.')
     parser.add_argument('-a', '--all', action='store_true', dest='all', default=False,
@@ -97,6 +107,15 @@ def add_arguments(parser):
                         help='Enable pretty printed JSON.')
     parser.add_argument('-f', '--force-object-output', action='store_true', dest='force_dict', default=False,
                         help='Always use the new JSON format for multiple entries (even for 0 and 1 introspection commands)')
+    parser.add_argument('--serve', action='store_true', dest='serve', default=False,
+                        help='Keep running and answer JSON-RPC requests on stdin (one per line).')
+    parser.add_argument('--socket', action='store', dest='socket', default=None,
+                        help='Listen on this Unix socket instead of stdin in --serve mode.')
+    parser.add_argument('--batch', nargs='+', dest='batch', default=None, metavar='SOURCEDIR',
+                        help='Introspect the build files of these source directories in parallel '
+                             'and print one JSON object per line.')
+    parser.add_argument('-j', '--jobs', type=int, dest='jobs', default=None,
+                        help='Number of processes to use with --batch (default: number of CPUs).')
     parser.add_argument('builddir', nargs='?', default='.', help='The build directory')
 
 def list_installed(installdata):
@@ -146,7 +165,15 @@ def list_targets(builddata: build.Build, installdata, backend: backends.Backend)
         tlist.append(t)
     return tlist
 
-def list_buildoptions_from_source(sourcedir, backend, indent):
+# The introspection types that only need the build files, in the order
+# they are looked for when introspecting a source directory
+source_intro_types = ['projectinfo', 'buildoptions', 'targets', 'dependencies']
+
+def introspect_source(sourcedir, backend, types):
+    '''
+    Returns a dict with the @types of source_intro_types for the project in
+    @sourcedir. The build files are only analyzed once for all of them.
+    '''
     # Make sure that log entries in other parts of meson don't interfere with the JSON output
     mlog.disable()
     backend = backends.get_backend_from_name(backend, None)
@@ -154,7 +181,46 @@ def list_buildoptions_from_source(sourcedir, backend, indent):
     intr.analyze()
     # Reenable logging just in case
     mlog.enable()
-    print(json.dumps(list_buildoptions(intr.coredata), indent=indent))
+    result = {}
+    if 'projectinfo' in types:
+        result['projectinfo'] = get_projinfo_from_source(sourcedir, intr)
+    if 'buildoptions' in types:
+        result['buildoptions'] = list_buildoptions(intr.coredata)
+    if 'targets' in types:
+        keys = ['name', 'id', 'type', 'defined_in', 'subdir', 'build_by_default']
+        result['targets'] = [{k: t[k] for k in keys} for t in intr.targets]
+    if 'dependencies' in types:
+        result['dependencies'] = [{'name': d['name']} for d in intr.dependencies]
+    return result
+
+def introspect_source_job(sourcedir, backend, types):
+    if os.path.basename(sourcedir) == 'meson.build':
+        sourcedir = os.path.dirname(sourcedir) or '.'
+    result = {'sourcedir': sourcedir, 'error': None}
+    # Report the error of one project instead of aborting the whole batch
+    try:
+        result.update(introspect_source(sourcedir, backend, types))
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    return result
+
+def run_source_batch(options):
+    types = [i for i in source_intro_types if options.all or getattr(options, i, False)]
+    if not types:
+        print('No command specified, only {} can be used with --batch'.format(
+              ', '.join('--' + i for i in source_intro_types)))
+        return 1
+    returncode = 0
+    with conc.ProcessPoolExecutor(max_workers=options.jobs) as executor:
+        futures = [executor.submit(introspect_source_job, d, options.backend, types)
+                   for d in options.batch]
+        # Print every result as soon as it is ready
+        for f in conc.as_completed(futures):
+            result = f.result()
+            if result['error'] is not None:
+                returncode = 1
+            print(json.dumps(result), flush=True)
+    return returncode
 
 def list_target_files(target_name: str, targets: list, source_dir: str):
     sys.stderr.write("WARNING: The --target-files introspection API is deprecated. Use --targets instead.\n")
@@ -297,45 +363,25 @@ def list_projinfo(builddata: build.Build):
     result['subprojects'] = subprojects
     return result
 
-def list_projinfo_from_source(sourcedir, indent):
+def get_projinfo_from_source(sourcedir, intr):
     files = find_buildsystem_files_list(sourcedir)
     files = [os.path.normpath(x) for x in files]
 
-    mlog.disable()
-    intr = IntrospectionInterpreter(sourcedir, '', 'ninja')
-    intr.analyze()
-    mlog.enable()
-
     for i in intr.project_data['subprojects']:
         basedir = os.path.join(intr.subproject_dir, i['name'])
         i['buildsystem_files'] = [x for x in files if x.startswith(basedir)]
         files = [x for x in files if not x.startswith(basedir)]
 
     intr.project_data['buildsystem_files'] = files
-    print(json.dumps(intr.project_data, indent=indent))
+    return intr.project_data
 
-def run(options):
-    datadir = 'meson-private'
-    infodir = 'meson-info'
-    indent = 4 if options.indent else None
-    if options.builddir is not None:
-        datadir = os.path.join(options.builddir, datadir)
-        infodir = os.path.join(options.builddir, infodir)
-    if 'meson.build' in [os.path.basename(options.builddir), options.builddir]:
-        sourcedir = '.' if options.builddir == 'meson.build' else options.builddir[:-11]
-        if options.projectinfo:
-            list_projinfo_from_source(sourcedir, indent)
-            return 0
-        if options.buildoptions:
-            list_buildoptions_from_source(sourcedir, options.backend, indent)
-            return 0
-    infofile = get_meson_info_file(infodir)
+def check_meson_info(datadir, infodir, infofile):
     if not os.path.isdir(datadir) or not os.path.isdir(infodir) or not os.path.isfile(infofile):
         print('Current directory is not a meson build directory.'
               'Please specify a valid build dir or change the working directory to it.'
               'It is also possible that the build directory was generated with an old'
               'meson version. Please regenerate it in this case.')
-        return 1
+        return False
 
     intro_vers = '0.0.0'
     source_dir = None
@@ -350,7 +396,32 @@ def run(options):
             print('Introspection version {} is not supported. '
                   'The required version is: {}'
                   .format(intro_vers, ' and '.join(vers_to_check)))
-            return 1
+            return False
+    return source_dir
+
+def run(options):
+    datadir = 'meson-private'
+    infodir = 'meson-info'
+    indent = 4 if options.indent else None
+    if options.builddir is not None:
+        datadir = os.path.join(options.builddir, datadir)
+        infodir = os.path.join(options.builddir, infodir)
+    if options.batch is not None:
+        return run_source_batch(options)
+    if 'meson.build' in [os.path.basename(options.builddir), options.builddir]:
+        sourcedir = '.' if options.builddir == 'meson.build' else options.builddir[:-11]
+        for i in source_intro_types:
+            if getattr(options, i, False):
+                result = introspect_source(sourcedir, options.backend, [i])
+                print(json.dumps(result[i], indent=indent))
+                return 0
+    infofile = get_meson_info_file(infodir)
+    source_dir = check_meson_info(datadir, infodir, infofile)
+    if source_dir is False:
+        return 1
+
+    if options.serve:
+        return serve(infodir, options.socket)
 
     results = []
     intro_types = get_meson_introspection_types()
@@ -366,6 +437,9 @@ def run(options):
     for i in intro_types.keys():
         if not options.all and not getattr(options, i, False):
             continue
+        if i == 'targets' and (options.target_ids or options.target_subdirs):
+            results += [(i, load_target_shards(infodir, options.target_ids, options.target_subdirs))]
+            continue
         curr = os.path.join(infodir, 'intro-{}.json'.format(i))
         if not os.path.isfile(curr):
             print('Introspection file {} does not exist.'.format(curr))
@@ -386,28 +460,263 @@ def run(options):
         print(json.dumps(out, indent=indent))
     return 0
 
+class IntrospectionCache:
+    '''Keeps the parsed introspection files of a build directory in memory.
+
+    Every file is reloaded on access only if it was rewritten since it was
+    last read, so a regeneration of the build directory only costs parsing
+    the files that actually changed.'''
+
+    def __init__(self, infodir):
+        self.infodir = infodir
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        fname = os.path.join(self.infodir, name)
+        with self.lock:
+            st = os.stat(fname)
+            stamp = (st.st_mtime_ns, st.st_size)
+            cached = self.entries.get(name)
+            if cached is None or cached[0] != stamp:
+                with open(fname, 'r') as fp:
+                    cached = (stamp, json.load(fp))
+                self.entries[name] = cached
+            return cached[1]
+
+    def get_intro(self, key):
+        return self.get('intro-{}.json'.format(key))
+
+    def get_meson_info(self):
+        return self.get(os.path.basename(get_meson_info_file(self.infodir)))
+
+class IntrospectionRPCError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+def rpc_target_files(cache, params):
+    if not isinstance(params, dict) or 'target' not in params:
+        raise IntrospectionRPCError(-32602, 'target_files requires a "target" parameter')
+    source_dir = cache.get_meson_info()['directories']['source']
+    for i in cache.get_intro('targets'):
+        if i['id'] == params['target']:
+            result = []
+            for j in i['target_sources']:
+                result += j['sources'] + j['generated_sources']
+            return [os.path.relpath(x, source_dir) for x in result]
+    raise IntrospectionRPCError(-32602, 'Target with the ID "{}" could not be found'.format(params['target']))
+
+def rpc_targets(cache, params):
+    if isinstance(params, dict) and (params.get('ids') or params.get('subdirs')):
+        for key in ('ids', 'subdirs'):
+            value = params.get(key, [])
+            if not isinstance(value, list) or not all(isinstance(x, str) for x in value):
+                raise IntrospectionRPCError(-32602, 'targets parameter "{}" must be a list of strings'.format(key))
+        return load_target_shards(cache.infodir, params.get('ids', []), params.get('subdirs', []))
+    return cache.get_intro('targets')
+
+def rpc_all(cache, params):
+    return {k: cache.get_intro(k) for k in get_meson_introspection_types()}
+
+def get_rpc_methods():
+    methods = {k: (lambda cache, params, key=k: cache.get_intro(key))
+               for k in get_meson_introspection_types()}
+    methods['all'] = rpc_all
+    methods['targets'] = rpc_targets
+    methods['meson_info'] = lambda cache, params: cache.get_meson_info()
+    methods['target_files'] = rpc_target_files
+    return methods
+
+def handle_rpc_request(cache, methods, line):
+    '''Processes one JSON-RPC 2.0 request and returns the response object,
+    or None if the request was a notification.'''
+    try:
+        req = json.loads(line)
+    except ValueError:
+        return {'jsonrpc': '2.0', 'id': None, 'error': {'code': -32700, 'message': 'Parse error'}}
+    if not isinstance(req, dict) or not isinstance(req.get('method'), str):
+        return {'jsonrpc': '2.0', 'id': None, 'error': {'code': -32600, 'message': 'Invalid request'}}
+    is_notification = 'id' not in req
+    response = {'jsonrpc': '2.0', 'id': req.get('id')}
+    try:
+        if req['method'] not in methods:
+            raise IntrospectionRPCError(-32601, 'Method not found: {}'.format(req['method']))
+        response['result'] = methods[req['method']](cache, req.get('params'))
+    except IntrospectionRPCError as e:
+        response['error'] = {'code': e.code, 'message': e.message}
+    except (OSError, ValueError) as e:
+        response['error'] = {'code': -32000, 'message': str(e)}
+    except Exception as e:
+        # A broken request must not take down the server
+        response['error'] = {'code': -32603, 'message': 'Internal error: {}'.format(e)}
+    if is_notification:
+        return None
+    return response
+
+def serve_stream(cache, methods, instream, outstream, binary=False):
+    for line in instream:
+        if binary:
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        response = handle_rpc_request(cache, methods, line)
+        if response is None:
+            continue
+        data = json.dumps(response) + '\n'
+        outstream.write(data.encode('utf-8') if binary else data)
+        outstream.flush()
+
+def serve(infodir, socket_path=None):
+    cache = IntrospectionCache(infodir)
+    methods = get_rpc_methods()
+    # Make sure that log entries in other parts of meson don't interfere with the JSON output
+    mlog.disable()
+    if socket_path is None:
+        serve_stream(cache, methods, sys.stdin, sys.stdout)
+        return 0
+
+    if not hasattr(socket, 'AF_UNIX'):
+        raise mesonlib.MesonException('Unix sockets are not supported on this platform.')
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            serve_stream(cache, methods, self.rfile, self.wfile, binary=True)
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    if os.path.exists(socket_path):
+        # Only replace a stale socket, never some other file
+        if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            raise mesonlib.MesonException('{!r} exists and is not a socket.'.format(socket_path))
+        os.unlink(socket_path)
+    server = Server(socket_path, RequestHandler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+    return 0
+
 updated_introspection_files = []
 
 def write_intro_info(intro_info, info_dir):
-    global updated_introspection_files
     for i in intro_info:
-        out_file = os.path.join(info_dir, 'intro-{}.json'.format(i[0]))
-        tmp_file = os.path.join(info_dir, 'tmp_dump.json')
-        with open(tmp_file, 'w') as fp:
-            json.dump(i[1], fp)
-            fp.flush() # Not sure if this is needed
-        os.replace(tmp_file, out_file)
-        updated_introspection_files += [i[0]]
+        write_intro_data(i[0], json.dumps(i[1]), info_dir)
+
+def write_intro_data(key, data, info_dir):
+    '''Writes the already serialized JSON @data of the introspection type @key.'''
+    global updated_introspection_files
+    out_file = os.path.join(info_dir, 'intro-{}.json'.format(key))
+    tmp_file = os.path.join(info_dir, 'tmp_dump.json')
+    with open(tmp_file, 'w') as fp:
+        fp.write(data)
+        fp.flush() # Not sure if this is needed
+    os.replace(tmp_file, out_file)
+    updated_introspection_files += [key]
+
+def get_target_shard_dir(info_dir):
+    return os.path.join(info_dir, 'targets')
+
+def get_target_shard_index_file(info_dir):
+    return os.path.join(get_target_shard_dir(info_dir), 'index.json')
+
+def load_target_shard_index(info_dir):
+    try:
+        with open(get_target_shard_index_file(info_dir), 'r') as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+def write_target_shards(targets: list, builddata: build.Build, info_dir):
+    '''Writes every target of intro-targets.json into its own file.
+
+    A small index file maps target IDs to their shard. Shards whose
+    content did not change keep their old file (and timestamp), so that
+    tools watching the directory only need to reload what changed.
+    Returns the serialized targets, so intro-targets.json can be written
+    without serializing them again.'''
+    shard_dir = get_target_shard_dir(info_dir)
+    os.makedirs(shard_dir, exist_ok=True)
+    old_index = load_target_shard_index(info_dir) or []
+    old_hashes = {i['id']: i['hash'] for i in old_index}
+    build_targets = builddata.get_targets()
+    index = []
+    dumped = []
+    for t in targets:
+        data = json.dumps(t)
+        dumped.append(data)
+        digest = hashlib.sha1(data.encode('utf-8')).hexdigest()
+        fname = t['id'] + '.json'
+        shard_file = os.path.join(shard_dir, fname)
+        if old_hashes.get(t['id']) != digest or not os.path.isfile(shard_file):
+            tmp_file = os.path.join(shard_dir, 'tmp_dump.json')
+            with open(tmp_file, 'w') as fp:
+                fp.write(data)
+            os.replace(tmp_file, shard_file)
+        index.append({
+            'id': t['id'],
+            'name': t['name'],
+            'type': t['type'],
+            'subdir': build_targets[t['id']].subdir,
+            'file': fname,
+            'hash': digest,
+        })
+    new_ids = {i['id'] for i in index}
+    for i in old_index:
+        if i['id'] not in new_ids:
+            mesonlib.windows_proof_rm(os.path.join(shard_dir, i['file']))
+    index_file = get_target_shard_index_file(info_dir)
+    tmp_file = index_file + '~'
+    with open(tmp_file, 'w') as fp:
+        json.dump(index, fp)
+    mesonlib.replace_if_different(index_file, tmp_file)
+    return dumped
+
+def load_target_shards(info_dir, target_ids, subdirs):
+    '''Returns the introspection data of all targets matching one of the
+    given IDs or subdirs, reading only the shards that are needed.'''
+    def norm_subdir(subdir):
+        return os.path.normpath(subdir or '.')
+
+    subdirs = [norm_subdir(x) for x in subdirs]
+    index = load_target_shard_index(info_dir)
+    if index is None:
+        # Build directory from before sharding, filter the full list instead
+        with open(get_meson_info_file(info_dir), 'r') as fp:
+            src_dir = json.load(fp)['directories']['source']
+        with open(os.path.join(info_dir, 'intro-targets.json'), 'r') as fp:
+            targets = json.load(fp)
+        return [t for t in targets if t['id'] in target_ids or
+                norm_subdir(os.path.relpath(os.path.dirname(t['defined_in']), src_dir)) in subdirs]
+    result = []
+    shard_dir = get_target_shard_dir(info_dir)
+    for i in index:
+        if i['id'] in target_ids or norm_subdir(i['subdir']) in subdirs:
+            with open(os.path.join(shard_dir, i['file']), 'r') as fp:
+                result.append(json.load(fp))
+    return result
 
 def generate_introspection_file(builddata: build.Build, backend: backends.Backend):
     coredata = builddata.environment.get_coredata()
     intro_types = get_meson_introspection_types(coredata=coredata, builddata=builddata, backend=backend)
+    info_dir = builddata.environment.info_dir
     intro_info = []
 
     for key, val in intro_types.items():
+        if key == 'targets':
+            continue
         intro_info += [(key, val['func']())]
 
-    write_intro_info(intro_info, builddata.environment.info_dir)
+    write_intro_info(intro_info, info_dir)
+    # Every target is serialized once for its shard, intro-targets.json is
+    # put together from the same strings.
+    dumped = write_target_shards(intro_types['targets']['func'](), builddata, info_dir)
+    write_intro_data('targets', '[' + ', '.join(dumped) + ']', info_dir)
 
 def update_build_options(coredata: cdata.CoreData, info_dir):
     intro_info = [
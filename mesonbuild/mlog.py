@@ -48,6 +48,12 @@ log_depth = 0
 log_timestamp_start = None
 log_fatal_warnings = False
 log_disable_stdout = False
+# Amount of detail written to the log file. 'info' only gets what is
+# also printed to the console, 'debug' adds debug() messages and
+# 'verbose' adds the bulky details logged with verbose(), such as the
+# code, command line and output of every compiler check.
+log_levels = ('info', 'debug', 'verbose')
+log_level = len(log_levels) - 1
 
 def disable():
     global log_disable_stdout
@@ -57,11 +63,26 @@ def enable():
     global log_disable_stdout
     log_disable_stdout = False
 
-def initialize(logdir, fatal_warnings=False):
+def initialize(logdir, fatal_warnings=False, level='verbose'):
     global log_dir, log_file, log_fatal_warnings
     log_dir = logdir
-    log_file = open(os.path.join(logdir, log_fname), 'w', encoding='utf8')
+    # The log file is not flushed after every line, only at the points
+    # where it matters, see flush().
+    log_file = open(os.path.join(logdir, log_fname), 'w', encoding='utf8',
+                    buffering=64 * 1024)
     log_fatal_warnings = fatal_warnings
+    set_log_level(level)
+
+def set_log_level(level):
+    global log_level
+    log_level = log_levels.index(level)
+
+def flush():
+    '''Writes out buffered log file contents. Called when warnings and
+    errors are logged, and before handing control to a subprocess that
+    may take a long time or never return.'''
+    if log_file is not None:
+        log_file.flush()
 
 def set_timestamp_start(start):
     global log_timestamp_start
@@ -93,6 +114,16 @@ class AnsiDecorator:
             text = '"{}"'.format(text)
         return text
 
+class CommandLine:
+    '''Joins the words of a command line only when it is written to the
+    log, so that filtered out debug() and verbose() calls stay cheap.'''
+
+    def __init__(self, args):
+        self.args = args
+
+    def __str__(self):
+        return ' '.join(self.args)
+
 def bold(text, quoted=False):
     return AnsiDecorator(text, "\033[1m", quoted=quoted)
 
@@ -146,19 +177,22 @@ def force_print(*args, **kwargs):
         cleaned = raw.encode('ascii', 'replace').decode('ascii')
         print(cleaned, end='')
 
-def debug(*args, **kwargs):
+def _log_to_file(level, args, kwargs):
+    # Arguments are only converted to strings if they end up in the file
+    if log_file is None or log_level < level:
+        return
     arr = process_markup(args, False)
-    if log_file is not None:
-        print(*arr, file=log_file, **kwargs) # Log file never gets ANSI codes.
-        log_file.flush()
+    print(*arr, file=log_file, **kwargs) # Log file never gets ANSI codes.
+
+def debug(*args, **kwargs):
+    _log_to_file(1, args, kwargs)
+
+def verbose(*args, **kwargs):
+    _log_to_file(2, args, kwargs)
 
 def log(*args, **kwargs):
-    arr = process_markup(args, False)
-    if log_file is not None:
-        print(*arr, file=log_file, **kwargs) # Log file never gets ANSI codes.
-        log_file.flush()
-    if colorize_console:
-        arr = process_markup(args, True)
+    _log_to_file(0, args, kwargs)
+    arr = process_markup(args, colorize_console)
     force_print(*arr, **kwargs)
 
 def _log_error(severity, *args, **kwargs):
@@ -181,6 +215,7 @@ def _log_error(severity, *args, **kwargs):
         args = (location_str,) + args
 
     log(*args, **kwargs)
+    flush()
 
     global log_fatal_warnings
     if log_fatal_warnings:
@@ -204,6 +239,7 @@ def exception(e, prefix=red('ERROR:')):
         args.append(prefix)
     args.append(e)
     log(*args)
+    flush()
 
 # Format a list for logging purposes as a string. It separates
 # all but the last item with commas, and the last with 'and'.
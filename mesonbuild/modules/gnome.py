@@ -20,7 +20,9 @@ import re
 import sys
 import copy
 import shlex
+import hashlib
 import subprocess
+import xml.etree.ElementTree as ET
 
 from .. import build
 from .. import mlog
@@ -51,6 +53,26 @@ girwarning_printed = False
 gdbuswarning_printed = False
 gresource_warning_printed = False
 _gir_has_option = {}
+_gresource_files = {}
+
+def get_gresource_files(xml_file):
+    '''Returns the files listed in a gresource XML file. Parsed files are
+    cached on the hash of their content.'''
+    with open(xml_file, 'rb') as f:
+        content = f.read()
+    key = hashlib.sha1(content).hexdigest()
+    if key not in _gresource_files:
+        try:
+            root = ET.fromstring(content)
+        except ET.ParseError as e:
+            raise MesonException('Could not parse {}: {}'.format(xml_file, e))
+        files = []
+        for element in root.iter('file'):
+            if not element.text:
+                raise MesonException('Empty <file> element in {}'.format(xml_file))
+            files.append(element.text)
+        _gresource_files[key] = files
+    return _gresource_files[key]
 
 def gir_has_option(intr_obj, option):
     global _gir_has_option
@@ -355,69 +377,55 @@ class GnomeModule(ExtensionModule):
         return ModuleReturnValue(rv1, rv2)
 
     def _get_gresource_dependencies(self, state, input_file, source_dirs, dependencies):
-
-        cmd = ['glib-compile-resources',
-               input_file,
-               '--generate-dependencies']
-
-        # Prefer generated files over source files
-        cmd += ['--sourcedir', state.subdir] # Current build dir
+        srcdir = state.environment.get_source_dir()
+        # Prefer generated files over source files, like
+        # glib-compile-resources --generate-dependencies does when it is run
+        # in the source dir with these source dirs.
+        search_dirs = [state.subdir] # Current build dir
         for source_dir in source_dirs:
-            cmd += ['--sourcedir', os.path.join(state.subdir, source_dir)]
-
-        pc, stdout, stderr = Popen_safe(cmd, cwd=state.environment.get_source_dir())
-        if pc.returncode != 0:
-            m = 'glib-compile-resources failed to get dependencies for {}:\n{}'
-            mlog.warning(m.format(cmd[1], stderr))
-            raise subprocess.CalledProcessError(pc.returncode, cmd)
+            search_dirs.append(os.path.join(state.subdir, source_dir))
 
-        dep_files = stdout.split('\n')[:-1]
+        # Index the generated files by basename. If several of them have the
+        # same basename the first one wins.
+        generated = {}
+        for dep in dependencies:
+            if hasattr(dep, 'held_object'):
+                dep = dep.held_object
+            if isinstance(dep, mesonlib.File):
+                generated.setdefault(dep.fname, dep)
+            elif isinstance(dep, (build.CustomTarget, build.CustomTargetIndex)):
+                for o in dep.get_outputs():
+                    generated.setdefault(os.path.basename(o), dep)
 
+        dep_files = []
         depends = []
         subdirs = []
-        for resfile in dep_files[:]:
-            resbasename = os.path.basename(resfile)
-            for dep in dependencies:
-                if hasattr(dep, 'held_object'):
-                    dep = dep.held_object
-                if isinstance(dep, mesonlib.File):
-                    if dep.fname != resbasename:
-                        continue
-                    dep_files.remove(resfile)
-                    dep_files.append(dep)
-                    subdirs.append(dep.subdir)
+        for fname in get_gresource_files(os.path.join(srcdir, input_file)):
+            # Missing files are kept as listed in the input file, that is how
+            # files generated as part of the build are found.
+            resfile = fname
+            for search_dir in search_dirs:
+                if os.path.exists(os.path.join(srcdir, search_dir, fname)):
+                    resfile = os.path.join(search_dir, fname)
                     break
-                elif isinstance(dep, (build.CustomTarget, build.CustomTargetIndex)):
-                    fname = None
-                    outputs = {(o, os.path.basename(o)) for o in dep.get_outputs()}
-                    for o, baseo in outputs:
-                        if baseo == resbasename:
-                            fname = o
-                            break
-                    if fname is not None:
-                        dep_files.remove(resfile)
-                        depends.append(dep)
-                        subdirs.append(dep.get_subdir())
-                        break
+            dep = generated.get(os.path.basename(resfile))
+            if isinstance(dep, mesonlib.File):
+                dep_files.append(dep)
+                subdirs.append(dep.subdir)
+            elif dep is not None:
+                depends.append(dep)
+                subdirs.append(dep.get_subdir())
             else:
-                # In generate-dependencies mode, glib-compile-resources doesn't raise
-                # an error for missing resources but instead prints whatever filename
-                # was listed in the input file.  That's good because it means we can
-                # handle resource files that get generated as part of the build, as
-                # follows.
-                #
                 # If there are multiple generated resource files with the same basename
                 # then this code will get confused.
                 try:
-                    f = mesonlib.File.from_source_file(state.environment.get_source_dir(),
-                                                       ".", resfile)
+                    f = mesonlib.File.from_source_file(srcdir, ".", resfile)
                 except MesonException:
                     raise MesonException(
                         'Resource "%s" listed in "%s" was not found. If this is a '
                         'generated file, pass the target that generates it to '
                         'gnome.compile_resources() using the "dependencies" '
                         'keyword argument.' % (resfile, input_file))
-                dep_files.remove(resfile)
                 dep_files.append(f)
         return dep_files, depends, subdirs
 
@@ -22,7 +22,7 @@ import argparse
 
 from . import environment, interpreter, mesonlib
 from . import build
-from . import mlog, coredata
+from . import mlog, mtrace, coredata
 from . import mintro
 from .mconf import make_lower_case
 from .mesonlib import MesonException
@@ -39,6 +39,9 @@ def add_arguments(parser):
                         version=coredata.version)
     parser.add_argument('--profile-self', action='store_true', dest='profile',
                         help=argparse.SUPPRESS)
+    parser.add_argument('--trace', action='store_true',
+                        help='Write a trace of the time spent configuring the project to ' +
+                             'meson-logs/meson-trace.json and print the slowest steps.')
     parser.add_argument('--fatal-meson-warnings', action='store_true', dest='fatal_warnings',
                         help='Make all Meson warnings fatal')
     parser.add_argument('--reconfigure', action='store_true',
@@ -156,11 +159,27 @@ class MesonApp:
 
     def generate(self):
         env = environment.Environment(self.source_dir, self.build_dir, self.options)
-        mlog.initialize(env.get_log_dir(), self.options.fatal_warnings)
+        # The stored value is used when regenerating
+        log_level = env.cmd_line_options.get('log_level', env.coredata.get_builtin_option('log_level'))
+        mlog.initialize(env.get_log_dir(), self.options.fatal_warnings, log_level)
         if self.options.profile:
             mlog.set_timestamp_start(time.monotonic())
-        with mesonlib.BuildDirLock(self.build_dir):
-            self._generate(env)
+        if self.options.trace:
+            mtrace.initialize()
+        try:
+            with mesonlib.BuildDirLock(self.build_dir):
+                self._generate(env)
+        finally:
+            if self.options.trace:
+                self.finish_trace(env)
+                mtrace.shutdown()
+
+    def finish_trace(self, env):
+        fname = mtrace.write(env.get_log_dir())
+        mlog.log('Slowest configure steps:')
+        for category, name, duration in mtrace.get_slowest(10):
+            mlog.log('  {:>8.3f}s  {:<20} {}'.format(duration, category, name))
+        mlog.log('Full trace written to', mlog.bold(fname))
 
     def _generate(self, env):
         mlog.debug('Build started at', datetime.datetime.now().isoformat())
@@ -190,7 +209,8 @@ class MesonApp:
                 fname = os.path.join(self.build_dir, 'meson-private', 'profile-interpreter.log')
                 profile.runctx('intr.run()', globals(), locals(), filename=fname)
             else:
-                intr.run()
+                with mtrace.span('interpreter', 'phase'):
+                    intr.run()
         except Exception as e:
             mintro.write_meson_info_file(b, [e])
             raise
@@ -213,8 +233,10 @@ class MesonApp:
                 fname = os.path.join(self.build_dir, 'meson-private', fname)
                 profile.runctx('intr.backend.generate(intr)', globals(), locals(), filename=fname)
             else:
-                intr.backend.generate(intr)
-            build.save(b, dumpfile)
+                with mtrace.span('backend ' + intr.backend.name, 'phase'):
+                    intr.backend.generate(intr)
+            with mtrace.span('save build data', 'phase'):
+                build.save(b, dumpfile)
             # Post-conf scripts must be run after writing coredata or else introspection fails.
             intr.backend.run_postconf_scripts()
             if env.first_invocation:
@@ -227,7 +249,8 @@ class MesonApp:
                 fname = os.path.join(self.build_dir, 'meson-private', 'profile-introspector.log')
                 profile.runctx('mintro.generate_introspection_file(b, intr.backend)', globals(), locals(), filename=fname)
             else:
-                mintro.generate_introspection_file(b, intr.backend)
+                with mtrace.span('introspection', 'phase'):
+                    mintro.generate_introspection_file(b, intr.backend)
             mintro.write_meson_info_file(b, [], True)
         except Exception as e:
             mintro.write_meson_info_file(b, [e])
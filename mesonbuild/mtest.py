@@ -17,6 +17,7 @@
 import shlex
 import subprocess, sys, os, argparse
 import pickle
+import hashlib
 from mesonbuild import build
 from mesonbuild import environment
 from mesonbuild.dependencies import ExternalProgram
@@ -29,6 +30,9 @@ import concurrent.futures as conc
 import platform
 import signal
 import random
+import math
+import statistics
+import threading
 from copy import deepcopy
 import enum
 
@@ -61,6 +65,12 @@ def determine_worker_count():
             num_workers = 1
     return num_workers
 
+def cpu_list(value):
+    try:
+        return {int(c) for c in value.split(',')}
+    except ValueError:
+        raise argparse.ArgumentTypeError('Invalid CPU list {!r}'.format(value))
+
 def add_arguments(parser):
     parser.add_argument('--repeat', default=1, dest='repeat', type=int,
                         help='Number of times to run the tests.')
@@ -84,6 +94,19 @@ def add_arguments(parser):
                         help="Whether to print failing tests' logs.")
     parser.add_argument('--benchmark', default=False, action='store_true',
                         help="Run benchmarks instead of tests.")
+    parser.add_argument('--benchmark-warmup', default=0, type=int, metavar='N',
+                        help='Number of untimed runs before timing each benchmark.')
+    parser.add_argument('--benchmark-runs', default=1, type=int, metavar='N',
+                        help='Number of timed runs of each benchmark.')
+    parser.add_argument('--benchmark-cpus', default=None, type=cpu_list, metavar='CPUS',
+                        help='Comma separated list of CPUs to run benchmarks on (Linux only).')
+    parser.add_argument('--compare', default=None, metavar='JSONLOG',
+                        help='Fail if benchmarks are significantly slower than in the JSON log of an earlier run.')
+    parser.add_argument('--compare-threshold', default=5.0, type=float, metavar='PERCENT',
+                        help='Smallest slowdown of the median that counts as a regression (default: 5).')
+    parser.add_argument('--cache', default=False, action='store_true',
+                        help='Skip tests that passed in an earlier run with --cache and whose executables, '
+                        'libraries, arguments and environment did not change.')
     parser.add_argument('--logbase', default='testlog',
                         help="Base name for log file.")
     parser.add_argument('--num-processes', default=determine_worker_count(), type=int,
@@ -150,9 +173,12 @@ class TestResult(enum.Enum):
 
 class TestRun:
     def __init__(self, res, returncode, should_fail, duration, stdo, stde, cmd,
-                 env):
+                 env, rusage=None):
         assert isinstance(res, TestResult)
         self.res = res
+        self.rusage = rusage
+        self.benchmark = None
+        self.cached = False
         self.returncode = returncode
         self.duration = duration
         self.stdo = stdo
@@ -181,6 +207,118 @@ class TestRun:
         res += '-------\n\n'
         return res
 
+class BenchmarkStats:
+    '''Statistics of the timed runs of a benchmark.'''
+    def __init__(self, runs, warmup):
+        self.warmup = warmup
+        self.durations = [r.duration for r in runs]
+        self.min = min(self.durations)
+        self.median = statistics.median(self.durations)
+        self.mean = statistics.mean(self.durations)
+        self.stddev = statistics.stdev(self.durations) if len(self.durations) > 1 else 0.0
+        rusages = [r.rusage for r in runs if r.rusage is not None]
+        self.user_time = [r.ru_utime for r in rusages]
+        self.system_time = [r.ru_stime for r in rusages]
+        # ru_maxrss is in bytes on macOS and in KiB elsewhere
+        rss_scale = 1024 if sys.platform == 'darwin' else 1
+        self.max_rss = [r.ru_maxrss // rss_scale for r in rusages]
+        self.baseline_median = None
+        self.regression = False
+
+    def get_summary(self):
+        summary = 'min %.4f s, stddev %.4f s, %d runs' % (self.min, self.stddev, len(self.durations))
+        if self.max_rss:
+            summary += ', max RSS %d KiB' % max(self.max_rss)
+        if self.baseline_median is not None:
+            change = (self.median / self.baseline_median - 1) * 100 if self.baseline_median else 0
+            summary += ', %+.1f%% vs baseline' % change
+        return summary
+
+    def to_json(self):
+        return {'warmup': self.warmup,
+                'durations': self.durations,
+                'min': self.min,
+                'median': self.median,
+                'mean': self.mean,
+                'stddev': self.stddev,
+                'user_time': self.user_time,
+                'system_time': self.system_time,
+                'max_rss_kib': self.max_rss,
+                'baseline_median': self.baseline_median,
+                'regression': self.regression}
+
+# One sided critical values of Student's t distribution for p = 0.05 by
+# degrees of freedom, from 1 to 30.
+T_CRITICAL = [6.314, 2.920, 2.353, 2.132, 2.015, 1.943, 1.895, 1.860, 1.833, 1.812,
+              1.796, 1.782, 1.771, 1.761, 1.753, 1.746, 1.740, 1.734, 1.729, 1.725,
+              1.721, 1.717, 1.714, 1.711, 1.708, 1.706, 1.703, 1.701, 1.699, 1.697]
+
+def t_critical(df):
+    if df < 1:
+        return T_CRITICAL[0]
+    if df <= len(T_CRITICAL):
+        return T_CRITICAL[int(df) - 1]
+    if df <= 60:
+        return 1.671
+    if df <= 120:
+        return 1.658
+    return 1.645
+
+def is_regression(baseline, current, threshold):
+    '''
+    Returns True if the @current durations are slower than the @baseline
+    durations by more than @threshold percent of the median, and the
+    difference is significant in Welch's t-test with p = 0.05. With fewer
+    than two runs on either side only the threshold is checked.
+    '''
+    if statistics.median(current) <= statistics.median(baseline) * (1 + threshold / 100):
+        return False
+    if len(baseline) < 2 or len(current) < 2:
+        return True
+    var_b = statistics.variance(baseline) / len(baseline)
+    var_c = statistics.variance(current) / len(current)
+    if var_b + var_c == 0:
+        return True
+    t = (statistics.mean(current) - statistics.mean(baseline)) / math.sqrt(var_b + var_c)
+    df = (var_b + var_c) ** 2 / (var_b ** 2 / (len(baseline) - 1) + var_c ** 2 / (len(current) - 1))
+    return t > t_critical(df)
+
+def load_benchmark_log(fname):
+    '''Returns the durations of the benchmarks in a JSON log by name.'''
+    baseline = {}
+    try:
+        with open(fname, encoding='utf-8') as f:
+            for line in f:
+                result = json.loads(line)
+                if 'benchmark' in result:
+                    baseline[result['name']] = result['benchmark']['durations']
+                elif result.get('result') == TestResult.OK.value:
+                    baseline[result['name']] = [result['duration']]
+    except (OSError, ValueError, KeyError) as e:
+        raise TestException('Could not read benchmark log {!r}: {}'.format(fname, e))
+    return baseline
+
+test_cache_fname = 'testcache.json'
+
+def load_test_cache(wd):
+    '''Returns the fingerprints and results of the tests that passed in
+    earlier runs with --cache, by test.'''
+    fname = os.path.join(wd, 'meson-private', test_cache_fname)
+    try:
+        with open(fname, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_test_cache(wd, cache):
+    fname = os.path.join(wd, 'meson-private', test_cache_fname)
+    with open(fname + '~', 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+    os.replace(fname + '~', fname)
+
+def get_test_cache_key(test):
+    return '{}:{}'.format(test.project_name, test.name)
+
 def decode(stream):
     if stream is None:
         return ''
@@ -202,6 +340,10 @@ def write_json_log(jsonlogfile, test_name, result):
         jresult['env'] = result.env.get_env(os.environ)
     if result.stde:
         jresult['stderr'] = result.stde
+    if result.benchmark is not None:
+        jresult['benchmark'] = result.benchmark.to_json()
+    if result.cached:
+        jresult['cached'] = True
     jsonlogfile.write(json.dumps(jresult) + '\n')
 
 def run_with_mono(fname):
@@ -209,21 +351,76 @@ def run_with_mono(fname):
         return True
     return False
 
-def load_benchmarks(build_dir):
-    datafile = os.path.join(build_dir, 'meson-private', 'meson_benchmark_setup.dat')
+class IndexedTest:
+    '''
+    The entry of a test in the test index, which has enough information to
+    select and list tests without unpickling them.
+    '''
+    def __init__(self, name, project_name, suite, offset):
+        self.name = name
+        self.project_name = project_name
+        self.suite = suite
+        self.offset = offset
+
+def get_test_data_file(build_dir, benchmark):
+    name = 'meson_benchmark_setup.dat' if benchmark else 'meson_test_setup.dat'
+    datafile = os.path.join(build_dir, 'meson-private', name)
     if not os.path.isfile(datafile):
         raise TestException('Directory ${!r} does not seem to be a Meson build directory.'.format(build_dir))
+    return datafile
+
+def load_test_data(datafile):
+    tests = []
     with open(datafile, 'rb') as f:
-        obj = pickle.load(f)
-    return obj
+        while True:
+            try:
+                obj = pickle.load(f)
+            except EOFError:
+                break
+            # Older versions pickled a list of all tests
+            if isinstance(obj, list):
+                return obj
+            tests.append(obj)
+    return tests
+
+def load_benchmarks(build_dir):
+    return load_test_data(get_test_data_file(build_dir, True))
 
 def load_tests(build_dir):
-    datafile = os.path.join(build_dir, 'meson-private', 'meson_test_setup.dat')
-    if not os.path.isfile(datafile):
-        raise TestException('Directory ${!r} does not seem to be a Meson build directory.'.format(build_dir))
+    return load_test_data(get_test_data_file(build_dir, False))
+
+def load_test_index(build_dir, benchmark):
+    '''
+    Returns the tests or benchmarks of @build_dir as IndexedTest objects,
+    or None if the build directory has no index.
+    '''
+    name = 'meson_benchmark_index.json' if benchmark else 'meson_test_index.json'
+    get_test_data_file(build_dir, benchmark)
+    try:
+        with open(os.path.join(build_dir, 'meson-private', name), encoding='utf-8') as f:
+            index = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return [IndexedTest(e['name'], e['project'], e['suite'], e['offset']) for e in index]
+
+def load_indexed_tests(datafile, indexed):
+    '''Unpickles only the tests of the @indexed entries.'''
+    tests = []
     with open(datafile, 'rb') as f:
-        obj = pickle.load(f)
-    return obj
+        for t in indexed:
+            f.seek(t.offset)
+            tests.append(pickle.load(f))
+    return tests
+
+def load_test_setups(build_dir):
+    '''Returns the test setups and the name of the default one.'''
+    try:
+        with open(os.path.join(build_dir, 'meson-private', 'meson_test_setups.dat'), 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        # Configured by an older version
+        build_data = build.load(build_dir)
+        return build_data.test_setups, build_data.test_setup_default_name
 
 
 class SingleTestRunner:
@@ -264,7 +461,94 @@ class SingleTestRunner:
             wrap = TestHarness.get_wrapper(self.options)
             if self.options.gdb:
                 self.test.timeout = None
-            return self._run_cmd(wrap + cmd + self.test.cmd_args + self.options.test_args)
+            cmd = wrap + cmd + self.test.cmd_args + self.options.test_args
+            if self.options.benchmark:
+                return self._run_benchmark(cmd)
+            return self._run_cmd(cmd)
+
+    def get_fingerprint(self):
+        '''
+        Returns a hash of everything that can change the result of the test:
+        the command, the arguments, the environment variables set for it and
+        the size and modification time of the executable, the files it uses
+        and the libraries it links to.
+        '''
+        files = []
+        for fname in self.test.fname + self.test.depends:
+            if not os.path.isabs(fname):
+                continue
+            try:
+                st = os.stat(fname)
+                files.append([fname, st.st_size, st.st_mtime_ns])
+            except OSError:
+                files.append([fname, None, None])
+        exe_runner = None
+        if self.test.exe_runner is not None:
+            exe_runner = self.test.exe_runner.get_command()
+        # Variables inherited from the environment of `meson test` are not
+        # included, otherwise the cache would only work in one shell.
+        env = sorted([k, v] for k, v in self.env.items() if os.environ.get(k) != v)
+        data = {'cmd': self.test.fname,
+                'exe_runner': exe_runner,
+                'args': self.test.cmd_args + self.options.test_args,
+                'wrapper': TestHarness.get_wrapper(self.options),
+                'env': env,
+                'workdir': self.test.workdir,
+                'should_fail': self.test.should_fail,
+                'files': files}
+        return hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+    def get_cached_result(self, entry):
+        result = TestRun(TestResult(entry['result']), entry['returncode'], self.test.should_fail,
+                         0.0, '', None, None, self.test.env)
+        result.cached = True
+        return result
+
+    def _run_benchmark(self, cmd):
+        warmup = self.options.benchmark_warmup
+        env = self.env
+        runs = []
+        for i in range(warmup + self.options.benchmark_runs):
+            self.env = env.copy()
+            result = self._run_cmd(cmd)
+            if result.res not in (TestResult.OK, TestResult.EXPECTEDFAIL):
+                return result
+            if i >= warmup:
+                runs.append(result)
+        # Keep the output of the last run for the log
+        result = runs[-1]
+        result.benchmark = BenchmarkStats(runs, warmup)
+        result.duration = result.benchmark.median
+        return result
+
+    def _wait(self, p, timeout):
+        '''
+        Waits for the process to exit like p.communicate(). For benchmarks
+        the process is waited for with os.wait4() to get its resource usage,
+        which is returned.
+        '''
+        if not self.options.benchmark or not hasattr(os, 'wait4'):
+            p.communicate(timeout=timeout)
+            return None
+        result = []
+
+        def wait4():
+            try:
+                result.append(os.wait4(p.pid, 0))
+            except ChildProcessError:
+                # Reaped by p.communicate() after a timeout
+                pass
+        waiter = threading.Thread(target=wait4)
+        waiter.start()
+        waiter.join(timeout)
+        if not result:
+            raise subprocess.TimeoutExpired(p.args, timeout)
+        _, status, rusage = result[0]
+        if os.WIFSIGNALED(status):
+            p.returncode = -os.WTERMSIG(status)
+        else:
+            p.returncode = os.WEXITSTATUS(status)
+        return rusage
 
     def _run_cmd(self, cmd):
         starttime = time.time()
@@ -320,6 +604,7 @@ class SingleTestRunner:
                              preexec_fn=preexec_fn if not is_windows() else None)
         timed_out = False
         kill_test = False
+        rusage = None
         if self.test.timeout is None:
             timeout = None
         elif self.options.timeout_multiplier is not None:
@@ -327,7 +612,7 @@ class SingleTestRunner:
         else:
             timeout = self.test.timeout
         try:
-            p.communicate(timeout=timeout)
+            rusage = self._wait(p, timeout)
         except subprocess.TimeoutExpired:
             if self.options.verbose:
                 print('%s time out (After %d seconds)' % (self.test.name, timeout))
@@ -395,7 +680,8 @@ class SingleTestRunner:
             res = TestResult.EXPECTEDFAIL if bool(p.returncode) else TestResult.UNEXPECTEDPASS
         else:
             res = TestResult.FAIL if bool(p.returncode) else TestResult.OK
-        return TestRun(res, p.returncode, self.test.should_fail, duration, stdo, stde, cmd, self.test.env)
+        return TestRun(res, p.returncode, self.test.should_fail, duration, stdo, stde, cmd, self.test.env,
+                       rusage=rusage)
 
 
 class TestHarness:
@@ -408,16 +694,26 @@ class TestHarness:
         self.success_count = 0
         self.skip_count = 0
         self.timeout_count = 0
+        self.regression_count = 0
+        self.cached_count = 0
+        self.test_cache = None
         self.is_run = False
         self.tests = None
         self.suites = None
+        self.test_setups = None
+        self.test_setup_default_name = None
         self.logfilename = None
         self.logfile = None
         self.jsonlogfile = None
-        if self.options.benchmark:
-            self.tests = load_benchmarks(options.wd)
-        else:
-            self.tests = load_tests(options.wd)
+        # Only the index is read here, the tests themselves are unpickled
+        # once they have been selected in get_tests().
+        self.datafile = get_test_data_file(options.wd, options.benchmark)
+        self.tests = load_test_index(options.wd, options.benchmark)
+        if self.tests is None:
+            self.tests = load_test_data(self.datafile)
+        self.baseline = None
+        if self.options.compare:
+            self.baseline = load_benchmark_log(self.options.compare)
         self.load_suites()
 
     def __del__(self):
@@ -428,14 +724,14 @@ class TestHarness:
 
     def merge_suite_options(self, options, test):
         if ':' in options.setup:
-            if options.setup not in self.build_data.test_setups:
+            if options.setup not in self.test_setups:
                 sys.exit("Unknown test setup '%s'." % options.setup)
-            current = self.build_data.test_setups[options.setup]
+            current = self.test_setups[options.setup]
         else:
             full_name = test.project_name + ":" + options.setup
-            if full_name not in self.build_data.test_setups:
+            if full_name not in self.test_setups:
                 sys.exit("Test setup '%s' not found from project '%s'." % (options.setup, test.project_name))
-            current = self.build_data.test_setups[full_name]
+            current = self.test_setups[full_name]
         if not options.gdb:
             options.gdb = current.gdb
         if options.gdb:
@@ -453,7 +749,7 @@ class TestHarness:
     def get_test_runner(self, test):
         options = deepcopy(self.options)
         if not options.setup:
-            options.setup = self.build_data.test_setup_default_name
+            options.setup = self.test_setup_default_name
         if options.setup:
             env = self.merge_suite_options(options, test)
         else:
@@ -480,7 +776,26 @@ class TestHarness:
         else:
             sys.exit('Unknown test result encountered: {}'.format(result.res))
 
+    def update_test_cache(self, test, fingerprint, result):
+        key = get_test_cache_key(test)
+        if result.res in (TestResult.OK, TestResult.EXPECTEDFAIL):
+            self.test_cache[key] = {'fingerprint': fingerprint,
+                                    'result': result.res.value,
+                                    'returncode': result.returncode}
+        else:
+            self.test_cache.pop(key, None)
+
+    def compare_benchmark(self, name, result):
+        if result.benchmark is None or not self.baseline or name not in self.baseline:
+            return
+        baseline = self.baseline[name]
+        result.benchmark.baseline_median = statistics.median(baseline)
+        if is_regression(baseline, result.benchmark.durations, self.options.compare_threshold):
+            result.benchmark.regression = True
+            self.regression_count += 1
+
     def print_stats(self, numlen, tests, name, result, i):
+        self.compare_benchmark(name, result)
         startpad = ' ' * (numlen - len('%d' % (i + 1)))
         num = '%s%d/%d' % (startpad, i + 1, len(tests))
         padding1 = ' ' * (38 - len(name))
@@ -489,12 +804,21 @@ class TestHarness:
 
         if result.res is TestResult.FAIL:
             status = returncode_to_status(result.returncode)
+        elif result.cached:
+            status = '(cached)'
+        elif result.benchmark is not None:
+            status = '(%s)' % result.benchmark.get_summary()
+            if result.benchmark.regression:
+                status += ' REGRESSION'
         result_str = '%s %s  %s%s%s%5.2f s %s' % \
             (num, name, padding1, result.res.value, padding2, result.duration,
              status)
         ok_statuses = (TestResult.OK, TestResult.EXPECTEDFAIL)
-        if not self.options.quiet or result.res not in ok_statuses:
-            if result.res not in ok_statuses and mlog.colorize_console:
+        regression = result.benchmark is not None and result.benchmark.regression
+        if not self.options.quiet or result.res not in ok_statuses or regression:
+            if regression and mlog.colorize_console:
+                print(mlog.red(result_str).get_text(True))
+            elif result.res not in ok_statuses and mlog.colorize_console:
                 if result.res in (TestResult.FAIL, TestResult.TIMEOUT, TestResult.UNEXPECTEDPASS):
                     decorator = mlog.red
                 elif result.res is TestResult.SKIP:
@@ -524,6 +848,10 @@ Skipped:            %4d
 Timeout:            %4d
 ''' % (self.success_count, self.expectedfail_count, self.fail_count,
             self.unexpectedpass_count, self.skip_count, self.timeout_count)
+        if self.test_cache is not None:
+            msg += 'Cached:             %4d\n' % self.cached_count
+        if self.baseline is not None:
+            msg += 'Regressions:        %4d\n' % self.regression_count
         print(msg)
         if self.logfile:
             self.logfile.write(msg)
@@ -555,7 +883,7 @@ Timeout:            %4d
         if not tests:
             return 0
         self.run_tests(tests)
-        return self.fail_count
+        return self.fail_count + self.regression_count
 
     @staticmethod
     def split_suite_string(suite):
@@ -627,6 +955,10 @@ Timeout:            %4d
             print('No suitable tests defined.')
             return []
 
+        if self.options.list:
+            return tests
+        if isinstance(tests[0], IndexedTest):
+            tests = load_indexed_tests(self.datafile, tests)
         for test in tests:
             test.rebuilt = False
 
@@ -689,31 +1021,47 @@ Timeout:            %4d
         startdir = os.getcwd()
         if self.options.wd:
             os.chdir(self.options.wd)
-        self.build_data = build.load(os.getcwd())
+        self.test_setups, self.test_setup_default_name = load_test_setups(os.getcwd())
+        if self.options.cache:
+            self.test_cache = load_test_cache(os.getcwd())
 
         try:
             for _ in range(self.options.repeat):
                 for i, test in enumerate(tests):
                     visible_name = self.get_pretty_suite(test)
                     single_test = self.get_test_runner(test)
+                    fingerprint = None
+                    if self.test_cache is not None:
+                        fingerprint = single_test.get_fingerprint()
+                        entry = self.test_cache.get(get_test_cache_key(test))
+                        if entry is not None and entry['fingerprint'] == fingerprint:
+                            res = single_test.get_cached_result(entry)
+                            self.cached_count += 1
+                            self.process_test_result(res)
+                            self.print_stats(numlen, tests, visible_name, res, i)
+                            continue
 
                     if not test.is_parallel or single_test.options.gdb:
                         self.drain_futures(futures)
                         futures = []
                         res = single_test.run()
+                        if fingerprint is not None:
+                            self.update_test_cache(test, fingerprint, res)
                         self.process_test_result(res)
                         self.print_stats(numlen, tests, visible_name, res, i)
                     else:
                         if not executor:
                             executor = conc.ThreadPoolExecutor(max_workers=self.options.num_processes)
                         f = executor.submit(single_test.run)
-                        futures.append((f, numlen, tests, visible_name, i))
+                        futures.append((f, numlen, tests, visible_name, i, test, fingerprint))
                     if self.options.repeat > 1 and self.fail_count:
                         break
                 if self.options.repeat > 1 and self.fail_count:
                     break
 
             self.drain_futures(futures)
+            if self.test_cache is not None:
+                save_test_cache(os.getcwd(), self.test_cache)
             self.print_summary()
             self.print_collected_logs()
 
@@ -724,11 +1072,13 @@ Timeout:            %4d
 
     def drain_futures(self, futures):
         for i in futures:
-            (result, numlen, tests, name, i) = i
+            (result, numlen, tests, name, i, test, fingerprint) = i
             if self.options.repeat > 1 and self.fail_count:
                 result.cancel()
             if self.options.verbose:
                 result.result()
+            if fingerprint is not None:
+                self.update_test_cache(test, fingerprint, result.result())
             self.process_test_result(result.result())
             self.print_stats(numlen, tests, name, result.result(), i)
 
@@ -740,7 +1090,7 @@ Timeout:            %4d
         if not tests:
             return 0
         self.run_tests(tests)
-        return self.fail_count
+        return self.fail_count + self.regression_count
 
 
 def list_tests(th):
@@ -758,6 +1108,13 @@ def rebuild_all(wd):
         print("Can't find ninja, can't rebuild test.")
         return False
 
+    # A dry run is quiet and tells if there is anything to rebuild at all,
+    # which is usually not the case when running tests in a loop.
+    p = subprocess.run([ninja, '-C', wd, '-n'], stdout=subprocess.PIPE,
+                       stderr=subprocess.STDOUT, universal_newlines=True)
+    if p.returncode == 0 and 'ninja: no work to do.' in p.stdout:
+        return True
+
     p = subprocess.Popen([ninja, '-C', wd])
     p.communicate()
 
@@ -775,6 +1132,27 @@ def run(options):
         print('Can not be both quiet and verbose at the same time.')
         return 1
 
+    if not options.benchmark and (options.benchmark_warmup or options.benchmark_runs != 1 or
+                                  options.benchmark_cpus or options.compare):
+        print('The --benchmark-* and --compare options can only be used with --benchmark.')
+        return 1
+    if options.cache and (options.benchmark or options.repeat > 1):
+        print('The --cache option can not be used with --benchmark or --repeat.')
+        return 1
+    if options.benchmark_runs < 1 or options.benchmark_warmup < 0:
+        print('Benchmarks must be run at least once.')
+        return 1
+    if options.benchmark_cpus:
+        if not hasattr(os, 'sched_setaffinity'):
+            print('Setting the CPUs of benchmarks is not supported on this platform.')
+            return 1
+        # Benchmarks are run one at a time and inherit the CPUs of this process
+        try:
+            os.sched_setaffinity(0, options.benchmark_cpus)
+        except OSError as e:
+            print('Could not run on CPUs {}: {}'.format(sorted(options.benchmark_cpus), e))
+            return 1
+
     check_bin = None
     if options.gdb:
         options.verbose = True
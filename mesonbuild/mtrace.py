@@ -0,0 +1,81 @@
+# Copyright 2019 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""This is a standalone module used to record how long the different
+parts of a Meson run take. The recorded spans are written in the Chrome
+trace event format, which can be opened with chrome://tracing or
+https://ui.perfetto.dev."""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+trace_fname = 'meson-trace.json'
+trace_events = None
+trace_start = None
+
+def initialize():
+    global trace_events, trace_start
+    trace_events = []
+    trace_start = time.perf_counter()
+
+def shutdown():
+    global trace_events, trace_start
+    trace_events = None
+    trace_start = None
+
+def is_enabled():
+    return trace_events is not None
+
+def add_span(name, category, start, end, args=None):
+    if trace_events is None:
+        return
+    event = {'name': name,
+             'cat': category,
+             'ph': 'X',
+             'ts': (start - trace_start) * 1e6,
+             'dur': (end - start) * 1e6,
+             'pid': os.getpid(),
+             'tid': threading.get_ident(),
+             }
+    if args:
+        event['args'] = args
+    trace_events.append(event)
+
+@contextmanager
+def span(name, category, **args):
+    '''Record the time spent in the with block. The yielded dict can be
+    used to add details that are only known at the end of the block.'''
+    if trace_events is None:
+        yield args
+        return
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        add_span(name, category, start, time.perf_counter(), args)
+
+def write(logdir):
+    fname = os.path.join(logdir, trace_fname)
+    with open(fname, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)
+    return fname
+
+def get_slowest(count, exclude_categories=('phase',)):
+    '''Returns the @count slowest spans as (category, name, seconds).'''
+    events = [e for e in trace_events if e['cat'] not in exclude_categories]
+    events.sort(key=lambda e: e['dur'], reverse=True)
+    return [(e['cat'], e['name'], e['dur'] / 1e6) for e in events[:count]]
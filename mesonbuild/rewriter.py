@@ -28,8 +28,10 @@ from mesonbuild.mesonlib import MesonException
 from . import mlog, mparser, environment
 from functools import wraps
 from pprint import pprint
+from collections import OrderedDict
 from .mparser import Token, ArrayNode, ArgumentNode, AssignmentNode, IdNode, FunctionNode, StringNode
-import json, os
+import concurrent.futures as conc
+import json, os, sys
 
 class RewriterException(MesonException):
     pass
@@ -39,6 +41,12 @@ def add_arguments(parser):
                         help='Path to source directory.')
     parser.add_argument('-p', '--print', action='store_true', default=False, dest='print',
                         help='Print the parsed AST.')
+    parser.add_argument('--batch', action='store_true', default=False,
+                        help='The command is a file (or - for stdin) with one job per line, '
+                             'a JSON object with a "sourcedir" and its "commands". The jobs are '
+                             'run in parallel and their results printed as JSON lines.')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of processes to use in batch mode (default: number of CPUs).')
     parser.add_argument('command', type=str)
 
 class RequiredKeys:
@@ -722,14 +730,14 @@ class Rewriter:
             with open(val['path'], 'w') as fp:
                 fp.write(val['raw'])
 
-def run(options):
-    rewriter = Rewriter(options.sourcedir)
-    rewriter.analyze_meson()
-    if os.path.exists(options.command):
-        with open(options.command, 'r') as fp:
+def load_commands(command):
+    if isinstance(command, list):
+        commands = command
+    elif os.path.exists(command):
+        with open(command, 'r') as fp:
             commands = json.load(fp)
     else:
-        commands = json.loads(options.command)
+        commands = json.loads(command)
 
     if not isinstance(commands, list):
         raise TypeError('Command is not a list')
@@ -737,6 +745,75 @@ def run(options):
     for i in commands:
         if not isinstance(i, object):
             raise TypeError('Command is not an object')
+    return commands
+
+def run_batch_tree(sourcedir, jobs):
+    '''
+    Runs the (index, commands) @jobs of one source tree with a single
+    Rewriter, so the build files are parsed only once. The changes are
+    only written if all jobs succeeded. Returns the result of each job.
+    '''
+    # The results are printed as JSON by the main process
+    mlog.disable()
+    results = []
+    try:
+        rewriter = Rewriter(sourcedir)
+        rewriter.analyze_meson()
+    except Exception as e:
+        return [{'job': i, 'sourcedir': sourcedir, 'info': {}, 'error': str(e), 'written': False}
+                for i, _ in jobs]
+    failed = False
+    for i, command in jobs:
+        rewriter.info_dump = None
+        result = {'job': i, 'sourcedir': sourcedir, 'info': {}, 'error': None}
+        # Report errors of one job instead of aborting the whole batch
+        try:
+            for cmd in load_commands(command):
+                rewriter.process(cmd)
+            result['info'] = rewriter.info_dump or {}
+        except Exception as e:
+            result['error'] = '{}: {}'.format(type(e).__name__, e)
+            failed = True
+        results.append(result)
+    if not failed:
+        rewriter.apply_changes()
+    for r in results:
+        r['written'] = not failed
+    return results
+
+def run_batch(options):
+    if options.command == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(options.command, 'r') as fp:
+            lines = fp.readlines()
+    # Jobs of the same tree run in order in one process
+    trees = OrderedDict()
+    for i, line in enumerate(lines):
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        if not isinstance(job, dict) or 'sourcedir' not in job or 'commands' not in job:
+            raise RewriterException('Job on line {} needs a "sourcedir" and "commands"'.format(i + 1))
+        sourcedir = os.path.abspath(job['sourcedir'])
+        trees.setdefault(sourcedir, []).append((i, job['commands']))
+
+    returncode = 0
+    with conc.ProcessPoolExecutor(max_workers=options.jobs) as executor:
+        futures = [executor.submit(run_batch_tree, d, jobs) for d, jobs in trees.items()]
+        for f in conc.as_completed(futures):
+            for result in f.result():
+                if result['error'] is not None:
+                    returncode = 1
+                print(json.dumps(result), flush=True)
+    return returncode
+
+def run(options):
+    if options.batch:
+        return run_batch(options)
+    rewriter = Rewriter(options.sourcedir)
+    rewriter.analyze_meson()
+    for i in load_commands(options.command):
         rewriter.process(i)
 
     rewriter.apply_changes()
@@ -18,3 +18,15 @@ def destdir_join(d1, d2):
             and len(d2) > 1 and d2[1] == ':':
         return d1 + d2[2:]
     return d1 + d2
+
+def run_parallel(func, items):
+    '''Calls func on every item in a thread pool. The work is expected to
+    be done by child processes, so threads are enough. Returns the results
+    in the order of items and raises the first exception.'''
+    items = list(items)
+    if len(items) < 2:
+        return [func(i) for i in items]
+    from concurrent.futures import ThreadPoolExecutor
+    import multiprocessing
+    with ThreadPoolExecutor(max_workers=multiprocessing.cpu_count()) as executor:
+        return list(executor.map(func, items))
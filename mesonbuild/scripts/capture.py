@@ -0,0 +1,51 @@
+# Copyright 2019 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Runs a command of a custom target or generator and writes its standard
+output to a file. The output is written straight into a temporary file
+and only replaces the output file if it changed, so Ninja can skip the
+commands that depend on it.
+
+This is used instead of meson_exe when the command does not need a
+modified environment, so the command line is passed as is and there is
+nothing to unpickle.'''
+
+import os
+import sys
+import filecmp
+import subprocess
+
+def run(args):
+    if len(args) < 3 or args[1] != '--':
+        print('capture <output file> -- <command> [args...]')
+        return 1
+    output = args[0]
+    cmd = args[2:]
+    tmp = output + '~'
+    with open(tmp, 'wb') as f:
+        returncode = subprocess.call(cmd, stdout=f, close_fds=False)
+    if returncode != 0:
+        # Show the output like it would have been without capturing
+        with open(tmp, 'rb') as f:
+            sys.stdout.buffer.write(f.read())
+        os.unlink(tmp)
+        return returncode
+    if os.path.exists(output) and filecmp.cmp(output, tmp, shallow=False):
+        os.unlink(tmp)
+    else:
+        os.replace(tmp, output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(run(sys.argv[1:]))
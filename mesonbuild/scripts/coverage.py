@@ -14,13 +14,282 @@
 
 from mesonbuild import environment
 
-import argparse, sys, os, subprocess, pathlib
+import argparse, sys, os, subprocess, pathlib, json, time, multiprocessing
+import concurrent.futures as conc
+import xml.etree.ElementTree as ET
+
+# The gcov output of every object file, reused for the objects that did not
+# change since the last report.
+cache_fname = os.path.join('meson-private', 'coverage-cache.json')
+# Bumped whenever the cached data changes, so old caches are ignored.
+cache_version = 2
+
+def find_gcno_files(build_root):
+    gcnos = []
+    for root, _, files in os.walk(build_root):
+        for f in files:
+            if f.endswith('.gcno'):
+                gcnos.append(os.path.join(root, f))
+    return gcnos
+
+def get_object_stamp(gcno):
+    '''Returns the modification times of the notes file written by the
+    compiler and of the data file written when the program runs.'''
+    stamp = [os.stat(gcno).st_mtime_ns]
+    try:
+        stamp.append(os.stat(gcno[:-len('.gcno')] + '.gcda').st_mtime_ns)
+    except FileNotFoundError:
+        stamp.append(None)
+    return stamp
+
+def parse_gcov_file(build_root, gcov_file):
+    '''Converts a file entry of the gcov JSON format into the line, branch
+    and function counts of the source file, by absolute path.'''
+    lines = []
+    branches = []
+    for line in gcov_file['lines']:
+        lines.append([line['line_number'], line['count']])
+        if line['branches']:
+            branches.append([line['line_number'], [b['count'] for b in line['branches']]])
+    functions = [[f['name'], f['start_line'], f['execution_count']]
+                 for f in gcov_file.get('functions', [])]
+    filename = os.path.normpath(os.path.join(build_root, gcov_file['file']))
+    return filename, {'lines': lines, 'branches': branches, 'functions': functions}
+
+def run_gcov(gcov_exe, build_root, gcnos):
+    '''Runs gcov once for all of @gcnos and returns the coverage of every
+    source file they were compiled from, by notes file, or None if gcov
+    failed.'''
+    # Without --branch-probabilities the branches of every line are empty.
+    p = subprocess.run([gcov_exe, '--json-format', '--stdout', '--branch-probabilities'] + gcnos,
+                       cwd=build_root, stdout=subprocess.PIPE,
+                       stderr=subprocess.PIPE, universal_newlines=True)
+    if p.returncode != 0:
+        print('gcov failed for {} object files:\n{}'.format(len(gcnos), p.stderr.strip()),
+              file=sys.stderr)
+        return None
+    result = {gcno: {} for gcno in gcnos}
+    # The JSON documents of the files are written one after the other.
+    decoder = json.JSONDecoder()
+    out = p.stdout
+    pos = 0
+    while True:
+        while pos < len(out) and out[pos].isspace():
+            pos += 1
+        if pos >= len(out):
+            break
+        try:
+            doc, pos = decoder.raw_decode(out, pos)
+        except json.JSONDecodeError as e:
+            print('Could not parse the output of gcov: {}'.format(e), file=sys.stderr)
+            return None
+        gcda = os.path.normpath(os.path.join(build_root, doc['data_file']))
+        gcno = os.path.splitext(gcda)[0] + '.gcno'
+        files = result.setdefault(gcno, {})
+        for gcov_file in doc['files']:
+            filename, data = parse_gcov_file(build_root, gcov_file)
+            files[filename] = data
+    return result
+
+def merge_coverage(merged, files):
+    for filename, data in files.items():
+        m = merged.setdefault(filename, {'lines': {}, 'branches': {}, 'functions': {}})
+        for line, count in data['lines']:
+            m['lines'][line] = m['lines'].get(line, 0) + count
+        for line, counts in data['branches']:
+            old = m['branches'].get(line)
+            if old is None or len(old) != len(counts):
+                m['branches'][line] = counts
+            else:
+                m['branches'][line] = [a + b for a, b in zip(old, counts)]
+        for name, start_line, count in data['functions']:
+            key = (name, start_line)
+            m['functions'][key] = m['functions'].get(key, 0) + count
+
+def collect_coverage(gcov_exe, source_root, subproject_root, build_root, jobs):
+    '''
+    Walks the build directory once and returns the merged line, branch and
+    function counts of all source files of the project. Only the object
+    files that were rebuilt or run since the last report are given to
+    gcov, in parallel batches.
+    '''
+    cache_file = os.path.join(build_root, cache_fname)
+    try:
+        with open(cache_file, encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    if not isinstance(cache, dict) or cache.get('version') != cache_version:
+        cache = {'objects': {}}
+    cache = cache['objects']
+    objects = {}
+    todo = []
+    for gcno in find_gcno_files(build_root):
+        stamp = get_object_stamp(gcno)
+        entry = cache.get(gcno)
+        if entry is not None and entry['stamp'] == stamp:
+            objects[gcno] = entry
+        else:
+            objects[gcno] = {'stamp': stamp, 'files': {}}
+            todo.append(gcno)
+    if todo:
+        batch_size = max(1, min(32, len(todo) // jobs))
+        batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+        with conc.ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = executor.map(lambda b: run_gcov(gcov_exe, build_root, b), batches)
+            for batch, result in zip(batches, results):
+                if result is None:
+                    # Leave them out of this report and the cache, so the
+                    # next report tries them again.
+                    for gcno in batch:
+                        del objects[gcno]
+                    continue
+                for gcno, files in result.items():
+                    if gcno in objects:
+                        objects[gcno]['files'] = files
+    with open(cache_file + '~', 'w', encoding='utf-8') as f:
+        json.dump({'version': cache_version, 'objects': objects}, f)
+    os.replace(cache_file + '~', cache_file)
+
+    source_prefix = os.path.join(source_root, '')
+    subproject_prefix = os.path.join(subproject_root, '')
+    merged = {}
+    for entry in objects.values():
+        files = {k: v for k, v in entry['files'].items()
+                 if k.startswith(source_prefix) and not k.startswith(subproject_prefix)}
+        merge_coverage(merged, files)
+    return merged
+
+def get_rate(covered, total):
+    return covered / total if total else 1.0
+
+def get_file_summary(data):
+    lines = len(data['lines'])
+    lines_hit = sum(1 for c in data['lines'].values() if c > 0)
+    branches = sum(len(c) for c in data['branches'].values())
+    branches_hit = sum(1 for c in data['branches'].values() for b in c if b > 0)
+    return lines, lines_hit, branches, branches_hit
+
+def get_missing_lines(data):
+    '''Returns the lines that were not run as a list of ranges.'''
+    ranges = []
+    for line in sorted(l for l, c in data['lines'].items() if c == 0):
+        if ranges and ranges[-1][1] == line - 1:
+            ranges[-1][1] = line
+        else:
+            ranges.append([line, line])
+    return ','.join(str(a) if a == b else '{}-{}'.format(a, b) for a, b in ranges)
+
+def write_text_report(data, source_root, filename):
+    rule = '-' * 78 + '\n'
+    total = total_hit = 0
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(rule)
+        f.write('GCC Code Coverage Report'.center(78).rstrip() + '\n')
+        f.write('Directory: {}\n'.format(source_root))
+        f.write(rule)
+        f.write('{:<40} {:>7} {:>7} {:>6}   {}\n'.format('File', 'Lines', 'Exec', 'Cover', 'Missing'))
+        f.write(rule)
+        for src in sorted(data):
+            lines, lines_hit, _, _ = get_file_summary(data[src])
+            total += lines
+            total_hit += lines_hit
+            f.write('{:<40} {:>7} {:>7} {:>5}%   {}\n'.format(
+                os.path.relpath(src, source_root), lines, lines_hit,
+                int(get_rate(lines_hit, lines) * 100), get_missing_lines(data[src])))
+        f.write(rule)
+        f.write('{:<40} {:>7} {:>7} {:>5}%\n'.format('TOTAL', total, total_hit,
+                                                     int(get_rate(total_hit, total) * 100)))
+        f.write(rule)
+
+def write_xml_report(data, source_root, filename):
+    '''Writes the coverage in the Cobertura XML format, like gcovr -x.'''
+    totals = [0, 0, 0, 0]
+    packages = {}
+    for src in sorted(data):
+        relname = os.path.relpath(src, source_root)
+        packages.setdefault(os.path.dirname(relname), []).append((relname, data[src]))
+    root = ET.Element('coverage', {'version': 'meson', 'timestamp': str(int(time.time())),
+                                   'complexity': '0.0'})
+    sources = ET.SubElement(root, 'sources')
+    ET.SubElement(sources, 'source').text = source_root
+    packages_elem = ET.SubElement(root, 'packages')
+    for pkgname, files in sorted(packages.items()):
+        pkg_totals = [0, 0, 0, 0]
+        package = ET.SubElement(packages_elem, 'package', {'name': pkgname.replace(os.sep, '.'),
+                                                           'complexity': '0.0'})
+        classes = ET.SubElement(package, 'classes')
+        for relname, filedata in files:
+            summary = get_file_summary(filedata)
+            pkg_totals = [a + b for a, b in zip(pkg_totals, summary)]
+            cls = ET.SubElement(classes, 'class', {
+                'name': os.path.basename(relname).replace('.', '_'),
+                'filename': relname.replace(os.sep, '/'),
+                'line-rate': str(get_rate(summary[1], summary[0])),
+                'branch-rate': str(get_rate(summary[3], summary[2])),
+                'complexity': '0.0'})
+            ET.SubElement(cls, 'methods')
+            lines = ET.SubElement(cls, 'lines')
+            for line, count in sorted(filedata['lines'].items()):
+                attrs = {'number': str(line), 'hits': str(count), 'branch': 'false'}
+                branches = filedata['branches'].get(line)
+                if branches:
+                    hit = sum(1 for b in branches if b > 0)
+                    attrs['branch'] = 'true'
+                    attrs['condition-coverage'] = '{}% ({}/{})'.format(
+                        int(hit * 100 / len(branches)), hit, len(branches))
+                ET.SubElement(lines, 'line', attrs)
+        package.set('line-rate', str(get_rate(pkg_totals[1], pkg_totals[0])))
+        package.set('branch-rate', str(get_rate(pkg_totals[3], pkg_totals[2])))
+        totals = [a + b for a, b in zip(totals, pkg_totals)]
+    root.set('lines-valid', str(totals[0]))
+    root.set('lines-covered', str(totals[1]))
+    root.set('line-rate', str(get_rate(totals[1], totals[0])))
+    root.set('branches-valid', str(totals[2]))
+    root.set('branches-covered', str(totals[3]))
+    root.set('branch-rate', str(get_rate(totals[3], totals[2])))
+    ET.ElementTree(root).write(filename, encoding='utf-8', xml_declaration=True)
+
+def write_lcov_info(data, filename):
+    '''Writes the coverage as an lcov tracefile for genhtml.'''
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('TN:\n')
+        for src in sorted(data):
+            filedata = data[src]
+            f.write('SF:{}\n'.format(src))
+            functions = sorted(filedata['functions'].items(), key=lambda i: i[0][1])
+            for (name, start_line), _ in functions:
+                f.write('FN:{},{}\n'.format(start_line, name))
+            for (name, _), count in functions:
+                f.write('FNDA:{},{}\n'.format(count, name))
+            f.write('FNF:{}\n'.format(len(functions)))
+            f.write('FNH:{}\n'.format(sum(1 for _, c in functions if c > 0)))
+            lines, lines_hit, branches, branches_hit = get_file_summary(filedata)
+            for line, counts in sorted(filedata['branches'].items()):
+                line_run = filedata['lines'].get(line, 0) > 0
+                for i, count in enumerate(counts):
+                    f.write('BRDA:{},0,{},{}\n'.format(line, i, count if line_run else '-'))
+            f.write('BRF:{}\n'.format(branches))
+            f.write('BRH:{}\n'.format(branches_hit))
+            for line, count in sorted(filedata['lines'].items()):
+                f.write('DA:{},{}\n'.format(line, count))
+            f.write('LF:{}\n'.format(lines))
+            f.write('LH:{}\n'.format(lines_hit))
+            f.write('end_of_record\n')
 
 def coverage(outputs, source_root, subproject_root, build_root, log_dir):
     outfiles = []
     exitcode = 0
 
     (gcovr_exe, gcovr_new_rootdir, lcov_exe, genhtml_exe) = environment.find_coverage_tools()
+    gcov_exe = environment.detect_gcov()
+
+    # Collect the coverage data once for all reports if gcov can write it
+    # in a format we can read, otherwise leave it to gcovr and lcov.
+    data = None
+    if gcov_exe:
+        data = collect_coverage(gcov_exe, source_root, subproject_root, build_root,
+                                multiprocessing.cpu_count())
 
     # gcovr >= 3.1 interprets rootdir differently
     if gcovr_new_rootdir:
@@ -29,7 +298,10 @@ def coverage(outputs, source_root, subproject_root, build_root, log_dir):
         gcovr_rootdir = source_root
 
     if not outputs or 'xml' in outputs:
-        if gcovr_exe:
+        if data is not None:
+            write_xml_report(data, source_root, os.path.join(log_dir, 'coverage.xml'))
+            outfiles.append(('Xml', pathlib.Path(log_dir, 'coverage.xml')))
+        elif gcovr_exe:
             subprocess.check_call([gcovr_exe,
                                    '-x',
                                    '-r', gcovr_rootdir,
@@ -42,7 +314,10 @@ def coverage(outputs, source_root, subproject_root, build_root, log_dir):
             exitcode = 1
 
     if not outputs or 'text' in outputs:
-        if gcovr_exe:
+        if data is not None:
+            write_text_report(data, source_root, os.path.join(log_dir, 'coverage.txt'))
+            outfiles.append(('Text', pathlib.Path(log_dir, 'coverage.txt')))
+        elif gcovr_exe:
             subprocess.check_call([gcovr_exe,
                                    '-r', gcovr_rootdir,
                                    '-e', subproject_root,
@@ -54,7 +329,21 @@ def coverage(outputs, source_root, subproject_root, build_root, log_dir):
             exitcode = 1
 
     if not outputs or 'html' in outputs:
-        if lcov_exe and genhtml_exe:
+        if data is not None and genhtml_exe:
+            htmloutdir = os.path.join(log_dir, 'coveragereport')
+            covinfo = os.path.join(log_dir, 'coverage.info')
+            write_lcov_info(data, covinfo)
+            subprocess.check_call([genhtml_exe,
+                                   '--prefix', build_root,
+                                   '--prefix', source_root,
+                                   '--output-directory', htmloutdir,
+                                   '--title', 'Code coverage',
+                                   '--legend',
+                                   '--show-details',
+                                   '--branch-coverage',
+                                   covinfo])
+            outfiles.append(('Html', pathlib.Path(htmloutdir, 'index.html')))
+        elif lcov_exe and genhtml_exe:
             htmloutdir = os.path.join(log_dir, 'coveragereport')
             covinfo = os.path.join(log_dir, 'coverage.info')
             initial_tracefile = covinfo + '.initial'
@@ -115,11 +404,11 @@ def coverage(outputs, source_root, subproject_root, build_root, log_dir):
                                    ])
             outfiles.append(('Html', pathlib.Path(htmloutdir, 'index.html')))
         elif outputs:
-            print('lcov/genhtml or gcovr >= 3.2 needed to generate Html coverage report')
+            print('genhtml or gcovr >= 3.2 needed to generate Html coverage report')
             exitcode = 1
 
     if not outputs and not outfiles:
-        print('Need gcovr or lcov/genhtml to generate any coverage reports')
+        print('Need gcov, gcovr or lcov/genhtml to generate any coverage reports')
         exitcode = 1
 
     if outfiles:
@@ -0,0 +1,122 @@
+# Copyright 2019 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Scans the Fortran sources of a target for the modules they define and
+use at build time, and writes a Ninja dyndep file that makes every object
+depend on the module files of the modules its source uses.
+
+This script is run by Ninja, so it must not import the rest of Meson. The
+sources to scan are listed in a JSON file written by the Ninja backend,
+see NinjaBackend.generate_fortran_depscan().'''
+
+import re, sys, json
+
+FORTRAN_MODULE_RE = re.compile(r"\s*\bmodule\b\s+(\w+)\s*$", re.IGNORECASE)
+FORTRAN_SUBMODULE_RE = re.compile(r"\s*\bsubmodule\b\s+\((\w+:?\w+)\)\s+(\w+)\s*$", re.IGNORECASE)
+FORTRAN_USE_RE = re.compile(r"\s*use,?\s*(?:non_intrinsic)?\s*(?:::)?\s*(\w+)", re.IGNORECASE)
+
+def ninja_quote(text):
+    return text.replace('$', '$$').replace(' ', '$ ').replace(':', '$:')
+
+def scan_source(filename):
+    '''Returns the modules, the submodules, the used modules and the
+    (submodule, parent) pairs of a Fortran source file.'''
+    modules = []
+    submodules = []
+    uses = []
+    parents = []
+    # Fortran keywords must be ASCII.
+    with open(filename, encoding='ascii', errors='ignore') as f:
+        for line in f:
+            match = FORTRAN_MODULE_RE.match(line)
+            if match:
+                modules.append(match.group(1).lower())
+                continue
+            match = FORTRAN_SUBMODULE_RE.match(line)
+            if match:
+                submodule = match.group(2).lower()
+                submodules.append(submodule)
+                parents += [(submodule, p) for p in match.group(1).lower().split(':')]
+                continue
+            match = FORTRAN_USE_RE.match(line)
+            if match and match.group(1).lower() != 'intrinsic':
+                uses.append(match.group(1).lower())
+    return modules, submodules, uses, parents
+
+def get_dyndep(scaninfo):
+    moddir = scaninfo['module_dir']
+    scanned = []
+    # Module and submodule name -> object of the source defining it
+    provided = {}
+    for src, obj in scaninfo['sources']:
+        modules, submodules, uses, parents = scan_source(src)
+        for name in modules + submodules:
+            if name in provided:
+                raise RuntimeError('Namespace collision: module {} defined in '
+                                   'two files {} and {}.'.format(name, provided[name], src))
+            provided[name] = obj
+        scanned.append((obj, modules, uses, parents))
+
+    lines = ['ninja_dyndep_version = 1']
+    for obj, modules, uses, parents in scanned:
+        # Same as FortranCompiler.module_name_to_filename()
+        outputs = [moddir + '/' + m + '.mod' for m in modules]
+        inputs = []
+        for name in uses:
+            # Modules not defined in this target come from other targets or
+            # the compiler, those are not handled here.
+            if name in provided and provided[name] != obj:
+                inputs.append(moddir + '/' + name + '.mod')
+        for submodule, name in parents:
+            if name not in provided:
+                raise RuntimeError('submodule {} relies on parent module {} that '
+                                   'was not found.'.format(submodule, name))
+            # Submodules don't produce a .mod file, so depend on the object
+            # of the source defining the parent instead.
+            if provided[name] != obj:
+                inputs.append(provided[name])
+        line = 'build ' + ninja_quote(obj)
+        if outputs:
+            line += ' | ' + ' '.join(ninja_quote(o) for o in outputs)
+        line += ': dyndep'
+        if inputs:
+            line += ' | ' + ' '.join(ninja_quote(i) for i in sorted(set(inputs)))
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+def run(args):
+    if len(args) != 2:
+        print('depscan <scan info file> <dyndep file>')
+        return 1
+    scanfile, dyndepfile = args
+    with open(scanfile, encoding='utf-8') as f:
+        scaninfo = json.load(f)
+    try:
+        content = get_dyndep(scaninfo)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    # Keep the old file if nothing changed so Ninja does not reload it
+    try:
+        with open(dyndepfile, encoding='utf-8') as f:
+            if f.read() == content:
+                return 0
+    except FileNotFoundError:
+        pass
+    with open(dyndepfile, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(run(sys.argv[1:]))
@@ -14,18 +14,45 @@
 
 
 import lzma
+import gzip
 import os
 import sys
+import shlex
 import shutil
+import argparse
 import subprocess
-import pickle
 import hashlib
+import multiprocessing
 import tarfile, zipfile
 import tempfile
+import concurrent.futures as conc
 from glob import glob
-from mesonbuild.environment import detect_ninja
+from mesonbuild.environment import detect_ninja, BinaryTable
 from mesonbuild.mesonlib import windows_proof_rmtree
-from mesonbuild import mlog
+from mesonbuild import mlog, build, coredata
+
+archive_choices = ['xztar', 'gztar', 'zip']
+
+archive_extension = {'xztar': '.tar.xz',
+                     'gztar': '.tar.gz',
+                     'zip': '.zip'}
+
+def parse_formats(value):
+    formats = value.split(',')
+    for f in formats:
+        if f not in archive_choices:
+            raise argparse.ArgumentTypeError('Invalid archive format {!r}, must be one of: {}'
+                                             .format(f, ', '.join(archive_choices)))
+    # Keep the order stable and remove duplicates
+    return [f for f in archive_choices if f in formats]
+
+def add_arguments(parser):
+    parser.add_argument('--formats', default='xztar', type=parse_formats,
+                        help='Comma separated list of archive types to create: {} (default: xztar).'
+                        .format(', '.join(archive_choices)))
+    parser.add_argument('-j', '--jobs', default=multiprocessing.cpu_count(), type=int,
+                        help='Number of parallel jobs used to compress and to build the '
+                        'package when testing it.')
 
 def create_hash(fname):
     hashname = fname + '.sha256sum'
@@ -35,6 +62,25 @@ def create_hash(fname):
         f.write('%s %s\n' % (m.hexdigest(), os.path.basename(fname)))
 
 
+def create_tar(tarname, distdir, dist_name):
+    with tarfile.open(tarname, 'w') as tf:
+        tf.add(distdir, dist_name)
+
+def create_xz(xzname, tarname, jobs):
+    xz = shutil.which('xz')
+    if xz:
+        # Multithreaded xz is a lot faster for big projects.
+        with open(xzname, 'wb') as f:
+            if subprocess.call([xz, '-T', str(jobs), '-c', tarname], stdout=f,
+                               stderr=subprocess.DEVNULL) == 0:
+                return
+    with lzma.open(xzname, 'wb') as xf, open(tarname, 'rb') as tf:
+        shutil.copyfileobj(tf, xf)
+
+def create_gz(gzname, tarname):
+    with gzip.open(gzname, 'wb') as gf, open(tarname, 'rb') as tf:
+        shutil.copyfileobj(tf, gf)
+
 def create_zip(zipfilename, packaging_dir):
     prefix = os.path.dirname(packaging_dir)
     removelen = len(prefix) + 1
@@ -109,15 +155,7 @@ def create_dist_git(dist_name, src_root, bld_root, dist_sub, dist_scripts):
     process_submodules(distdir)
     del_gitfiles(distdir)
     run_dist_scripts(distdir, dist_scripts)
-    xzname = distdir + '.tar.xz'
-    # Should use shutil but it got xz support only in 3.5.
-    with tarfile.open(xzname, 'w:xz') as tf:
-        tf.add(distdir, dist_name)
-    # Create only .tar.xz for now.
-    # zipname = distdir + '.zip'
-    # create_zip(zipname, distdir)
-    shutil.rmtree(distdir)
-    return (xzname, )
+    return distdir
 
 
 def hg_have_dirty_index(src_root):
@@ -129,43 +167,60 @@ def create_dist_hg(dist_name, src_root, bld_root, dist_sub, dist_scripts):
     if hg_have_dirty_index(src_root):
         mlog.warning('Repository has uncommitted changes that will not be included in the dist tarball')
 
+    distdir = os.path.join(dist_sub, dist_name)
+    if os.path.exists(distdir):
+        shutil.rmtree(distdir)
     os.makedirs(dist_sub, exist_ok=True)
-    tarname = os.path.join(dist_sub, dist_name + '.tar')
-    xzname = tarname + '.xz'
-    subprocess.check_call(['hg', 'archive', '-R', src_root, '-S', '-t', 'tar', tarname])
+    subprocess.check_call(['hg', 'archive', '-R', src_root, '-S', '-t', 'files', distdir])
     if len(dist_scripts) > 0:
         mlog.warning('dist scripts are not supported in Mercurial projects')
-    with lzma.open(xzname, 'wb') as xf, open(tarname, 'rb') as tf:
-        shutil.copyfileobj(tf, xf)
-    os.unlink(tarname)
-    # Create only .tar.xz for now.
-    # zipname = os.path.join(dist_sub, dist_name + '.zip')
-    # subprocess.check_call(['hg', 'archive', '-R', src_root, '-S', '-t', 'zip', zipname])
-    return (xzname, )
+    return distdir
 
 
-def check_dist(packagename, meson_command):
+def get_toolchain(bld_root):
+    '''
+    Returns the arguments and environment variables that make Meson use
+    the same native and cross files and compilers as in @bld_root, so the
+    test build does not pick a different toolchain.
+    '''
+    cdata = coredata.load(bld_root)
+    args = []
+    for f in cdata.config_files:
+        args += ['--native-file', f]
+    if cdata.cross_file:
+        args += ['--cross-file', cdata.cross_file]
+    env = {}
+    for lang, comp in cdata.compilers.items():
+        evar = BinaryTable.evarMap.get(lang)
+        # Variables set by the user and native files take precedence
+        if evar and evar not in os.environ and not cdata.config_files:
+            env[evar] = ' '.join(shlex.quote(c) for c in comp.get_exelist())
+    return args, env
+
+def check_dist(packagename, meson_command, toolchain, jobs):
     print('Testing distribution package %s' % packagename)
     unpackdir = tempfile.mkdtemp()
     builddir = tempfile.mkdtemp()
     installdir = tempfile.mkdtemp()
     ninja_bin = detect_ninja()
+    toolchain_args, toolchain_env = toolchain
+    myenv = os.environ.copy()
+    myenv.update(toolchain_env)
     try:
-        tf = tarfile.open(packagename)
-        tf.extractall(unpackdir)
+        shutil.unpack_archive(packagename, unpackdir)
         srcdir = glob(os.path.join(unpackdir, '*'))[0]
-        if subprocess.call(meson_command + ['--backend=ninja', srcdir, builddir]) != 0:
+        if subprocess.call(meson_command + ['--backend=ninja'] + toolchain_args + [srcdir, builddir],
+                           env=myenv) != 0:
             print('Running Meson on distribution package failed')
             return 1
-        if subprocess.call([ninja_bin], cwd=builddir) != 0:
+        if subprocess.call([ninja_bin, '-j', str(jobs)], cwd=builddir) != 0:
             print('Compiling the distribution package failed')
             return 1
-        if subprocess.call([ninja_bin, 'test'], cwd=builddir) != 0:
+        if subprocess.call(meson_command + ['test', '--num-processes', str(jobs)], cwd=builddir) != 0:
             print('Running unit tests on the distribution package failed')
             return 1
-        myenv = os.environ.copy()
         myenv['DESTDIR'] = installdir
-        if subprocess.call([ninja_bin, 'install'], cwd=builddir, env=myenv) != 0:
+        if subprocess.call([ninja_bin, '-j', str(jobs), 'install'], cwd=builddir, env=myenv) != 0:
             print('Installing the distribution package failed')
             return 1
     finally:
@@ -175,33 +230,76 @@ def check_dist(packagename, meson_command):
     print('Distribution package %s tested' % packagename)
     return 0
 
-def run(args):
-    src_root = args[0]
-    bld_root = args[1]
-    meson_command = args[2:]
-    priv_dir = os.path.join(bld_root, 'meson-private')
-    dist_sub = os.path.join(bld_root, 'meson-dist')
+def create_archives(distdir, dist_name, formats, jobs, executor):
+    '''
+    Starts creating the archives of @distdir in the given @formats in
+    @executor. The uncompressed tarball is created first and returned
+    with the futures, the compressors read it in parallel.
+    '''
+    tarname = distdir + '.tar'
+    create_tar(tarname, distdir, dist_name)
+    futures = []
+    for f in formats:
+        name = distdir + archive_extension[f]
+        if f == 'xztar':
+            fut = executor.submit(create_xz, name, tarname, jobs)
+        elif f == 'gztar':
+            fut = executor.submit(create_gz, name, tarname)
+        else:
+            fut = executor.submit(create_zip, name, distdir)
+        futures.append((name, fut))
+    return tarname, futures
 
-    buildfile = os.path.join(priv_dir, 'build.dat')
+def run_dist(src_root, bld_root, meson_command, formats, jobs):
+    dist_sub = os.path.join(bld_root, 'meson-dist')
 
-    build = pickle.load(open(buildfile, 'rb'))
+    project = build.load_project_info(bld_root)
 
-    dist_name = build.project_name + '-' + build.project_version
+    dist_name = project['project_name'] + '-' + project['project_version']
 
     _git = os.path.join(src_root, '.git')
     if os.path.isdir(_git) or os.path.isfile(_git):
-        names = create_dist_git(dist_name, src_root, bld_root, dist_sub, build.dist_scripts)
+        distdir = create_dist_git(dist_name, src_root, bld_root, dist_sub, project['dist_scripts'])
     elif os.path.isdir(os.path.join(src_root, '.hg')):
-        names = create_dist_hg(dist_name, src_root, bld_root, dist_sub, build.dist_scripts)
+        distdir = create_dist_hg(dist_name, src_root, bld_root, dist_sub, project['dist_scripts'])
     else:
         print('Dist currently only works with Git or Mercurial repos')
         return 1
-    if names is None:
+    toolchain = get_toolchain(bld_root)
+    tarname = distdir + '.tar'
+    names = []
+    try:
+        with conc.ThreadPoolExecutor(max_workers=len(formats)) as executor:
+            tarname, futures = create_archives(distdir, dist_name, formats, jobs, executor)
+            # All archives have the same contents, so test the plain tarball
+            # while they are being compressed.
+            rc = check_dist(tarname, meson_command, toolchain, jobs)
+            for name, f in futures:
+                try:
+                    f.result()
+                except Exception as e:
+                    print('Creating {} failed: {}'.format(os.path.basename(name), e))
+                    if os.path.exists(name):
+                        os.unlink(name)
+                    rc = 1
+                    continue
+                names.append(name)
+    finally:
+        if os.path.exists(tarname):
+            os.unlink(tarname)
+        shutil.rmtree(distdir)
+    if rc != 0:
         return 1
-    error_count = 0
     for name in names:
-        rc = check_dist(name, meson_command) # Check only one.
-        if rc == 0:
-            create_hash(name)
-        error_count += rc
-    return 1 if error_count else 0
+        create_hash(name)
+    return 0
+
+def run(args):
+    parser = argparse.ArgumentParser(prog='dist')
+    add_arguments(parser)
+    parser.add_argument('src_root')
+    parser.add_argument('bld_root')
+    parser.add_argument('meson_command', nargs=argparse.REMAINDER)
+    options = parser.parse_args(args)
+    return run_dist(options.src_root, options.bld_root, options.meson_command,
+                    options.formats, options.jobs)
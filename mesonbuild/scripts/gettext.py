@@ -16,7 +16,8 @@ import os
 import shutil
 import argparse
 import subprocess
-from . import destdir_join
+from ..mesonlib import replace_if_different
+from . import destdir_join, run_parallel
 
 parser = argparse.ArgumentParser()
 parser.add_argument('command')
@@ -60,20 +61,38 @@ def run_potgen(src_sub, pkgname, datadirs, args):
                             '-D', os.environ['MESON_SOURCE_ROOT'], '-k_', '-o', ofile] + args,
                            env=child_env)
 
+def remove_if_exists(fname):
+    if os.path.exists(fname):
+        os.unlink(fname)
+
 def gen_gmo(src_sub, bld_sub, langs):
-    for l in langs:
-        subprocess.check_call(['msgfmt', os.path.join(src_sub, l + '.po'),
-                               '-o', os.path.join(bld_sub, l + '.gmo')])
+    def msgfmt(l):
+        gmofile = os.path.join(bld_sub, l + '.gmo')
+        try:
+            subprocess.check_call(['msgfmt', os.path.join(src_sub, l + '.po'),
+                                   '-o', gmofile + '~'])
+        except subprocess.CalledProcessError:
+            remove_if_exists(gmofile + '~')
+            raise
+        replace_if_different(gmofile, gmofile + '~')
+    run_parallel(msgfmt, langs)
     return 0
 
 def update_po(src_sub, pkgname, langs):
     potfile = os.path.join(src_sub, pkgname + '.pot')
-    for l in langs:
+
+    def msgmerge(l):
         pofile = os.path.join(src_sub, l + '.po')
         if os.path.exists(pofile):
-            subprocess.check_call(['msgmerge', '-q', '-o', pofile, pofile, potfile])
+            try:
+                subprocess.check_call(['msgmerge', '-q', '-o', pofile + '~', pofile, potfile])
+            except subprocess.CalledProcessError:
+                remove_if_exists(pofile + '~')
+                raise
+            replace_if_different(pofile, pofile + '~')
         else:
             subprocess.check_call(['msginit', '--input', potfile, '--output-file', pofile, '--locale', l, '--no-translator'])
+    run_parallel(msgmerge, langs)
     return 0
 
 def do_install(src_sub, bld_sub, dest, pkgname, langs):
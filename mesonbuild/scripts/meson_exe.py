@@ -25,6 +25,8 @@ options = None
 
 def buildparser():
     parser = argparse.ArgumentParser()
+    parser.add_argument('--capture', default=None,
+                        help='File to write the stdout to, overrides the one in the data file.')
     parser.add_argument('args', nargs='+')
     return parser
 
@@ -89,13 +91,22 @@ def run_exe(exe):
 
 def run(args):
     global options
+    # Arguments after -- are appended to the ones in the data file, this
+    # lets a generator share one data file between all of its inputs.
+    extra_args = []
+    if '--' in args:
+        idx = args.index('--')
+        args, extra_args = args[:idx], args[idx + 1:]
     options = buildparser().parse_args(args)
     if len(options.args) != 1:
         print('Test runner for Meson. Do not run on your own, mmm\'kay?')
-        print(sys.argv[0] + ' [data file]')
+        print(sys.argv[0] + ' [--capture file] [data file] [-- args...]')
     exe_data_file = options.args[0]
     with open(exe_data_file, 'rb') as f:
         exe = pickle.load(f)
+    exe.cmd_args = exe.cmd_args + extra_args
+    if options.capture is not None:
+        exe.capture = options.capture
     return run_exe(exe)
 
 if __name__ == '__main__':
@@ -13,44 +13,71 @@
 # limitations under the License.
 
 import sys, os
-import pickle, subprocess
+import json, pickle, subprocess
 
 # This could also be used for XCode.
 
+# This script is run on every build, so it must not import the rest of
+# Meson. Everything it needs is stored in a small JSON file written by the
+# backend, see Vs2010Backend.generate_regen_info(). Only build directories
+# configured by older versions, which lack that file, load the coredata.
+
 def need_regen(regeninfo, regen_timestamp):
-    for i in regeninfo.depfiles:
-        curfile = os.path.join(regeninfo.build_dir, i)
-        curtime = os.stat(curfile).st_mtime
-        if curtime > regen_timestamp:
+    build_dir = regeninfo['build_dir']
+    for i in regeninfo['depfiles']:
+        if os.stat(os.path.join(build_dir, i)).st_mtime > regen_timestamp:
             return True
     # The timestamp file gets automatically deleted by MSBuild during a 'Clean' build.
     # We must make sure to recreate it, even if we do not regenerate the solution.
     # Otherwise, Visual Studio will always consider the REGEN project out of date.
     print("Everything is up-to-date, regeneration of build files is not needed.")
-    from ..backend.vs2010backend import Vs2010Backend
-    Vs2010Backend.touch_regen_timestamp(regeninfo.build_dir)
+    with open(regeninfo['stamp_file'], 'w'):
+        pass
     return False
 
-def regen(regeninfo, meson_command, backend):
-    cmd = meson_command + ['--internal',
-                           'regenerate',
-                           regeninfo.build_dir,
-                           regeninfo.source_dir,
-                           '--backend=' + backend]
+def regen(regeninfo):
+    cmd = regeninfo['meson_command'] + ['--internal',
+                                        'regenerate',
+                                        regeninfo['build_dir'],
+                                        regeninfo['source_dir'],
+                                        '--backend=' + regeninfo['backend']]
     subprocess.check_call(cmd)
 
+class OldRegenInfoUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        # The class of the old dump does not exist anymore
+        if name == 'RegenInfo':
+            return OldRegenInfo
+        return super().find_class(module, name)
+
+class OldRegenInfo:
+    pass
+
+def load_old_regeninfo(private_dir):
+    '''
+    Build directories configured by older versions only have the pickled
+    regeninfo.dump. They are always regenerated, which writes the JSON file.
+    '''
+    with open(os.path.join(private_dir, 'regeninfo.dump'), 'rb') as f:
+        old = OldRegenInfoUnpickler(f).load()
+    from .. import coredata
+    cdata = coredata.load(old.build_dir)
+    return {'source_dir': old.source_dir,
+            'build_dir': old.build_dir,
+            'meson_command': cdata.meson_command,
+            'backend': cdata.get_builtin_option('backend')}
+
 def run(args):
     private_dir = args[0]
-    dumpfile = os.path.join(private_dir, 'regeninfo.dump')
-    coredata = os.path.join(private_dir, 'coredata.dat')
-    with open(dumpfile, 'rb') as f:
-        regeninfo = pickle.load(f)
-    with open(coredata, 'rb') as f:
-        coredata = pickle.load(f)
-    backend = coredata.get_builtin_option('backend')
-    regen_timestamp = os.stat(dumpfile).st_mtime
+    infofile = os.path.join(private_dir, 'regeninfo.json')
+    if not os.path.exists(infofile):
+        regen(load_old_regeninfo(private_dir))
+        sys.exit(0)
+    with open(infofile, 'r', encoding='utf-8') as f:
+        regeninfo = json.load(f)
+    regen_timestamp = os.stat(infofile).st_mtime
     if need_regen(regeninfo, regen_timestamp):
-        regen(regeninfo, coredata.meson_command, backend)
+        regen(regeninfo)
     sys.exit(0)
 
 if __name__ == '__main__':
@@ -16,9 +16,10 @@ import os
 import subprocess
 import shutil
 import argparse
+import tempfile
 from .. import mlog
-from ..mesonlib import has_path_sep
-from . import destdir_join
+from ..mesonlib import has_path_sep, replace_if_different
+from . import destdir_join, run_parallel
 from .gettext import read_linguas
 
 parser = argparse.ArgumentParser()
@@ -39,25 +40,42 @@ def build_pot(srcdir, project_id, sources):
 
 def update_po(srcdir, project_id, langs):
     potfile = os.path.join(srcdir, project_id + '.pot')
-    for lang in langs:
+
+    def msgmerge(lang):
         pofile = os.path.join(srcdir, lang, lang + '.po')
-        subprocess.call(['msgmerge', '-q', '-o', pofile, pofile, potfile])
+        if subprocess.call(['msgmerge', '-q', '-o', pofile + '~', pofile, potfile]) == 0:
+            replace_if_different(pofile, pofile + '~')
+        elif os.path.exists(pofile + '~'):
+            os.unlink(pofile + '~')
+    run_parallel(msgmerge, langs)
 
 def build_translations(srcdir, blddir, langs):
-    for lang in langs:
+    def msgfmt(lang):
         outdir = os.path.join(blddir, lang)
         os.makedirs(outdir, exist_ok=True)
-        subprocess.call([
+        gmofile = os.path.join(outdir, lang + '.gmo')
+        if subprocess.call([
             'msgfmt', os.path.join(srcdir, lang, lang + '.po'),
-            '-o', os.path.join(outdir, lang + '.gmo')
-        ])
+            '-o', gmofile + '~'
+        ]) == 0:
+            replace_if_different(gmofile, gmofile + '~')
+        elif os.path.exists(gmofile + '~'):
+            os.unlink(gmofile + '~')
+    run_parallel(msgfmt, langs)
 
 def merge_translations(blddir, sources, langs):
-    for lang in langs:
-        subprocess.call([
-            'itstool', '-m', os.path.join(blddir, lang, lang + '.gmo'),
-            '-o', os.path.join(blddir, lang)
-        ] + sources)
+    def itstool(lang):
+        outdir = os.path.join(blddir, lang)
+        # Merge into a temporary directory and only replace the pages
+        # that changed.
+        with tempfile.TemporaryDirectory(dir=outdir) as tmpdir:
+            subprocess.call([
+                'itstool', '-m', os.path.join(outdir, lang + '.gmo'),
+                '-o', tmpdir
+            ] + sources)
+            for f in os.listdir(tmpdir):
+                replace_if_different(os.path.join(outdir, f), os.path.join(tmpdir, f))
+    run_parallel(itstool, langs)
 
 def install_help(srcdir, blddir, sources, media, langs, install_dir, destdir, project_id, symlinks):
     c_install_dir = os.path.join(install_dir, 'C', project_id)
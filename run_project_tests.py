@@ -16,6 +16,9 @@
 
 import itertools
 import os
+import json
+import math
+import hashlib
 import subprocess
 import shutil
 import sys
@@ -36,7 +39,7 @@ import argparse
 import xml.etree.ElementTree as ET
 import time
 import multiprocessing
-from concurrent.futures import ProcessPoolExecutor, CancelledError
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import re
 from run_tests import get_fake_options, run_configure, get_meson_script
 from run_tests import get_backend_commands, get_backend_args_for_dir, Backend
@@ -562,16 +565,56 @@ def detect_tests_to_run():
     gathered_tests = [(name, gather_tests(Path('test cases', subdir)), skip) for name, subdir, skip in all_tests]
     return gathered_tests
 
-def run_tests(all_tests, log_name_base, failfast, extra_args):
+def load_test_cache(fname):
+    '''Returns the durations of all test cases and the fingerprints of the
+    ones that passed in earlier runs.'''
+    try:
+        with open(fname, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'durations': {}, 'passed': {}}
+
+def save_test_cache(fname, cache):
+    with open(fname + '~', 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(fname + '~', fname)
+
+def hash_dir(h, dirname):
+    for root, dirs, files in os.walk(dirname):
+        dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+        for f in sorted(files):
+            fname = os.path.join(root, f)
+            h.update(os.path.relpath(fname, dirname).replace('\\', '/').encode(errors='surrogateescape'))
+            with open(fname, 'rb') as fp:
+                h.update(hashlib.sha1(fp.read()).digest())
+
+def get_meson_fingerprint(extra_args):
+    '''Returns a hash of the Meson sources and of everything else that is
+    the same for all test cases.'''
+    h = hashlib.sha1()
+    hash_dir(h, 'mesonbuild')
+    for fname in ('run_project_tests.py', 'run_tests.py'):
+        with open(fname, 'rb') as f:
+            h.update(f.read())
+    h.update(repr((extra_args, backend.name, backend_flags, system_compiler)).encode())
+    return h.hexdigest()
+
+def get_test_fingerprint(meson_fingerprint, testdir):
+    h = hashlib.sha1(meson_fingerprint.encode())
+    hash_dir(h, str(testdir))
+    return h.hexdigest()
+
+def run_tests(all_tests, log_name_base, failfast, extra_args, use_cache=False):
     global logfile
     txtname = log_name_base + '.txt'
     with open(txtname, 'w', encoding='utf-8', errors='ignore') as lf:
         logfile = lf
-        return _run_tests(all_tests, log_name_base, failfast, extra_args)
+        return _run_tests(all_tests, log_name_base, failfast, extra_args, use_cache)
 
-def _run_tests(all_tests, log_name_base, failfast, extra_args):
+def _run_tests(all_tests, log_name_base, failfast, extra_args, use_cache):
     global stop, executor, futures, system_compiler
     xmlname = log_name_base + '.xml'
+    cachename = log_name_base + '-cache.json'
     junit_root = ET.Element('testsuites')
     conf_time = 0
     build_time = 0
@@ -579,7 +622,13 @@ def _run_tests(all_tests, log_name_base, failfast, extra_args):
     passing_tests = 0
     failing_tests = 0
     skipped_tests = 0
+    cached_tests = 0
     commands = (compile_commands, clean_commands, install_commands, uninstall_commands)
+    # The durations are always recorded so the slowest test cases can be
+    # started first, the results of passing tests are only reused with
+    # --cache.
+    cache = load_test_cache(cachename)
+    meson_fingerprint = get_meson_fingerprint(extra_args) if use_cache else None
 
     try:
         # This fails in some CI environments for unknown reasons.
@@ -596,31 +645,63 @@ def _run_tests(all_tests, log_name_base, failfast, extra_args):
     num_workers *= 2
     executor = ProcessPoolExecutor(max_workers=num_workers)
 
+    # The test cases of all suites are run in one pool, so there is no
+    # barrier between the suites.
+    suites = {}
+    to_run = []
+    print()
     for name, test_cases, skipped in all_tests:
-        current_suite = ET.SubElement(junit_root, 'testsuite', {'name': name, 'tests': str(len(test_cases))})
-        print()
+        suites[name] = ET.SubElement(junit_root, 'testsuite', {'name': name, 'tests': str(len(test_cases))})
         if skipped:
             print(bold('Not running %s tests.' % name))
-        else:
-            print(bold('Running %s tests.' % name))
-        print()
-        futures = []
         for t in test_cases:
             # Jenkins screws us over by automatically sorting test cases by name
             # and getting it wrong by not doing logical number sorting.
             (testnum, testbase) = t.name.split(' ', 1)
             testname = '%.3d %s' % (int(testnum), testbase)
-            should_fail = False
-            if name.startswith('failing'):
-                should_fail = name.split('failing-')[1]
-            result = executor.submit(run_test, skipped, t.as_posix(), extra_args, system_compiler, backend, backend_flags, commands, should_fail)
-            futures.append((testname, t, result))
-        for (testname, t, result) in futures:
+            if skipped:
+                current_test = ET.SubElement(suites[name], 'testcase', {'name': testname,
+                                                                        'classname': name})
+                ET.SubElement(current_test, 'skipped', {})
+                skipped_tests += 1
+                continue
+            key = name + ':' + t.as_posix()
+            fingerprint = None
+            if use_cache:
+                fingerprint = get_test_fingerprint(meson_fingerprint, t)
+                if cache['passed'].get(key) == fingerprint:
+                    print('Cached test: %s' % t.as_posix())
+                    ET.SubElement(suites[name], 'testcase', {'name': testname,
+                                                             'classname': name,
+                                                             'time': '0.000'})
+                    cached_tests += 1
+                    passing_tests += 1
+                    continue
+            to_run.append((name, testname, t, key, fingerprint))
+
+    # Start the slowest test cases first, so the pool does not end up
+    # waiting for one long test at the end. Cases that were never run
+    # before are assumed to be slow.
+    to_run.sort(key=lambda c: -cache['durations'].get(c[3], math.inf))
+    print(bold('Running %d test cases.' % len(to_run)))
+    print()
+    futures = []
+    for name, testname, t, key, fingerprint in to_run:
+        should_fail = False
+        if name.startswith('failing'):
+            should_fail = name.split('failing-')[1]
+        result = executor.submit(run_test, False, t.as_posix(), extra_args, system_compiler, backend, backend_flags, commands, should_fail)
+        futures.append((testname, t, result, name, key, fingerprint))
+    future_cases = {f[2]: f for f in futures}
+
+    try:
+        for f in as_completed(future_cases):
+            (testname, t, result, name, key, fingerprint) = future_cases[f]
+            current_suite = suites[name]
             sys.stdout.flush()
-            try:
-                result = result.result()
-            except CancelledError:
+            if result.cancelled():
                 continue
+            result = result.result()
             if (result is None) or (('MESON_SKIP_TEST' in result.stdo) and (skippable(name, t.as_posix()))):
                 print(yellow('Skipping:'), t.as_posix())
                 current_test = ET.SubElement(current_suite, 'testcase', {'name': testname,
@@ -633,6 +714,7 @@ def _run_tests(all_tests, log_name_base, failfast, extra_args):
                     print(red('Failed test{} during {}: {!r}'.format(without_install, result.step.name, t.as_posix())))
                     print('Reason:', result.msg)
                     failing_tests += 1
+                    cache['passed'].pop(key, None)
                     if result.step == BuildStep.configure and result.mlog != no_meson_log_msg:
                         # For configure failures, instead of printing stdout,
                         # print the meson log if available since it's a superset
@@ -643,29 +725,37 @@ def _run_tests(all_tests, log_name_base, failfast, extra_args):
                     failing_logs.append(result.stde)
                     if failfast:
                         print("Cancelling the rest of the tests")
-                        for (_, _, res) in futures:
+                        for (_, _, res, _, _, _) in futures:
                             res.cancel()
                 else:
                     print('Succeeded test%s: %s' % (without_install, t.as_posix()))
                     passing_tests += 1
+                    if fingerprint is not None:
+                        cache['passed'][key] = fingerprint
                 conf_time += result.conftime
                 build_time += result.buildtime
                 test_time += result.testtime
-                total_time = conf_time + build_time + test_time
+                case_time = result.conftime + result.buildtime + result.testtime
+                cache['durations'][key] = round(case_time, 3)
                 log_text_file(logfile, t, result.stdo, result.stde)
                 current_test = ET.SubElement(current_suite, 'testcase', {'name': testname,
                                                                          'classname': name,
-                                                                         'time': '%.3f' % total_time})
+                                                                         'time': '%.3f' % case_time})
                 if result.msg != '':
                     ET.SubElement(current_test, 'failure', {'message': result.msg})
                 stdoel = ET.SubElement(current_test, 'system-out')
                 stdoel.text = result.stdo
                 stdeel = ET.SubElement(current_test, 'system-err')
                 stdeel.text = result.stde
+    finally:
+        save_test_cache(cachename, cache)
 
-        if failfast and failing_tests > 0:
-            break
+    # The results arrive in the order the tests finish
+    for current_suite in suites.values():
+        current_suite[:] = sorted(current_suite, key=lambda e: e.get('name'))
 
+    if cached_tests:
+        print("\nTests skipped because they passed before: %d" % cached_tests)
     print("\nTotal configuration time: %.2fs" % conf_time)
     print("Total build time: %.2fs" % build_time)
     print("Total test time: %.2fs" % test_time)
@@ -761,6 +851,9 @@ if __name__ == '__main__':
                         choices=backendlist)
     parser.add_argument('--failfast', action='store_true',
                         help='Stop running if test case fails')
+    parser.add_argument('--cache', action='store_true',
+                        help='Skip test cases that passed before, if neither they nor the '
+                        'Meson sources changed since.')
     options = parser.parse_args()
     setup_commands(options.backend)
 
@@ -772,7 +865,8 @@ if __name__ == '__main__':
     check_meson_commands_work()
     try:
         all_tests = detect_tests_to_run()
-        (passing_tests, failing_tests, skipped_tests) = run_tests(all_tests, 'meson-test-run', options.failfast, options.extra_args)
+        (passing_tests, failing_tests, skipped_tests) = run_tests(all_tests, 'meson-test-run', options.failfast,
+                                                                  options.extra_args, options.cache)
     except StopException:
         pass
     print('\nTotal passed tests:', green(str(passing_tests)))
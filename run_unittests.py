@@ -27,7 +27,10 @@ import unittest
 import platform
 import pickle
 import functools
+import xml.etree.ElementTree as ET
+import io
 from itertools import chain
+from collections import OrderedDict
 from unittest import mock
 from configparser import ConfigParser
 from contextlib import contextmanager
@@ -53,6 +56,7 @@ from mesonbuild.mesonlib import MesonException, EnvironmentException
 from mesonbuild.dependencies import PkgConfigDependency, ExternalProgram
 from mesonbuild.build import Target
 import mesonbuild.modules.pkgconfig
+import mesonbuild.mtest
 
 from run_tests import (
     Backend, FakeBuild, FakeCompilerOptions,
@@ -589,6 +593,31 @@ class InternalTests(unittest.TestCase):
         cmd = ['@OUTPUT@.out', 'ordinary', 'strings']
         self.assertRaises(ME, substfunc, cmd, d)
 
+    def test_command_template(self):
+        cmd = ['prog', '@INPUT@', '-o', '@OUTPUT0@', '--name=@BASENAME@@OUTDIR@', '@PLAINNAME@', 3]
+        template = mesonbuild.mesonlib.CommandTemplate(cmd)
+        self.assertEqual(template.templates, ['@INPUT@', '@OUTPUT0@', '@BASENAME@',
+                                              '@OUTDIR@', '@PLAINNAME@'])
+        # The same template is expanded with different values
+        for name in ('foo', 'bar'):
+            values = {'@INPUT@': [name + '.c', 'common.c'], '@OUTPUT0@': name + '.o',
+                      '@BASENAME@': name, '@OUTDIR@': 'dir'}
+            self.assertEqual(template.expand(values),
+                             ['prog', name + '.c', 'common.c', '-o', name + '.o',
+                              '--name=' + name + 'dir', '@PLAINNAME@', 3])
+        # A list can only be used as part of a string if it has one item
+        template = mesonbuild.mesonlib.CommandTemplate(['-I@INPUT@'])
+        self.assertEqual(template.expand({'@INPUT@': ['foo']}), ['-Ifoo'])
+        self.assertRaises(MesonException, template.expand, {'@INPUT@': ['foo', 'bar']})
+        # Generator extra arguments are only replaced as a whole argument
+        from mesonbuild.backend.backends import generator_template_regex
+        template = mesonbuild.mesonlib.CommandTemplate(['@EXTRA_ARGS@', '-x@EXTRA_ARGS@', '@INPUT@'],
+                                                       generator_template_regex)
+        self.assertEqual(template.expand({'@EXTRA_ARGS@': ['-a', '-b'], '@INPUT@': 'foo'}),
+                         ['-a', '-b', '-x@EXTRA_ARGS@', 'foo'])
+        self.assertEqual(template.expand({'@EXTRA_ARGS@': [], '@INPUT@': 'foo'}),
+                         ['-x@EXTRA_ARGS@', 'foo'])
+
     def test_needs_exe_wrapper_override(self):
         config = ConfigParser()
         config['binaries'] = {
@@ -674,6 +703,177 @@ class InternalTests(unittest.TestCase):
         kwargs = {'sources': [1, 2, 3], 'pch_sources': [4, 5, 6]}
         self.assertEqual([[1, 2, 3], [4, 5, 6]], extract(kwargs, 'sources', 'pch_sources'))
 
+    def test_sectioned_file(self):
+        dump = mesonbuild.mesonlib.dump_sectioned_file
+        load = mesonbuild.mesonlib.load_sectioned_file
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'data.dat')
+            with open(fname, 'wb') as f:
+                dump(f, OrderedDict([('main', {'big': list(range(100))}), ('small', 'value')]))
+            self.assertEqual(load(fname, 'small'), 'value')
+            self.assertEqual(load(fname, 'main'), {'big': list(range(100))})
+            with self.assertRaises(KeyError):
+                load(fname, 'nonexisting')
+            # A plain pickle.load() returns the first section
+            with open(fname, 'rb') as f:
+                self.assertEqual(pickle.load(f), {'big': list(range(100))})
+            # Files without table of contents are rejected
+            with open(fname, 'wb') as f:
+                pickle.dump('value', f)
+            with self.assertRaises(KeyError):
+                load(fname, 'small')
+            # Sections can follow other data in the same file
+            with open(fname, 'wb') as f:
+                f.write(b'header')
+                dump(f, OrderedDict([('main', 'first'), ('small', 'value')]))
+            self.assertEqual(load(fname, 'small'), 'value')
+            self.assertEqual(load(fname, 'main'), 'first')
+
+    def test_regen_checker(self):
+        from mesonbuild.scripts import regen_checker
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.mkdir(os.path.join(tmpdir, 'meson-private'))
+            depfile = os.path.join(tmpdir, 'meson.build')
+            with open(depfile, 'w'):
+                pass
+            stamp = os.path.join(tmpdir, 'meson-private', 'regen.stamp')
+            regeninfo = {'source_dir': tmpdir, 'build_dir': tmpdir, 'depfiles': ['meson.build'],
+                         'stamp_file': stamp}
+            mtime = os.stat(depfile).st_mtime
+            with mock.patch('sys.stdout'):
+                self.assertFalse(regen_checker.need_regen(regeninfo, mtime + 1))
+            self.assertTrue(os.path.exists(stamp))
+            self.assertTrue(regen_checker.need_regen(regeninfo, mtime - 1))
+
+    def test_target_graph(self):
+        def lib(cls, name, link_with=(), link_whole=()):
+            l = cls.__new__(cls)
+            l.name = name
+            l.link_targets = list(link_with)
+            l.link_whole_targets = list(link_whole)
+            return l
+
+        static = mesonbuild.build.StaticLibrary
+        shared = mesonbuild.build.SharedLibrary
+        # Diamond: top -> (left, right) -> bottom, with a shared library
+        # and a link_whole in between
+        bottom = lib(static, 'bottom')
+        sh = lib(shared, 'sh', [bottom])
+        left = lib(static, 'left', [bottom, sh])
+        whole = lib(static, 'whole', [bottom])
+        right = lib(static, 'right', [bottom], [whole])
+        top = lib(shared, 'top', [left, right])
+
+        def names(targets):
+            return [t.name for t in targets]
+
+        self.assertEqual(names(top.get_dependencies()), ['left', 'bottom', 'sh', 'right', 'whole'])
+        self.assertEqual(names(top.get_dependencies(internal=False)), ['left', 'bottom', 'sh', 'right'])
+        self.assertEqual(names(right.get_dependencies()), ['bottom', 'whole'])
+        self.assertEqual(names(top.get_transitive_link_deps()), ['sh'])
+        self.assertEqual(names(top.get_all_link_deps()), ['top', 'sh'])
+        # Deep graphs do not hit the recursion limit
+        libs = [lib(static, 'l0')]
+        for i in range(1, 3 * sys.getrecursionlimit()):
+            libs.append(lib(static, 'l{}'.format(i), [libs[-1]]))
+        self.assertEqual(len(libs[-1].get_dependencies()), len(libs) - 1)
+        self.assertEqual(libs[-1].get_dependencies()[:2], [libs[-2], libs[-3]])
+
+    def test_benchmark_regression(self):
+        is_regression = mesonbuild.mtest.is_regression
+        baseline = [1.00, 1.02, 0.98, 1.01, 0.99]
+        # Noise and changes below the threshold are not regressions
+        self.assertFalse(is_regression(baseline, [1.01, 0.99, 1.03, 1.00, 0.98], 5))
+        self.assertFalse(is_regression(baseline, [1.04, 1.03, 1.05, 1.04, 1.03], 5))
+        self.assertFalse(is_regression(baseline, [0.5, 0.5, 0.5], 5))
+        self.assertTrue(is_regression(baseline, [1.20, 1.22, 1.19, 1.21, 1.20], 5))
+        # A slower median is not significant if the runs vary a lot
+        self.assertFalse(is_regression(baseline, [0.9, 2.5, 1.1, 0.8, 3.0], 5))
+        # Single runs can only be compared with the threshold
+        self.assertTrue(is_regression([1.0], [1.1], 5))
+        self.assertFalse(is_regression([1.0], [1.04], 5))
+
+    def test_internal_command_imports(self):
+        '''
+        Test that running an --internal helper script only imports the
+        modules it needs, since Ninja runs some of them for many build steps.
+        '''
+        code = textwrap.dedent('''\
+            import sys
+            from mesonbuild import mesonmain
+            mesonmain.run(sys.argv[1:], 'meson.py')
+            print(' '.join(m for m in sys.modules if m.startswith('mesonbuild')))
+            ''')
+        allowed = {'mesonbuild', 'mesonbuild.mesonmain', 'mesonbuild.mesonlib',
+                   'mesonbuild.mlog', 'mesonbuild.scripts'}
+        with tempfile.TemporaryDirectory() as d:
+            for script, args in [('delwithsuffix', ['delsuffix', d, '.none']),
+                                 ('capture', ['capture', os.path.join(d, 'out'), '--',
+                                              sys.executable, '-c', 'pass']),
+                                 ('depscan', ['depscan'])]:
+                out = subprocess.check_output([sys.executable, '-c', code, '--internal'] + args,
+                                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                                              universal_newlines=True)
+                modules = set(out.split('\n')[-2].split())
+                self.assertEqual(modules - allowed, {'mesonbuild.scripts.' + script})
+
+    def test_depscan_unknown_parent(self):
+        from mesonbuild.scripts import depscan
+        with tempfile.TemporaryDirectory() as d:
+            src = os.path.join(d, 'sub.f90')
+            with open(src, 'w') as f:
+                f.write('submodule (parent) child\nend submodule child\n')
+            scaninfo = {'module_dir': 'priv', 'sources': [[src, 'priv/sub.f90.o']]}
+            with open(os.path.join(d, 'depscan.json'), 'w') as f:
+                json.dump(scaninfo, f)
+            with mock.patch('sys.stderr', new_callable=io.StringIO) as err:
+                self.assertEqual(depscan.run([os.path.join(d, 'depscan.json'),
+                                              os.path.join(d, 'depscan.dd')]), 1)
+            self.assertEqual(err.getvalue(),
+                             'submodule child relies on parent module parent that was not found.\n')
+            self.assertFalse(os.path.exists(os.path.join(d, 'depscan.dd')))
+
+    def test_gresource_dependencies(self):
+        gnome = mesonbuild.modules.gnome
+
+        class Mock:
+            pass
+
+        with tempfile.TemporaryDirectory() as srcdir:
+            os.makedirs(os.path.join(srcdir, 'sub', 'data'))
+            for f in ('sub/res1.txt', 'sub/data/res1.txt', 'sub/data/res2.txt'):
+                with open(os.path.join(srcdir, f), 'w') as f:
+                    f.write('data')
+            with open(os.path.join(srcdir, 'sub', 'res.gresource.xml'), 'w') as f:
+                f.write(textwrap.dedent('''\
+                    <?xml version="1.0" encoding="UTF-8"?>
+                    <gresources>
+                      <gresource prefix="/com/example/test">
+                        <file>res1.txt</file>
+                        <file compressed="true">res2.txt</file>
+                        <file>gen.txt</file>
+                      </gresource>
+                    </gresources>
+                    '''))
+            self.assertEqual(gnome.get_gresource_files(os.path.join(srcdir, 'sub', 'res.gresource.xml')),
+                             ['res1.txt', 'res2.txt', 'gen.txt'])
+
+            state = Mock()
+            state.subdir = 'sub'
+            state.environment = Mock()
+            state.environment.get_source_dir = lambda: srcdir
+            gen = mesonbuild.mesonlib.File.from_built_file('sub', 'gen.txt')
+            dep_files, depends, subdirs = gnome.GnomeModule._get_gresource_dependencies(
+                None, state, os.path.join('sub', 'res.gresource.xml'), ['data'], [gen])
+            self.assertEqual([str(f) for f in dep_files],
+                             [os.path.join('.', 'sub', 'res1.txt'), os.path.join('.', 'sub', 'data', 'res2.txt'), str(gen)])
+            self.assertEqual(depends, [])
+            self.assertEqual(subdirs, ['sub'])
+
+            with self.assertRaises(MesonException):
+                gnome.GnomeModule._get_gresource_dependencies(
+                    None, state, os.path.join('sub', 'res.gresource.xml'), ['data'], [])
+
     def test_pkgconfig_module(self):
 
         class Mock:
@@ -1401,6 +1601,31 @@ class AllPlatformTests(BasePlatformTests):
         self.assertEqual(conf_file('@VAR@\n@VAR@\n', confdata), 'foo\nfoo\n')
         self.assertEqual(conf_file('@VAR@\r\n@VAR@\r\n', confdata), 'foo\r\nfoo\r\n')
 
+    def test_do_conf_file_template_cache(self):
+        with tempfile.TemporaryDirectory() as d:
+            fin = os.path.join(d, 'config.h.in')
+            fout = os.path.join(d, 'config.h')
+            with open(fin, 'w') as f:
+                f.write('#mesondefine FLAG\nv=@VAR@ \\@VAR@ @MISSING@\n')
+            flags = {'FLAG': (True, None), 'VAR': ('foo', None)}
+            missing, useless = mesonbuild.mesonlib.do_conf_file(fin, fout, flags, 'meson')
+            self.assertEqual(missing, {'MISSING'})
+            self.assertFalse(useless)
+            with open(fout) as f:
+                self.assertEqual(f.read(), '#define FLAG\nv=foo @VAR@ \n')
+            # Same content, so the compiled template is reused
+            template = mesonbuild.mesonlib.get_conf_template(['#mesondefine FLAG\n', 'v=@VAR@ \\@VAR@ @MISSING@\n'], 'meson')
+            self.assertEqual(list(template.names), ['FLAG', 'VAR', 'MISSING'])
+            self.assertEqual(template.last_values, [(bool, True), (str, 'foo'), None])
+            # Unchanged output is not rewritten
+            os.utime(fout, (0, 0))
+            mesonbuild.mesonlib.do_conf_file(fin, fout, flags, 'meson')
+            self.assertEqual(os.stat(fout).st_mtime, 0)
+            # True and 1 are substituted differently
+            mesonbuild.mesonlib.do_conf_file(fin, fout, {'FLAG': (1, None), 'VAR': ('foo', None)}, 'meson')
+            with open(fout) as f:
+                self.assertEqual(f.read(), '#define FLAG 1\nv=foo @VAR@ \n')
+
     def test_absolute_prefix_libdir(self):
         '''
         Tests that setting absolute paths for --prefix and --libdir work. Can't
@@ -1563,6 +1788,83 @@ class AllPlatformTests(BasePlatformTests):
         # and the object must have changed
         self.assertNotEqual(before, after)
 
+    def test_compdb_regenerate(self):
+        '''
+        Test that the compilation database is only rewritten when it changes
+        and that per-subproject databases are written on request.
+        '''
+        testdir = os.path.join(self.common_test_dir, '46 subproject')
+        self.init(testdir)
+        compdb_file = os.path.join(self.builddir, 'compile_commands.json')
+        compdb = self.get_compdb()
+        self.assertTrue(any(i['file'].endswith('user.c') for i in compdb))
+        mtime = os.stat(compdb_file).st_mtime_ns
+        self.init(testdir, extra_args=['--reconfigure'])
+        self.assertEqual(os.stat(compdb_file).st_mtime_ns, mtime)
+
+        subproject_compdb_file = os.path.join(self.builddir, 'subprojects', 'sublib', 'compile_commands.json')
+        self.assertPathDoesNotExist(subproject_compdb_file)
+        self.init(testdir, extra_args=['--reconfigure', '-Dbackend_subproject_compdb=true'])
+        with open(subproject_compdb_file) as f:
+            subproject_compdb = json.load(f)
+        self.assertGreater(len(subproject_compdb), 0)
+        self.assertEqual(len(compdb), len(self.get_compdb()))
+        for i in subproject_compdb:
+            self.assertIn(i, compdb)
+            self.assertIn('sublib', i['file'])
+
+    def test_configure_trace(self):
+        '''
+        Test that --trace writes a Chrome trace of the configure step and
+        prints the slowest steps.
+        '''
+        testdir = os.path.join(self.common_test_dir, '117 subdir subproject')
+        out = self.init(testdir, extra_args=['--trace'])
+        self.assertIn('Slowest configure steps:', out)
+        with open(os.path.join(self.logdir, 'meson-trace.json')) as f:
+            trace = json.load(f)
+        events = trace['traceEvents']
+        for e in events:
+            self.assertEqual(e['ph'], 'X')
+            self.assertGreaterEqual(e['dur'], 0)
+        names = {(e['cat'], e['name']) for e in events}
+        self.assertIn(('subdir', 'prog'), names)
+        self.assertIn(('subproject', 'sub'), names)
+        self.assertIn(('phase', 'interpreter'), names)
+        self.assertIn(('phase', 'backend ninja'), names)
+        self.assertTrue(any(cat == 'target' for cat, _ in names))
+        # Tracing is off unless asked for
+        os.unlink(os.path.join(self.logdir, 'meson-trace.json'))
+        self.init(testdir, extra_args=['--reconfigure'])
+        self.assertPathDoesNotExist(os.path.join(self.logdir, 'meson-trace.json'))
+
+    def test_log_level(self):
+        '''
+        Test that --log-level controls how much of the compiler checks ends
+        up in the log file.
+        '''
+        testdir = os.path.join(self.common_test_dir, '35 has header')
+        self.init(testdir)
+        with open(os.path.join(self.logdir, 'meson-log.txt'), encoding='utf-8') as f:
+            log = f.read()
+        self.assertIn('Running compile:', log)
+        self.assertIn('Code:', log)
+        self.init(testdir, extra_args=['--wipe', '--log-level=debug'])
+        with open(os.path.join(self.logdir, 'meson-log.txt'), encoding='utf-8') as f:
+            log = f.read()
+        self.assertIn('Running compile:', log)
+        self.assertNotIn('Code:', log)
+        self.init(testdir, extra_args=['--wipe', '--log-level=info'])
+        with open(os.path.join(self.logdir, 'meson-log.txt'), encoding='utf-8') as f:
+            log = f.read()
+        self.assertNotIn('Running compile:', log)
+        self.assertIn('Has header', log)
+        # The level is kept when regenerating
+        self.init(testdir, extra_args=['--reconfigure'])
+        with open(os.path.join(self.logdir, 'meson-log.txt'), encoding='utf-8') as f:
+            log = f.read()
+        self.assertNotIn('Running compile:', log)
+
     def test_static_compile_order(self):
         '''
         Test that the order of files in a compiler command-line while compiling
@@ -1695,6 +1997,105 @@ class AllPlatformTests(BasePlatformTests):
         self.assertRaises(subprocess.CalledProcessError, self._run,
                           self.mtest_command + ['--setup=main:onlyinbar'])
 
+    def test_benchmark_runs(self):
+        '''
+        Test that benchmarks are run several times, that their statistics
+        are written to the JSON log and that they can be compared with an
+        earlier log.
+        '''
+        testdir = os.path.join(self.common_test_dir, '96 benchmark')
+        self.init(testdir)
+        self.build()
+        self._run(self.mtest_command + ['--benchmark', '--benchmark-warmup=1', '--benchmark-runs=3'])
+        with open(os.path.join(self.logdir, 'testlog.json')) as f:
+            result = json.loads(f.readline())
+        stats = result['benchmark']
+        self.assertEqual(stats['warmup'], 1)
+        self.assertEqual(len(stats['durations']), 3)
+        self.assertEqual(result['duration'], stats['median'])
+        self.assertEqual(stats['min'], min(stats['durations']))
+        if not is_windows():
+            self.assertEqual(len(stats['max_rss_kib']), 3)
+        self.assertIsNone(stats['baseline_median'])
+
+        # Compare with a baseline that is much faster
+        baseline = os.path.join(self.builddir, 'baseline.json')
+        result['benchmark']['durations'] = [1e-6] * 3
+        with open(baseline, 'w') as f:
+            f.write(json.dumps(result) + '\n')
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            self._run(self.mtest_command + ['--benchmark', '--benchmark-runs=3', '--compare', baseline])
+        self.assertIn('REGRESSION', cm.exception.stdout)
+        self.assertIn('Regressions:           1', cm.exception.stdout)
+        # and one that is much slower
+        result['benchmark']['durations'] = [1000.0] * 3
+        with open(baseline, 'w') as f:
+            f.write(json.dumps(result) + '\n')
+        out = self._run(self.mtest_command + ['--benchmark', '--benchmark-runs=3', '--compare', baseline])
+        self.assertIn('Regressions:           0', out)
+
+        with self.assertRaises(subprocess.CalledProcessError):
+            self._run(self.mtest_command + ['--benchmark-runs=3'])
+
+    def test_test_cache(self):
+        '''
+        Test that tests that passed are skipped with --cache until their
+        executable or a library it links to changes.
+        '''
+        testdir = os.path.join(self.common_test_dir, '6 linkshared')
+        self.init(testdir)
+        self.build()
+        out = self._run(self.mtest_command + ['--cache'])
+        self.assertNotIn('(cached)', out)
+        self.assertIn('Cached:                0', out)
+        out = self._run(self.mtest_command + ['--cache'])
+        self.assertIn('Cached:                2', out)
+        with open(os.path.join(self.logdir, 'testlog.json')) as f:
+            results = [json.loads(l) for l in f]
+        self.assertTrue(all(r['cached'] for r in results))
+        # Without --cache everything is run
+        out = self._run(self.mtest_command)
+        self.assertNotIn('(cached)', out)
+        # Changing the arguments or a library only reruns the affected tests
+        out = self._run(self.mtest_command + ['--cache', '--test-args=foo'])
+        self.assertIn('Cached:                0', out)
+        lib = [f for f in os.listdir(self.builddir) if f.startswith('libmycpplib')][0]
+        mtime = os.stat(os.path.join(self.builddir, lib)).st_mtime + 10
+        os.utime(os.path.join(self.builddir, lib), (mtime, mtime))
+        out = self._run(self.mtest_command + ['--cache', '--no-rebuild', '--test-args=foo'])
+        self.assertIn('Cached:                1', out)
+        self.assertRegex(out, r'runtest\s+OK\s+0\.00 s \(cached\)')
+
+        with self.assertRaises(subprocess.CalledProcessError):
+            self._run(self.mtest_command + ['--cache', '--repeat=2'])
+
+    def test_test_index(self):
+        '''
+        Test that meson test only unpickles the tests it runs and that it
+        does not rebuild when Ninja has nothing to do.
+        '''
+        testdir = os.path.join(self.common_test_dir, '98 suites')
+        self.init(testdir)
+        self.build()
+        with open(os.path.join(self.privatedir, 'meson_test_index.json')) as f:
+            index = json.load(f)
+        self.assertEqual(sorted(t['name'] for t in index), ['exe1', 'exe2', 'sub1', 'sub2'])
+        # Overwrite all tests but exe2, loading any of them would fail
+        datafile = os.path.join(self.privatedir, 'meson_test_setup.dat')
+        with open(datafile, 'r+b') as f:
+            ends = [t['offset'] for t in index[1:]] + [os.path.getsize(datafile)]
+            for t, end in zip(index, ends):
+                if t['name'] != 'exe2':
+                    f.seek(t['offset'])
+                    f.write(b'\0' * (end - t['offset']))
+        out = self._run(self.mtest_command + ['--list'])
+        self.assertEqual(len(out.splitlines()), 4)
+        out = self._run(self.mtest_command + ['exe2'])
+        self.assertRegex(out, r'exe2\s+OK')
+        self.assertNotIn('ninja: no work to do', out)
+        out = self._run(self.mtest_command + ['--suite', 'super-special'])
+        self.assertRegex(out, r'exe2\s+OK')
+
     def test_testsetup_default(self):
         testdir = os.path.join(self.unit_test_dir, '47 testsetup default')
         self.init(testdir)
@@ -2068,6 +2469,27 @@ class AllPlatformTests(BasePlatformTests):
         meson_exe_dat2 = glob(os.path.join(self.privatedir, 'meson_exe*.dat'))
         self.assertListEqual(meson_exe_dat1, meson_exe_dat2)
 
+    def test_meson_exe_shared_data(self):
+        '''
+        Test that the arguments and the capture file given on the command
+        line of meson_exe are used with the serialized executable, which is
+        how generators share one data file between all their inputs.
+        '''
+        from mesonbuild.backend.backends import ExecutableSerialisation
+        os.makedirs(self.builddir, exist_ok=True)
+        exe = ExecutableSerialisation('printer', [sys.executable],
+                                      ['-c', 'import sys; print(" ".join(sys.argv[1:]))', 'first'],
+                                      {}, False, None, self.builddir, [], None)
+        exe_data = os.path.join(self.builddir, 'meson_exe_printer.dat')
+        with open(exe_data, 'wb') as f:
+            pickle.dump(exe, f)
+        for name in ('foo', 'bar'):
+            out = os.path.join(self.builddir, name + '.txt')
+            self._run(self.meson_command + ['--internal', 'exe', '--capture', out,
+                                            exe_data, '--', name, '--' + name])
+            with open(out) as f:
+                self.assertEqual(f.read().strip(), 'first {0} --{0}'.format(name))
+
     def test_source_changes_cause_rebuild(self):
         '''
         Test that changes to sources and headers cause rebuilds, but not
@@ -2191,6 +2613,27 @@ int main(int argc, char **argv) {
             checksumfile = distfile + '.sha256sum'
             self.assertPathExists(distfile)
             self.assertPathExists(checksumfile)
+            self.assertPathDoesNotExist(os.path.join(self.distdir, 'disttest-1.4.3.tar'))
+
+            self._run(self.meson_command + ['dist', '-C', self.builddir,
+                                            '--formats=zip,gztar,xztar', '-j', '2'])
+            for ext in ('.tar.xz', '.tar.gz', '.zip'):
+                distfile = os.path.join(self.distdir, 'disttest-1.4.3' + ext)
+                self.assertPathExists(distfile)
+                self.assertPathExists(distfile + '.sha256sum')
+                shutil.unpack_archive(distfile, os.path.join(self.builddir, 'unpack' + ext))
+                self.assertPathExists(os.path.join(self.builddir, 'unpack' + ext,
+                                                   'disttest-1.4.3', 'distexe.c'))
+
+            # A failing compressor is reported and the temporary files are removed
+            from mesonbuild.scripts import dist
+            with mock.patch.object(dist, 'create_gz', side_effect=OSError('disk full')), \
+                    mock.patch('sys.stdout', new_callable=io.StringIO) as out:
+                rc = dist.run_dist(project_dir, self.builddir, self.meson_command, ['gztar'], 1)
+            self.assertEqual(rc, 1)
+            self.assertIn('Creating disttest-1.4.3.tar.gz failed: disk full', out.getvalue())
+            self.assertPathDoesNotExist(os.path.join(self.distdir, 'disttest-1.4.3.tar'))
+            self.assertPathDoesNotExist(os.path.join(self.distdir, 'disttest-1.4.3'))
 
     def test_rpath_uses_ORIGIN(self):
         '''
@@ -3259,6 +3702,28 @@ recommended as it is not supported on some platforms''')
         self.assertEqual(Path(testfile).read_text(),
                          Path(goodfile).read_text())
 
+    def test_introspect_batch_without_configured_build(self):
+        dirs = [os.path.join(self.common_test_dir, '6 linkshared'),
+                os.path.join(self.common_test_dir, '47 subproject options'),
+                os.path.join(self.builddir, 'nonexistent')]
+        p = subprocess.run(self.mintro_command + ['--projectinfo', '--targets', '--batch'] + dirs,
+                           stdout=subprocess.PIPE, universal_newlines=True)
+        self.assertEqual(p.returncode, 1)
+        results = {}
+        for line in p.stdout.splitlines():
+            r = json.loads(line)
+            results[r['sourcedir']] = r
+        self.assertEqual(set(results), set(dirs))
+        res = results[dirs[0]]
+        self.assertIsNone(res['error'])
+        self.assertEqual(res['projectinfo'],
+                         self.introspect_directory(os.path.join(dirs[0], 'meson.build'), '--projectinfo'))
+        self.assertEqual(sorted(t['id'] for t in res['targets']),
+                         ['cppprog@exe', 'mycpplib@sha', 'mylib@sha', 'prog@exe'])
+        self.assertNotIn('buildoptions', res)
+        self.assertEqual(results[dirs[1]]['projectinfo']['descriptive_name'], 'suboptions')
+        self.assertIsNotNone(results[dirs[2]]['error'])
+
     def test_introspect_buildoptions_without_configured_build(self):
         testdir = os.path.join(self.unit_test_dir, '53 introspect buildoptions')
         testfile = os.path.join(testdir, 'meson.build')
@@ -3479,6 +3944,86 @@ recommended as it is not supported on some platforms''')
 
         self.assertListEqual(res1, res2)
 
+    def test_introspect_target_shards(self):
+        testdir = os.path.join(self.unit_test_dir, '52 introspection')
+        self.init(testdir)
+        res_all = self.introspect('--targets')
+        sharddir = os.path.join(self.builddir, 'meson-info', 'targets')
+        with open(os.path.join(sharddir, 'index.json'), 'r') as fp:
+            index = json.load(fp)
+        self.assertEqual([i['id'] for i in index], [i['id'] for i in res_all])
+        mtimes = {}
+        for i in index:
+            shard = os.path.join(sharddir, i['file'])
+            with open(shard, 'r') as fp:
+                self.assertIn(json.load(fp), res_all)
+            mtimes[shard] = os.stat(shard).st_mtime_ns
+
+        # Filtering only returns the requested targets
+        res = self.introspect(['--targets', '--target-subdir', 'sharedlib'])
+        self.assertEqual([i['name'] for i in res], ['sharedTestLib'])
+        res = self.introspect(['--targets', '--target-id', 'test1@exe', '--target-subdir', 'staticlib'])
+        self.assertEqual(sorted([i['name'] for i in res]), ['staticTestLib', 'test1'])
+
+        # Unchanged targets are not rewritten on regeneration
+        self.init(testdir, extra_args=['--reconfigure'])
+        for shard, mtime in mtimes.items():
+            self.assertEqual(os.stat(shard).st_mtime_ns, mtime)
+
+    def test_introspect_serve(self):
+        testdir = os.path.join(self.unit_test_dir, '52 introspection')
+        self.init(testdir)
+        res_all = self.introspect('--all')
+        p = subprocess.Popen(self.mintro_command + ['--serve', self.builddir],
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                             universal_newlines=True)
+
+        def call(method, params=None, req_id=1):
+            req = {'jsonrpc': '2.0', 'id': req_id, 'method': method}
+            if params is not None:
+                req['params'] = params
+            p.stdin.write(json.dumps(req) + '\n')
+            p.stdin.flush()
+            return json.loads(p.stdout.readline())
+
+        try:
+            res = call('targets', req_id=42)
+            self.assertEqual(res['id'], 42)
+            self.assertEqual(res['result'], res_all['targets'])
+            self.assertEqual(call('all')['result'], res_all)
+            self.assertEqual(call('nonexistent')['error']['code'], -32601)
+            self.assertIn('directories', call('meson_info')['result'])
+            # Invalid parameters are reported and the server keeps running
+            self.assertEqual(call('targets', {'ids': 5})['error']['code'], -32602)
+            self.assertEqual(call('targets', {'subdirs': [1]})['error']['code'], -32602)
+            self.assertIn('directories', call('meson_info')['result'])
+            # A regeneration is picked up without restarting the server
+            self.setconf('-Dbuildtype=release')
+            opts = {i['name']: i['value'] for i in call('buildoptions')['result']}
+            self.assertEqual(opts['buildtype'], 'release')
+        finally:
+            p.stdin.close()
+            p.wait()
+        self.assertEqual(p.returncode, 0)
+        # Unexpected errors are returned as internal errors
+        from mesonbuild import mintro
+
+        def broken(cache, params):
+            raise TypeError('broken')
+        res = mintro.handle_rpc_request(None, {'broken': broken},
+                                        '{"jsonrpc": "2.0", "id": 1, "method": "broken"}')
+        self.assertEqual(res['error']['code'], -32603)
+        # Only a stale socket is replaced, never another file
+        if not is_windows():
+            notsocket = os.path.join(self.builddir, 'notsocket')
+            with open(notsocket, 'w') as f:
+                f.write('data')
+            out = subprocess.run(self.mintro_command + ['--serve', '--socket', notsocket, self.builddir],
+                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            self.assertNotEqual(out.returncode, 0)
+            with open(notsocket) as f:
+                self.assertEqual(f.read(), 'data')
+
 class FailureTests(BasePlatformTests):
     '''
     Tests that test failure conditions. Build files here should be dynamically
@@ -4310,6 +4855,113 @@ class LinuxlikeTests(BasePlatformTests):
         self.assertPathDoesNotExist(os.path.join(self.builddir, 'user@exe/user-unity.c'))
         self.build()
 
+    def test_unity_size(self):
+        '''
+        Test that unity_size splits the sources into several unity files
+        and that each source stays in its unity file when others are added.
+        '''
+        testdir = os.path.join(self.unit_test_dir, '55 unity batches')
+
+        def get_batches(name):
+            target_dir = os.path.join(self.builddir, Target.construct_id_from_path('', name, '@sta'))
+            batches = {}
+            for f in glob(os.path.join(target_dir, name + '-unity*.c')):
+                with open(f) as ofile:
+                    batches[os.path.basename(f)] = ofile.read().splitlines()
+            return batches
+
+        self.init(testdir, extra_args=['--unity=on', '-Dunity_size=3'])
+        batches = get_batches('batched')
+        self.assertGreater(len(batches), 1)
+        self.assertEqual(sum(len(b) for b in batches.values()), 12)
+        for b in batches.values():
+            self.assertLessEqual(len(b), 6)
+        self.assertEqual(list(get_batches('single').keys()), ['single-unity.c'])
+        self.build()
+        self.run_tests()
+
+        sources = mesonbuild.mesonlib.split_unity_sources(['s{}.c'.format(i) for i in range(100)], 4)
+        more_sources = mesonbuild.mesonlib.split_unity_sources(['s{}.c'.format(i) for i in range(101)], 4)
+        added_batch = [b for b in more_sources if 's100.c' in b[1]][0]
+        self.assertEqual([b for b in sources if b[0] != added_batch[0]],
+                         [b for b in more_sources if b[0] != added_batch[0]])
+
+    def test_compile_pools(self):
+        '''
+        Test that compile jobs are put into the configured Ninja pools and
+        that pool membership is visible in introspection.
+        '''
+        if self.backend is not Backend.ninja:
+            raise unittest.SkipTest('Compile pools are only supported by the Ninja backend')
+        testdir = os.path.join(self.unit_test_dir, '56 compile pools')
+        out = self.init(testdir)
+        self.assertIn("Compile pool 'heavy' of target 'heavy' is not defined", out)
+        for t in self.introspect('--targets'):
+            for s in t['target_sources']:
+                self.assertIsNone(s['pool'])
+
+        self.init(testdir, extra_args=['--wipe', '-Dbackend_max_compile_jobs=4',
+                                       '-Dbackend_compile_pools=heavy:1',
+                                       '-Dbackend_compile_pool_globs=heavy:sub/*.c'])
+        with open(os.path.join(self.builddir, 'build.ninja')) as f:
+            ninja = f.read()
+        self.assertIn('pool compile_pool\n  depth = 4\n', ninja)
+        self.assertIn('pool heavy\n  depth = 1\n', ninja)
+        pools = {}
+        for t in self.introspect('--targets'):
+            for s in t['target_sources']:
+                for src in s['sources']:
+                    pools[os.path.basename(src)] = s['pool']
+        self.assertEqual(pools, {'light.c': 'compile_pool', 'heavy_glob.c': 'heavy', 'heavy.c': 'heavy'})
+        self.build()
+
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.init(testdir, extra_args=['--wipe', '-Dbackend_compile_pool_globs=undefined:*.c'])
+
+    @skip_if_not_language('fortran')
+    def test_fortran_dyndep(self):
+        '''
+        Test that the Fortran module dependencies are found at build time
+        when Ninja supports dyndep files.
+        '''
+        if self.backend is not Backend.ninja:
+            raise unittest.SkipTest('Dyndep files are only supported by the Ninja backend')
+        if detect_ninja('1.10') is None:
+            raise unittest.SkipTest('Dyndep files need Ninja 1.10 or newer')
+        testdir = os.path.join(self.src_root, 'test cases', 'fortran', '2 modules')
+        self.init(testdir)
+        with open(os.path.join(self.builddir, 'build.ninja')) as f:
+            ninja = f.read()
+        self.assertIn('ninja_required_version = 1.10\n', ninja)
+        self.assertIn(' dyndep = modprog@exe/depscan.dd\n', ninja)
+        self.build()
+        with open(os.path.join(self.builddir, 'modprog@exe', 'depscan.dd')) as f:
+            dyndep = f.read()
+        self.assertIn('build modprog@exe/stuff.f90.o | modprog@exe/circle.mod: dyndep\n', dyndep)
+        self.assertIn('build modprog@exe/prog.f90.o: dyndep | modprog@exe/circle.mod\n', dyndep)
+        self.assertBuildIsNoop()
+
+    def test_custom_target_capture_unchanged(self):
+        '''
+        Test that captured output is written without the serialized
+        executable wrapper and that the output is kept if it did not change.
+        '''
+        if self.backend is not Backend.ninja:
+            raise unittest.SkipTest('Capture script is only used by the Ninja backend')
+        testdir = os.path.join(self.common_test_dir, '114 custom target capture')
+        self.init(testdir)
+        with open(os.path.join(self.builddir, 'build.ninja')) as f:
+            ninja = f.read()
+        self.assertIn('--internal capture data.dat --', ninja)
+        self.assertNotIn('--internal exe', ninja)
+        self.build()
+        output = os.path.join(self.builddir, 'data.dat')
+        mtime = os.stat(output).st_mtime_ns
+        self.utime(os.path.join(testdir, 'data_source.txt'))
+        self.build()
+        self.assertEqual(os.stat(output).st_mtime_ns, mtime)
+        self.assertBuildIsNoop()
+
     def test_installed_modes(self):
         '''
         Test that files installed by these tests have the correct permissions.
@@ -4626,6 +5278,93 @@ class LinuxlikeTests(BasePlatformTests):
         self.run_tests()
         self.run_target('coverage-html')
 
+    def test_coverage_native(self):
+        '''
+        Test that the text and XML coverage reports are generated from the
+        output of gcov directly, and that gcov is only run again for the
+        objects that changed.
+        '''
+        if not mesonbuild.environment.detect_gcov():
+            raise unittest.SkipTest('gcov with JSON output not found')
+        if 'clang' in os.environ.get('CC', ''):
+            raise unittest.SkipTest('Coverage does not work with clang right now, help wanted!')
+        testdir = os.path.join(self.common_test_dir, '1 trivial')
+        self.init(testdir, ['-Db_coverage=true'])
+        self.build()
+        self.run_tests()
+        # Log the gcov invocations with a wrapper
+        wrapper = os.path.join(self.builddir, 'gcov-wrapper.sh')
+        gcov_log = os.path.join(self.builddir, 'gcov-calls.txt')
+        gcov = os.environ.get('GCOV', 'gcov')
+        with open(wrapper, 'w') as f:
+            f.write('#!/bin/sh\necho "$@" >> "{}"\nexec {} "$@"\n'.format(gcov_log, gcov))
+        os.chmod(wrapper, 0o755)
+
+        def gcov_runs():
+            if not os.path.exists(gcov_log):
+                return 0
+            with open(gcov_log) as f:
+                return sum(1 for l in f if '--json-format' in l)
+
+        with mock.patch.dict(os.environ, {'GCOV': wrapper}):
+            self.run_target('coverage-text')
+            self.assertEqual(gcov_runs(), 1)
+            with open(os.path.join(self.logdir, 'coverage.txt')) as f:
+                report = f.read()
+            self.assertRegex(report, r'trivial\.c\s+3\s+3\s+100%')
+            # Nothing changed, so the earlier gcov output is reused
+            self.run_target('coverage-xml')
+            self.assertEqual(gcov_runs(), 1)
+            root = ET.parse(os.path.join(self.logdir, 'coverage.xml')).getroot()
+            self.assertEqual(root.get('lines-valid'), '3')
+            self.assertEqual(root.get('lines-covered'), '3')
+            cls = root.find('packages/package/classes/class')
+            self.assertEqual(cls.get('filename'), 'trivial.c')
+            # Running the test again updates the data file
+            self.run_tests()
+            self.run_target('coverage-text')
+            self.assertEqual(gcov_runs(), 2)
+            # Objects that gcov failed on are not cached and tried again
+            self.run_tests()
+            with open(wrapper, 'w') as f:
+                f.write('#!/bin/sh\ncase "$1" in --json-format) echo "$@" >> "{}"; echo broken >&2; exit 1;; esac\n'
+                        'exec {} "$@"\n'.format(gcov_log, gcov))
+            self.run_target('coverage-text')
+            self.assertEqual(gcov_runs(), 3)
+            with open(wrapper, 'w') as f:
+                f.write('#!/bin/sh\necho "$@" >> "{}"\nexec {} "$@"\n'.format(gcov_log, gcov))
+            self.run_target('coverage-text')
+            self.assertEqual(gcov_runs(), 4)
+            with open(os.path.join(self.logdir, 'coverage.txt')) as f:
+                self.assertRegex(f.read(), r'trivial\.c\s+3\s+3\s+100%')
+
+    def test_coverage_native_branches(self):
+        '''
+        Test that the coverage reports generated from the output of gcov
+        include the branch coverage.
+        '''
+        if not mesonbuild.environment.detect_gcov():
+            raise unittest.SkipTest('gcov with JSON output not found')
+        if 'clang' in os.environ.get('CC', ''):
+            raise unittest.SkipTest('Coverage does not work with clang right now, help wanted!')
+        testdir = os.path.join(self.unit_test_dir, '57 coverage branches')
+        self.init(testdir, ['-Db_coverage=true'])
+        self.build()
+        self.run_tests()
+        self.run_target('coverage-xml')
+        root = ET.parse(os.path.join(self.logdir, 'coverage.xml')).getroot()
+        self.assertGreater(int(root.get('branches-valid')), 0)
+        self.assertGreater(int(root.get('branches-covered')), 0)
+        self.assertLess(float(root.get('branch-rate')), 1.0)
+        # The lcov tracefile for genhtml has the branches too
+        from mesonbuild.scripts import coverage
+        data = coverage.collect_coverage(mesonbuild.environment.detect_gcov(), testdir,
+                                         os.path.join(testdir, 'subprojects'), self.builddir, 1)
+        info = os.path.join(self.builddir, 'coverage.info')
+        coverage.write_lcov_info(data, info)
+        with open(info) as f:
+            self.assertIn('BRDA:', f.read())
+
     def test_cross_find_program(self):
         testdir = os.path.join(self.unit_test_dir, '11 cross prog')
         crossfile = tempfile.NamedTemporaryFile(mode='w')
@@ -5244,6 +5983,40 @@ class RewriterTests(BasePlatformTests):
         expected = {'name': 'something', 'sources': ['first.c', 'second.c']}
         self.assertDictEqual(list(out['target'].values())[0], expected)
 
+    def test_batch(self):
+        for d in ('a', 'b', 'c'):
+            copy_tree(os.path.join(self.rewrite_test_dir, '1 basic'), os.path.join(self.builddir, d))
+        info = [{'type': 'target', 'target': 'trivialprog1', 'operation': 'info'}]
+        jobs = [{'sourcedir': 'a', 'commands': info},
+                {'sourcedir': 'b', 'commands': os.path.join(self.builddir, 'b', 'addSrc.json')},
+                {'sourcedir': 'b', 'commands': info},
+                {'sourcedir': 'c', 'commands': os.path.join(self.builddir, 'c', 'addSrc.json')},
+                {'sourcedir': 'c', 'commands': [{'type': 'unknown'}]}]
+        jobfile = os.path.join(self.builddir, 'jobs.json')
+        with open(jobfile, 'w') as f:
+            f.write('\n'.join(json.dumps(j) for j in jobs))
+        p = subprocess.run(self.rewrite_command + ['--batch', jobfile], cwd=self.builddir,
+                           stdout=subprocess.PIPE, universal_newlines=True, timeout=60)
+        self.assertEqual(p.returncode, 1)
+        results = {}
+        for line in p.stdout.splitlines():
+            r = json.loads(line)
+            results[r['job']] = r
+        self.assertEqual(sorted(results), [0, 1, 2, 3, 4])
+        self.assertEqual(results[0]['info']['target']['trivialprog1@exe']['sources'], ['main.cpp', 'fileA.cpp'])
+        # Later jobs see the changes of earlier jobs on the same tree
+        self.assertEqual(results[2]['info']['target']['trivialprog1@exe']['sources'],
+                         ['main.cpp', 'fileA.cpp', 'a1.cpp', 'a2.cpp', 'a6.cpp'])
+        self.assertIsNone(results[3]['error'])
+        self.assertIn('unknown', results[4]['error'])
+        # Nothing is written to trees with a failed job
+        self.assertTrue(results[2]['written'])
+        self.assertFalse(results[3]['written'])
+        out = self.extract_test_data(self.rewrite(os.path.join(self.builddir, 'b'), json.dumps(info)))
+        self.assertEqual(out['target']['trivialprog1@exe']['sources'], ['main.cpp', 'fileA.cpp', 'a1.cpp', 'a2.cpp', 'a6.cpp'])
+        out = self.extract_test_data(self.rewrite(os.path.join(self.builddir, 'c'), json.dumps(info)))
+        self.assertEqual(out['target']['trivialprog1@exe']['sources'], ['main.cpp', 'fileA.cpp'])
+
     def test_kwargs_info(self):
         self.prime('3 kwargs')
         out = self.rewrite(self.builddir, os.path.join(self.builddir, 'info.json'))
@@ -0,0 +1,6 @@
+int f0(void);
+int f11(void);
+
+int main(void) {
+    return f0() + f11() == 11 ? 0 : 1;
+}
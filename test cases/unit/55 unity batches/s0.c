@@ -0,0 +1 @@
+int f0(void) { return 0; }
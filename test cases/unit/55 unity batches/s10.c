@@ -0,0 +1 @@
+int f10(void) { return 10; }
@@ -0,0 +1 @@
+int f11(void) { return 11; }
@@ -0,0 +1 @@
+int f6(void) { return 6; }
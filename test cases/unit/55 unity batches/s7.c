@@ -0,0 +1 @@
+int f7(void) { return 7; }
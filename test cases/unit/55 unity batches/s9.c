@@ -0,0 +1 @@
+int f9(void) { return 9; }
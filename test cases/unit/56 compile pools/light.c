@@ -0,0 +1,5 @@
+int glob_func(void);
+
+int main(void) {
+    return glob_func();
+}
@@ -0,0 +1,3 @@
+int glob_func(void) {
+    return 0;
+}
@@ -0,0 +1,7 @@
+int main(int argc, char **argv) {
+    (void)argv;
+    if (argc > 1) {
+        return 1;
+    }
+    return 0;
+}
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+# Copyright 2019 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Measures how long it takes to load the data files of a configured
+build directory, comparing loading the full objects with loading only
+the small project section of build.dat. Run it from the source root:
+
+tools/benchmark_datafiles.py path/to/builddir
+'''
+
+import os, sys, time, statistics, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mesonbuild import build, coredata
+
+def measure(func, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--repeats', type=int, default=20,
+                        help='Number of times to load each file.')
+    parser.add_argument('builddir')
+    options = parser.parse_args()
+    builddir = options.builddir
+
+    benchmarks = [
+        ('build.dat (full)', lambda: build.load(builddir)),
+        ('build.dat (project section)', lambda: build.load_project_info(builddir)),
+        ('coredata.dat (full)', lambda: coredata.load(builddir)),
+    ]
+    print('{:<32} {:>12} {:>12}'.format('File', 'min (ms)', 'median (ms)'))
+    for name, func in benchmarks:
+        times = measure(func, options.repeats)
+        print('{:<32} {:>12.3f} {:>12.3f}'.format(name, min(times) * 1000,
+                                                  statistics.median(times) * 1000))
+    for f in ('build.dat', 'coredata.dat'):
+        size = os.path.getsize(os.path.join(builddir, 'meson-private', f))
+        print('Size of {}: {} bytes'.format(f, size))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
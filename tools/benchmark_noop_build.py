@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# Copyright 2019 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Measures the latency of a build that has nothing to do in an already
+built build directory. For the Ninja backend this runs `ninja`, for the
+Visual Studio backends the regeneration check that MSBuild runs before
+every build. Run it from the source root:
+
+tools/benchmark_noop_build.py path/to/builddir
+'''
+
+import os, sys, time, statistics, argparse, subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mesonbuild import coredata
+from mesonbuild.environment import detect_ninja
+
+def measure(cmd, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.check_call(cmd, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--repeats', type=int, default=20,
+                        help='Number of no-op builds to run.')
+    parser.add_argument('builddir')
+    options = parser.parse_args()
+    builddir = os.path.abspath(options.builddir)
+    cdata = coredata.load(builddir)
+    backend = cdata.get_builtin_option('backend')
+
+    benchmarks = []
+    if backend == 'ninja':
+        ninja = detect_ninja()
+        # Make sure the first measured run does not do any work
+        subprocess.check_call([ninja, '-C', builddir], stdout=subprocess.DEVNULL)
+        benchmarks.append(('ninja', [ninja, '-C', builddir]))
+    private_dir = os.path.join(builddir, 'meson-private')
+    if os.path.exists(os.path.join(private_dir, 'regeninfo.json')):
+        benchmarks.append(('regencheck', cdata.meson_command +
+                           ['--internal', 'regencheck', private_dir]))
+    if not benchmarks:
+        print('Nothing to benchmark for the {} backend.'.format(backend))
+        return 1
+
+    print('{:<12} {:>12} {:>12}'.format('Command', 'min (ms)', 'median (ms)'))
+    for name, cmd in benchmarks:
+        times = measure(cmd, options.repeats)
+        print('{:<12} {:>12.3f} {:>12.3f}'.format(name, min(times) * 1000,
+                                                  statistics.median(times) * 1000))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
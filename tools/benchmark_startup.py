@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+# Copyright 2019 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Measures how long it takes to start Meson for commands that only do a
+little work, like the --internal helpers that Ninja runs for many build
+steps. The import time is taken from python -X importtime. Run it from
+the source root:
+
+tools/benchmark_startup.py
+'''
+
+import os, sys, time, statistics, argparse, subprocess, tempfile
+
+meson_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'meson.py')
+
+def measure(cmd, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.call(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+def import_time(cmd):
+    '''Returns the cumulative import time in seconds and the number of
+    mesonbuild modules imported by @cmd.'''
+    p = subprocess.run([sys.executable, '-X', 'importtime'] + cmd[1:],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                       universal_newlines=True)
+    total = 0
+    modules = 0
+    for line in p.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        cumulative = fields[1].strip()
+        # Skip the header
+        if not cumulative.isdigit():
+            continue
+        name = fields[2][1:]
+        if name.strip().startswith('mesonbuild'):
+            modules += 1
+        # Nested imports are included in the time of the top level ones
+        if not name.startswith(' '):
+            total += int(cumulative)
+    return total / 1e6, modules
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--repeats', type=int, default=20,
+                        help='Number of times to run each command.')
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        benchmarks = [
+            ('python', [sys.executable, '-c', 'pass']),
+            ('delsuffix', [sys.executable, meson_py, '--internal', 'delsuffix', tmpdir, '.none']),
+            ('capture', [sys.executable, meson_py, '--internal', 'capture',
+                         os.path.join(tmpdir, 'out'), '--', sys.executable, '-c', 'pass']),
+            ('--version', [sys.executable, meson_py, '--version']),
+        ]
+        print('{:<12} {:>12} {:>12} {:>12} {:>8}'.format('Command', 'min (ms)', 'median (ms)',
+                                                         'import (ms)', 'modules'))
+        for name, cmd in benchmarks:
+            times = measure(cmd, options.repeats)
+            imports, modules = import_time(cmd)
+            print('{:<12} {:>12.3f} {:>12.3f} {:>12.3f} {:>8}'.format(
+                name, min(times) * 1000, statistics.median(times) * 1000,
+                imports * 1000, modules))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# Copyright 2019 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Measures how long it takes to compute the transitive link dependencies
+of every target in a synthetic graph of static and shared libraries, the
+way the Ninja backend does when generating link rules. Run it from the
+source root:
+
+tools/benchmark_target_graph.py -n 5000
+'''
+
+import os, sys, time, random, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mesonbuild import build
+
+def make_library(cls, name, link_with):
+    # Only the attributes used by the target graph are needed
+    lib = cls.__new__(cls)
+    lib.name = name
+    lib.link_targets = link_with
+    lib.link_whole_targets = []
+    return lib
+
+def make_graph(count, fanout, window, shared_ratio):
+    rng = random.Random(count)
+    libs = []
+    for i in range(count):
+        candidates = libs[max(0, i - window):]
+        link_with = rng.sample(candidates, min(fanout, len(candidates)))
+        cls = build.SharedLibrary if rng.random() < shared_ratio else build.StaticLibrary
+        libs.append(make_library(cls, 'lib{}'.format(i), link_with))
+    return libs
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--libraries', type=int, default=5000,
+                        help='Number of libraries in the graph.')
+    parser.add_argument('--fanout', type=int, default=4,
+                        help='Number of libraries each library links to.')
+    parser.add_argument('--window', type=int, default=50,
+                        help='Libraries only link to one of the previous WINDOW libraries.')
+    parser.add_argument('--shared-ratio', type=float, default=0.1,
+                        help='Fraction of the libraries that are shared libraries.')
+    options = parser.parse_args()
+    libs = make_graph(options.libraries, options.fanout, options.window, options.shared_ratio)
+
+    print('{:<28} {:>12} {:>14}'.format('Query', 'time (ms)', 'total size'))
+    for name, query in [('get_dependencies()', lambda l: l.get_dependencies()),
+                        ('get_dependencies() cached', lambda l: l.get_dependencies()),
+                        ('get_transitive_link_deps()', lambda l: l.get_transitive_link_deps())]:
+        start = time.perf_counter()
+        size = sum(len(query(l)) for l in reversed(libs))
+        elapsed = time.perf_counter() - start
+        print('{:<28} {:>12.3f} {:>14}'.format(name, elapsed * 1000, size))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())